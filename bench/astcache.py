@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark loading cached ASTs against parsing.
+
+Every C file of the test corpus, the goto tests and pycparser's own test
+files, is preprocessed once with `CPreprocessor`, and then each text is parsed
+with `CParser` and its AST loaded back from the bytes `astcache.dumps` wrote
+for it. The fastest of `--repeat` passes over the corpus is kept for each.
+
+The run fails if any loaded AST generates different code than the parsed one,
+or if loading isn't at least `--min-speedup` times faster than parsing.
+"""
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, os.path.join(ROOT, "pycparser"))
+sys.path.insert(0, HERE)
+
+from pycparser import astcache, c_generator, c_parser
+from pycparser.c_preprocessor import CPreprocessor
+
+from preprocess import FAKE_LIBC, corpus
+
+def best(repeat, work, items):
+    """Return the fastest of `repeat` passes of `work` over `items`, and the
+    results from the last one."""
+    times = []
+    for i in range(repeat):
+        began = time.perf_counter()
+        results = [work(*item) for item in items]
+        times.append(time.perf_counter() - began)
+    return min(times), results
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-speedup", type=float, default=5.0,
+                        help="fail unless loading is this many times faster "
+                             "than parsing (default: 5)")
+    args = parser.parse_args()
+
+    preprocessor = CPreprocessor(["-I" + FAKE_LIBC])
+    texts = [(preprocessor.preprocess(name), name) for name in corpus()]
+    cparser = c_parser.CParser()
+    parse, asts = best(args.repeat, cparser.parse, texts)
+
+    data = [(astcache.dumps(ast),) for ast in asts]
+    load, loaded = best(args.repeat, astcache.loads, data)
+
+    generator = c_generator.CGenerator()
+    different = [name for (text, name), want, got in zip(texts, asts, loaded)
+                 if generator.visit(want) != generator.visit(got)]
+    size = sum(len(text) for text, name in texts)
+    cached = sum(len(d) for d, in data)
+    speedup = parse / load
+    print("files={} parse={:.4f} load={:.4f} speedup={:.1f}x "
+          "text={} cached={}".format(len(texts), parse, load, speedup, size,
+                                     cached))
+    for name in different:
+        print("DIFFERENT {}".format(os.path.relpath(name, ROOT)))
+    if speedup < args.min_speedup:
+        print("REGRESSION loading is only {:.1f}x faster than parsing"
+              .format(speedup))
+    return 1 if different or speedup < args.min_speedup else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark the goto elimination pipeline on synthetic C files.
+
+Each case generates a file with synth.py and times every stage of the
+pipeline separately: preprocessing with cpp, CParser.parse, GotoLabelFinder,
+do_it and CGenerator. Each stage is timed `--repeat` times and the fastest run
+is kept. The peak memory of the whole pipeline is measured with tracemalloc in
+a separate run, so that tracing doesn't skew the timings.
+
+Results are compared against baselines.json, and the run fails if any stage is
+more than `--tolerance` slower or larger than its baseline. Baselines depend on
+the machine, so rerun with --update after moving to a new one.
+
+Everything runs offline. If cpp isn't installed, preprocessing is skipped.
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[0:0] = [HERE, ROOT, os.path.join(ROOT, "pycparser")]
+
+import pycparser
+from pycparser import c_generator
+from pycparser.c_parser import CParser
+from pycparser.c_ast import FuncDef
+
+import parse
+import synth
+
+BASELINES = os.path.join(HERE, "baselines.json")
+
+# name: arguments to synth.generate_file
+CASES = {
+    "small": dict(functions=1, gotos=10, depth=2, length=50),
+    "deep": dict(functions=1, gotos=20, depth=8, length=100),
+    "long": dict(functions=1, gotos=50, depth=3, length=5000),
+    "loops": dict(functions=1, gotos=40, depth=4, length=400,
+                  mix={synth.LOOP: 1}),
+    "switches": dict(functions=1, gotos=40, depth=4, length=400,
+                     mix={synth.LOOP: 1, synth.IF: 1, synth.SWITCH: 4}),
+    "many": dict(functions=100, gotos=5, depth=3, length=40),
+}
+
+STAGES = ["preprocess", "parse", "find", "eliminate", "generate"]
+
+def goto_function_nodes(ast):
+    return [node for i, node in parse.goto_functions(ast)]
+
+def run_pipeline(path, cpp, parser, timings=None):
+    """Run every stage of the pipeline on `path` once. If `timings` is a
+    dictionary, the time of each stage is stored in it."""
+    def timed(stage, func, *args):
+        began = time.perf_counter()
+        result = func(*args)
+        if timings is not None:
+            timings[stage] = time.perf_counter() - began
+        return result
+
+    if cpp is not None:
+        text = timed("preprocess", pycparser.preprocess_file, path, cpp)
+    else:
+        with open(path) as f:
+            text = f.read()
+
+    ast = timed("parse", parser.parse, text, path)
+    functions = goto_function_nodes(ast)
+
+    def find():
+        for func in functions:
+            parse.GotoLabelFinder().visit(func)
+
+    def eliminate():
+        for func in functions:
+            parse.do_it(func)
+
+    timed("find", find)
+    timed("eliminate", eliminate)
+    return timed("generate", c_generator.CGenerator().visit, ast)
+
+def measure(path, cpp, parser, repeat):
+    """Return a dictionary of the fastest time of each stage, in seconds, and
+    the peak memory of the pipeline, in kilobytes."""
+    best = {}
+    for i in range(repeat):
+        timings = {}
+        run_pipeline(path, cpp, parser, timings)
+        for stage, seconds in timings.items():
+            best[stage] = min(seconds, best.get(stage, seconds))
+
+    tracemalloc.start()
+    run_pipeline(path, cpp, parser)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best["peak_kb"] = peak / 1024.0
+    return best
+
+def compare(results, baselines, tolerance):
+    """Return a list of messages for every measurement that regressed."""
+    regressions = []
+    for case, measured in sorted(results.items()):
+        baseline = baselines.get(case, {})
+        for key, value in sorted(measured.items()):
+            if key not in baseline:
+                continue
+
+            # A little absolute slack keeps tiny timings from being flaky.
+            slack = 0.002 if key != "peak_kb" else 64
+            limit = baseline[key] * (1 + tolerance) + slack
+            if value > limit:
+                regressions.append("{} {}: {:.4f} > {:.4f} (baseline {:.4f})"
+                                   .format(case, key, value, limit, baseline[key]))
+
+    return regressions
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("cases", nargs="*", default=sorted(CASES),
+                        help="cases to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed slowdown over the baseline, as a "
+                             "fraction (default: 0.5)")
+    parser.add_argument("--update", action="store_true",
+                        help="store the results as the new baselines")
+    parser.add_argument("--baselines", default=BASELINES)
+    args = parser.parse_args()
+
+    unknown = [case for case in args.cases if case not in CASES]
+    if unknown:
+        parser.error("unknown cases: {}".format(", ".join(unknown)))
+
+    cpp = shutil.which("cpp")
+    if cpp is None:
+        sys.stderr.write("cpp not found, skipping preprocessing\n")
+
+    c_parser = CParser()
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="gbg-bench-")
+    try:
+        for case in args.cases:
+            path = os.path.join(workdir, case + ".c")
+            with open(path, "w") as f:
+                f.write(synth.generate_file(**CASES[case]))
+
+            results[case] = measure(path, cpp, c_parser, args.repeat)
+            row = " ".join("{}={:.4f}".format(stage, results[case][stage])
+                           for stage in STAGES if stage in results[case])
+            print("{:10} {} peak_kb={:.0f}".format(case, row,
+                                                   results[case]["peak_kb"]))
+    finally:
+        shutil.rmtree(workdir)
+
+    if args.update:
+        baselines = {}
+        if os.path.exists(args.baselines):
+            with open(args.baselines) as f:
+                baselines = json.load(f)
+
+        baselines.update(results)
+        with open(args.baselines, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        return 0
+
+    if not os.path.exists(args.baselines):
+        sys.stderr.write("no baselines at {}; run with --update\n".format(args.baselines))
+        return 0
+
+    with open(args.baselines) as f:
+        baselines = json.load(f)
+
+    regressions = compare(results, baselines, args.tolerance)
+    for message in regressions:
+        print("REGRESSION " + message)
+
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark pycparser's in-process preprocessor against the system cpp.
+
+Every C file of the test corpus, the goto tests and pycparser's own test
+files, is preprocessed with fake_libc_include on the include path, first by
+running cpp on each file and then by one `CPreprocessor`, which reads each
+header once and reuses it for the later files. The fastest of `--repeat`
+passes over the corpus is kept for each.
+
+Both outputs of every file are parsed and regenerated as C, and the run fails
+if any file comes out differently, since a fast preprocessor that changes the
+program is no use.
+"""
+import glob
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, os.path.join(ROOT, "pycparser"))
+
+import pycparser
+from pycparser import c_generator, c_parser
+from pycparser.c_preprocessor import CPreprocessor
+
+FAKE_LIBC = os.path.join(ROOT, "pycparser", "utils", "fake_libc_include")
+
+# Files that test pycparser on the quirks of cpp on Windows: an include with
+# backslashes, and the output of cpp with Windows linemarkers.
+SKIP = {"simplemain.c", "cppd_with_stdio_h.c"}
+
+def corpus():
+    """Return the C files to preprocess."""
+    files = (sorted(glob.glob(os.path.join(ROOT, "tests", "*.c"))) +
+             sorted(glob.glob(os.path.join(ROOT, "pycparser", "tests",
+                                           "c_files", "*.c"))))
+    return [name for name in files if os.path.basename(name) not in SKIP]
+
+def best(repeat, preprocess, files):
+    """Return the fastest of `repeat` passes of `preprocess` over `files`,
+    and the texts from the last one."""
+    times = []
+    for i in range(repeat):
+        began = time.perf_counter()
+        texts = [preprocess(name) for name in files]
+        times.append(time.perf_counter() - began)
+    return min(times), texts
+
+def regenerate(text, filename):
+    ast = c_parser.CParser().parse(text, filename)
+    return c_generator.CGenerator().visit(ast)
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    files = corpus()
+    cpp_args = ["-I" + FAKE_LIBC]
+    system, expected = best(
+        args.repeat,
+        lambda name: pycparser.preprocess_file(name, "cpp", cpp_args),
+        files)
+    preprocessor = CPreprocessor(cpp_args)
+    builtin, texts = best(args.repeat, preprocessor.preprocess, files)
+
+    different = [name for name, want, got in zip(files, expected, texts)
+                 if regenerate(want, name) != regenerate(got, name)]
+    print("files={} cpp={:.4f} builtin={:.4f} speedup={:.1f}x".format(
+        len(files), system, builtin, system / builtin))
+    for name in different:
+        print("DIFFERENT {}".format(os.path.relpath(name, ROOT)))
+    return 1 if different else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
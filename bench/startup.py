@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark how long a new process takes to build a CParser.
+
+Each run starts a fresh interpreter that imports pycparser and constructs a
+CParser with the table cache turned on, and reports the time that took. The cold run starts from an empty
+table cache, so the lexer and parser tables are generated and cached; the warm
+runs then reuse them, as every later process would. The fastest warm run is
+kept.
+
+The run fails if the warm start isn't at least `--min-speedup` times faster
+than the cold one, which would mean the cached tables aren't being used.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+# Run in the child process; prints the seconds spent importing pycparser and
+# building the parser.
+CHILD = """
+import sys, time
+began = time.perf_counter()
+sys.path.insert(0, {path!r})
+import pycparser
+pycparser.CParser(tabcache=True)
+print(time.perf_counter() - began)
+"""
+
+def start(cache):
+    """Return the seconds a new process took to build a CParser, with its
+    tables cached in `cache`."""
+    env = dict(os.environ, PYCPARSER_CACHE_DIR=cache)
+    code = CHILD.format(path=os.path.join(ROOT, "pycparser"))
+    output = subprocess.check_output([sys.executable, "-c", code], env=env,
+                                     cwd=cache)
+    return float(output)
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-speedup", type=float, default=2.0,
+                        help="fail unless a warm start is this many times "
+                             "faster than a cold one (default: 2)")
+    args = parser.parse_args()
+
+    cache = tempfile.mkdtemp(prefix="gbg-startup-")
+    try:
+        cold = start(cache)
+        warm = min(start(cache) for i in range(args.repeat))
+    finally:
+        shutil.rmtree(cache)
+
+    speedup = cold / warm
+    print("cold={:.4f} warm={:.4f} speedup={:.1f}x".format(cold, warm, speedup))
+    if speedup < args.min_speedup:
+        print("REGRESSION warm start is only {:.1f}x faster than cold"
+              .format(speedup))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Generate synthetic C functions full of gotos for benchmarking.
+
+Every goto gets its own label and is placed in one of three patterns that the
+elimination supports:
+
+    backward: the label comes first, and the goto is nested `depth` statements
+              deep after it.
+    forward:  the goto is nested `depth` statements deep, and the label comes
+              after the nesting.
+    inward:   the goto comes first, and the label is inside of a following
+              loop or if-statement.
+
+The nesting is a random mix of loops, if-statements and switch statements,
+weighted by `mix`. Switch statements are only used as the innermost level,
+since gotos can only be moved out of a switch when they're directly in a case.
+"""
+import random
+
+LOOP, IF, SWITCH = "loop", "if", "switch"
+
+class FunctionGenerator(object):
+    """Generator for the source of one C function.
+
+    :gotos: How many goto/label pairs the function has.
+    :depth: The deepest a goto or label is nested.
+    :mix: A dictionary of weights for LOOP, IF and SWITCH nesting.
+    :length: How many filler statements the function has, spread out between
+             the gotos.
+    :rng: A random.Random, so functions can be reproduced.
+    """
+
+    def __init__(self, gotos, depth, mix, length, rng):
+        self.gotos = gotos
+        self.depth = depth
+        self.mix = mix
+        self.length = length
+        self.rng = rng
+        self.lines = []
+        self.indent = 1
+        self.filler_left = length
+        self.counter = 0
+
+    def emit(self, line):
+        self.lines.append("    " * self.indent + line)
+
+    def filler(self, count=None):
+        if count is None:
+            # Spread the filler out evenly, with some noise.
+            average = self.length // max(1, self.gotos * 3)
+            count = self.rng.randint(0, 2 * average + 1)
+
+        count = min(count, self.filler_left)
+        for i in range(count):
+            self.counter += 1
+            if self.counter % 3 == 0:
+                self.emit("x = x + {};".format(self.counter))
+            else:
+                self.emit("foo({});".format(self.counter))
+
+        self.filler_left -= count
+
+    def pick_kind(self, innermost):
+        kinds = [LOOP, IF] + ([SWITCH] if innermost else [])
+        weights = [self.mix.get(kind, 0) for kind in kinds]
+        if sum(weights) == 0:
+            return LOOP
+
+        return self.rng.choices(kinds, weights)[0]
+
+    def open(self, kind):
+        """Open a statement of the given kind, and return what close() needs to
+        close it."""
+        n = self.rng.randint(1, 100)
+        form = kind
+        if kind == SWITCH:
+            self.emit("switch (x) {")
+            self.emit("case {}:".format(n))
+        elif kind == IF:
+            self.emit("if (x > {}) {{".format(n))
+        else:
+            form = self.rng.choice(["while", "for", "do"])
+            if form == "while":
+                self.emit("while (x < {}) {{".format(n))
+            elif form == "for":
+                self.emit("for (int k{0} = 0; k{0} < {1}; ++k{0}) {{".format(self.counter, n))
+            else:
+                self.emit("do {")
+
+        self.indent += 1
+        return form, n
+
+    def close(self, opened):
+        form, n = opened
+        if form == SWITCH:
+            self.emit("break;")
+
+        self.indent -= 1
+        if form == SWITCH:
+            self.emit("default:")
+            self.emit("    break;")
+            self.emit("}")
+        elif form == "do":
+            self.emit("}} while (x < {});".format(n))
+        else:
+            self.emit("}")
+
+    def nested_goto(self, label):
+        """Emit `if (jump()) goto label;` nested up to self.depth deep."""
+        depth = self.rng.randint(1, self.depth)
+        stack = []
+        for level in range(depth):
+            kind = self.pick_kind(level == depth - 1)
+            stack.append(self.open(kind))
+            self.filler(1)
+
+        self.emit("if (jump()) goto {};".format(label))
+        self.filler(1)
+
+        while stack:
+            self.close(stack.pop())
+
+    def generate(self, name):
+        self.lines = ["int {}(int x)".format(name), "{"]
+
+        for i in range(self.gotos):
+            label = "L{}".format(i)
+            pattern = self.rng.choice(["backward", "forward", "inward"])
+            self.filler()
+
+            if pattern == "backward":
+                self.emit("{}:".format(label))
+                self.emit("    foo(-{});".format(i))
+                self.filler()
+                self.nested_goto(label)
+            elif pattern == "forward":
+                self.nested_goto(label)
+                self.filler()
+                self.emit("{}:".format(label))
+                self.emit("    foo(-{});".format(i))
+            else:
+                self.emit("if (jump()) goto {};".format(label))
+                self.filler()
+                opened = self.open(self.rng.choice([LOOP, IF]))
+                self.filler(1)
+                self.emit("{}:".format(label))
+                self.emit("    foo(-{});".format(i))
+                self.filler(1)
+                self.close(opened)
+
+        self.filler(self.filler_left)
+        self.emit("return x;")
+        self.lines.append("}")
+        return "\n".join(self.lines) + "\n"
+
+def generate_file(functions=1, gotos=10, depth=3, mix=None, length=100,
+                  seed=0):
+    """Return the source of a C file with `functions` generated functions.
+    The other arguments are passed to FunctionGenerator for each function.
+    """
+    if mix is None:
+        mix = {LOOP: 1, IF: 1, SWITCH: 1}
+
+    rng = random.Random(seed)
+    parts = ["int jump(void);", "void foo(int);", ""]
+    for i in range(functions):
+        generator = FunctionGenerator(gotos, depth, mix, length, rng)
+        parts.append(generator.generate("f{}".format(i)))
+
+    return "\n".join(parts)
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Generate a C file full of "
+                                        "gotos for benchmarking.")
+    parser.add_argument("--functions", type=int, default=1)
+    parser.add_argument("--gotos", type=int, default=10)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--length", type=int, default=100,
+                        help="filler statements per function")
+    parser.add_argument("--mix", default="1,1,1",
+                        help="loop,if,switch nesting weights")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    weights = [float(w) for w in args.mix.split(",")]
+    mix = dict(zip([LOOP, IF, SWITCH], weights))
+    sys.stdout.write(generate_file(args.functions, args.gotos, args.depth, mix,
+                                   args.length, args.seed))
@@ -1,5 +1,12 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import io
+import json
+import pickle
+import heapq
+import time
+from collections import Counter, OrderedDict, deque
+
 import pycparser
 from pycparser.c_ast import *
 from pycparser import c_generator
@@ -11,24 +18,6 @@ def get_function(ast, name):
 
     return None
 
-def pair_goto_labels(labels, conditional_gotos):
-    """Return a dictionary of (label, [goto_partners]) pairs.
-    The dictionary's keys are label names, and the values are
-    lists of If nodes containing whose goto statements targets are the label.
-    """
-    label_dict = {}
-
-    for label in labels:
-        label_dict[label.name] = []
-
-        for cond in conditional_gotos:
-            goto = cond.iftrue
-            target = goto.name
-            if target == label.name:
-                label_dict[label.name].append(cond)
-
-    return label_dict
-
 def is_conditional_goto(node):
     """
     Return if `node` is a conditional whose only branch is a goto statement.
@@ -36,62 +25,433 @@ def is_conditional_goto(node):
     return (type(node) == If and type(node.iftrue) == Goto and
                 node.iffalse == None)
 
-def update_parents(compound):
+class ParentMap(object):
+    """Map from every node to the node directly above it.
+
+    Nodes don't define equality, so they hash by identity and can be used as
+    keys directly. Each node stores only its parent, so looking up the parent is
+    O(1), walking up to the root is O(depth), and moving a statement is a
+    single assignment. This replaces keeping a copy of the whole parent stack
+    on every node, which had to be fixed up by hand after each transformation.
     """
-    Set node.parents[-1] = compound for every node in compound.block_items.
-    make sure their parent is `compound`.
-    Normally used after a transformation.
+
+    def __init__(self):
+        self._parents = {}
+
+    def parent(self, node):
+        """Return the node directly above `node`, or None for the root."""
+        return self._parents.get(node)
+
+    def set_parent(self, node, parent):
+        """Record that `node` now sits directly under `parent`."""
+        self._parents[node] = parent
+
+    def adopt(self, parent, children):
+        """Set the parent of every node in `children` to `parent`."""
+        for child in children:
+            self._parents[child] = parent
+
+    def ancestors(self, node):
+        """Yield the nodes above `node`, nearest first."""
+        node = self._parents.get(node)
+        while node is not None:
+            yield node
+            node = self._parents.get(node)
+
+    def lineage(self, node, count):
+        """Return a list of the `count` nearest ancestors of `node`, ordered
+        from the outermost to the parent. If `node` has fewer than `count`
+        ancestors, the list is shorter.
+        """
+        above = []
+        for ancestor in self.ancestors(node):
+            above.append(ancestor)
+            if len(above) == count:
+                break
+
+        above.reverse()
+        return above
+
+    def is_ancestor(self, ancestor, node):
+        """Return if `ancestor` is somewhere above `node`."""
+        return any(above is ancestor for above in self.ancestors(node))
+
+class IndexedBlock(object):
+    """A sequence of statements that can be looked up and spliced cheaply.
+
+    The statements are kept in a doubly linked list keyed by node, so
+    inserting, replacing and cutting out a range only touch the statements
+    involved. Each statement also gets an integer order key, spaced out so new
+    statements can usually be given a key between their neighbors. Comparing
+    the positions of two statements is then O(1); when there is no room left
+    between two keys, the whole block is renumbered.
     """
 
-    if type(compound) == Compound:
-        for node in compound.block_items:
-            if "parents" in node.__dict__:
-                node.parents[-1] = compound
-            else:
-                node.parents = [compound]
-    elif type(compound) == Case:
-        for node in compound.stmts:
-            if "parents" in node.__dict__:
-                node.parents[-1] = compound
-            else:
-                node.parents = [compound]
+    GAP = 1 << 16
+
+    def __init__(self, stmts=()):
+        self._next = {}
+        self._prev = {}
+        self._key = {}
+        self._first = None
+        self._last = None
+        # How many times the keys were renumbered.
+        self.renumbered = 0
+
+        for stmt in stmts:
+            self.insert_after(self._last, stmt)
+
+    def __len__(self):
+        return len(self._key)
+
+    def __contains__(self, node):
+        return node in self._key
+
+    def __iter__(self):
+        node = self._first
+        while node is not None:
+            yield node
+            node = self._next[node]
+
+    def to_list(self):
+        return list(self)
+
+    def key(self, node):
+        """Return the order key of `node`. Keys only mean something when
+        compared with other keys of the same block."""
+        return self._key[node]
+
+    def precedes(self, one, two):
+        """Return if statement `one` comes before statement `two`."""
+        return self._key[one] < self._key[two]
+
+    def between(self, first, last):
+        """Yield the statements strictly between `first` and `last`."""
+        node = self._next[first]
+        while node is not last:
+            yield node
+            node = self._next[node]
+
+    def insert_after(self, anchor, node):
+        """Insert `node` right after `anchor`, or first if `anchor` is None."""
+        assert(node not in self._key)
+        if anchor is None:
+            prev, following = None, self._first
+        else:
+            prev, following = anchor, self._next[anchor]
+
+        self._link(prev, node, following)
+
+    def insert_before(self, anchor, node):
+        """Insert `node` right before `anchor`, or last if `anchor` is None."""
+        if anchor is None:
+            self.insert_after(self._last, node)
+        else:
+            self.insert_after(self._prev[anchor], node)
+
+    def append(self, node):
+        self.insert_after(self._last, node)
+
+    def replace(self, old, new):
+        """Put `new` where `old` is, and drop `old` from the block."""
+        assert(new not in self._key)
+        prev, following = self._prev[old], self._next[old]
+        key = self._key[old]
+        self._forget(old)
+        self._link(prev, new, following, key)
+
+    def remove(self, node):
+        prev, following = self._prev[node], self._next[node]
+        self._forget(node)
+
+        if prev is None:
+            self._first = following
+        else:
+            self._next[prev] = following
+
+        if following is None:
+            self._last = prev
+        else:
+            self._prev[following] = prev
+
+    def cut_between(self, first, last):
+        """Remove the statements strictly between `first` and `last` and
+        return them in order. A None `first` means from the start of the block,
+        and a None `last` means to the end of it.
+        """
+        node = self._first if first is None else self._next[first]
+        cut = []
+        while node is not last:
+            cut.append(node)
+            following = self._next[node]
+            self._forget(node)
+            node = following
+
+        if first is None:
+            self._first = last
+        else:
+            self._next[first] = last
+
+        if last is None:
+            self._last = first
+        else:
+            self._prev[last] = first
+
+        return cut
+
+    def _forget(self, node):
+        del self._next[node]
+        del self._prev[node]
+        del self._key[node]
+
+    def _link(self, prev, node, following, key=None):
+        if key is None:
+            key = self._key_between(prev, following)
+            if key is None:
+                self._renumber()
+                key = self._key_between(prev, following)
+
+        self._prev[node] = prev
+        self._next[node] = following
+        self._key[node] = key
+
+        if prev is None:
+            self._first = node
+        else:
+            self._next[prev] = node
+
+        if following is None:
+            self._last = node
+        else:
+            self._prev[following] = node
+
+    def _key_between(self, prev, following):
+        """Return an unused key between the keys of `prev` and `following`,
+        or None if there isn't one."""
+        if prev is None and following is None:
+            return 0
+        elif prev is None:
+            return self._key[following] - self.GAP
+        elif following is None:
+            return self._key[prev] + self.GAP
+
+        low, high = self._key[prev], self._key[following]
+        if high - low < 2:
+            return None
+
+        return (low + high) // 2
+
+    def _renumber(self):
+        self.renumbered += 1
+        for i, node in enumerate(self):
+            self._key[node] = i * self.GAP
+
+class Positions(object):
+    """The offset and level of every goto and label in a function.
+
+    The offset orders the gotos and labels as they appear in the program, and
+    the level counts how deeply each one is nested. Both change whenever a goto
+    is moved or statements are wrapped in a new guard. To keep them up to date
+    without walking the function again, the gotos and labels are kept in one
+    IndexedBlock along with markers for where each statement that can hold
+    them starts and ends. A move then only touches the goto being moved, and
+    wrapping statements only touches the gotos and labels inside of them.
+
+    Gotos are tracked by their Goto node, not by the conditional around them.
+    """
+
+    REGIONS = [If, While, DoWhile, For, Switch, Compound, Case, Default]
+    LEVELERS = [If, While, DoWhile, Switch, For]
+
+    def __init__(self):
+        self._order = IndexedBlock()
+        self._starts = {}
+        self._ends = {}
+        self._levels = {}
+        # If this is a list, wrap() adds every goto and label it nests one
+        # level deeper to it.
+        self.deepened = None
+
+    def start(self, node):
+        """Mark the start of `node` at the end of the current order."""
+        marker = (node, "start")
+        self._starts[node] = marker
+        self._order.append(marker)
+
+    def end(self, node):
+        """Mark the end of `node` at the end of the current order."""
+        marker = (node, "end")
+        self._ends[node] = marker
+        self._order.append(marker)
+
+    def add(self, node, level):
+        """Add a goto or label at the end of the current order."""
+        self._order.append(node)
+        self._levels[node] = level
+
+    def start_of(self, node):
+        return self._starts[node]
+
+    def end_of(self, node):
+        return self._ends[node]
+
+    def offset(self, node):
+        """Return the offset of a goto or label. Offsets aren't consecutive,
+        but they always compare in program order."""
+        return self._order.key(node)
+
+    def level(self, node):
+        return self._levels[node]
+
+    def distance(self, one, two):
+        """Return how far apart two gotos or labels are, counted in gotos,
+        labels and statement boundaries. This is exact until statements are
+        moved between them, and an estimate afterwards."""
+        return abs(self._order.key(one) - self._order.key(two)) / IndexedBlock.GAP
+
+    def precedes(self, one, two):
+        return self._order.precedes(one, two)
+
+    def renumbered(self):
+        """Return how many times the offsets were renumbered. Otherwise, the
+        offset of a goto or label only changes when it moves."""
+        return self._order.renumbered
+
+    def move_out(self, goto, stmt):
+        """Update `goto` after it was moved out of `stmt` to right after it."""
+        self._order.remove(goto)
+        self._order.insert_after(self._ends[stmt], goto)
+        self._levels[goto] -= 1
+
+    def move_in(self, goto, owner):
+        """Update `goto` after it was moved to the front of the statements of
+        `owner`, a statement one level below where it was."""
+        self._order.remove(goto)
+        self._order.insert_after(self._starts[owner], goto)
+        self._levels[goto] += 1
+
+    def wrap(self, stmt, compound, after, before):
+        """Update the statements between `after` and `before` after they were
+        wrapped in `compound`, the body of the new statement `stmt`.
+        `after` and `before` are gotos, labels or markers.
+        """
+        for node in [stmt, compound]:
+            self._starts[node] = (node, "start")
+            self._ends[node] = (node, "end")
+
+        self._order.insert_after(after, self._starts[stmt])
+        self._order.insert_after(self._starts[stmt], self._starts[compound])
+        self._order.insert_before(before, self._ends[compound])
+        self._order.insert_before(before, self._ends[stmt])
+
+        if type(stmt) in self.LEVELERS:
+            for node in self._order.between(self._starts[compound], self._ends[compound]):
+                if node in self._levels:
+                    self._levels[node] += 1
+                    if self.deepened is not None:
+                        self.deepened.append(node)
+
+    def forget(self, node):
+        """Stop tracking a goto that was eliminated."""
+        self._order.remove(node)
+        del self._levels[node]
+
+class BlockIndex(object):
+    """The IndexedBlock for every Compound, Case and Default touched during an
+    elimination.
+
+    Blocks are built from the statement list of their owner the first time
+    they're asked for. While the elimination runs the blocks are the real
+    statement lists, so the lists on the owners are stale until flush() writes
+    the blocks back.
+    """
+
+    def __init__(self):
+        self._blocks = {}
+
+    def block(self, owner):
+        """Return the IndexedBlock holding the statements of `owner`."""
+        block = self._blocks.get(owner)
+        if block is None:
+            block = IndexedBlock(getattr(owner, statements_attr(owner)) or [])
+            self._blocks[owner] = block
+
+        return block
+
+    def flush(self):
+        """Store every block back on its owner as a plain list."""
+        for owner, block in self._blocks.items():
+            setattr(owner, statements_attr(owner), block.to_list())
+
+class Prologue(object):
+    """The declarations added to the top of a function during an elimination.
+
+    Declarations are collected as they're needed and emitted once, in the order
+    they were first added, when the elimination is done. A second declaration
+    of a name that's already declared is dropped.
+    """
+
+    def __init__(self):
+        self._decls = OrderedDict()
+
+    def __len__(self):
+        return len(self._decls)
+
+    def add(self, decl):
+        if decl.name not in self._decls:
+            self._decls[decl.name] = decl
 
-def remove_siblings(label, conditional):
+    def emit(self, blocks, function):
+        """Put every collected declaration at the top of `function`."""
+        body = blocks.block(function.body)
+        previous = None
+        for decl in self._decls.values():
+            body.insert_after(previous, decl)
+            previous = decl
+
+        self._decls.clear()
+
+def statements_attr(owner):
+    """Return the name of the attribute holding the statements of `owner`."""
+    if type(owner) == Compound:
+        return "block_items"
+    elif type(owner) in [Case, Default]:
+        return "stmts"
+
+    raise ValueError("{} does not hold a list of statements!".format(type(owner).__name__))
+
+def remove_siblings(parents, blocks, positions, label, conditional):
     """Remove a conditional goto/label node pair that are siblings.
-    Parents need to be updated after the removal, and this function does that."""
-    assert(are_siblings(label, conditional))
-
-    parent = label.parents[-1]
-    parent_list = []
-    attr_name = ""
-
-    if type(parent) == Case:
-        attr_name = "stmts"
-        parent_list = parent.stmts
-    elif type(parent) == Compound:
-        attr_name = "block_items"
-        parent_list = parent.block_items
-    else:
+    Parents need to be updated after the removal, and this function does that.
+
+    Returns the guard or do-while loop that replaced the conditional."""
+    assert(are_siblings(parents, label, conditional))
+
+    parent = parents.parent(label)
+
+    if type(parent) not in [Case, Compound]:
         raise ValueError("got parents for removal that weren't compound or cases!")
 
-    label_index = parent_list.index(label)
-    cond_index = parent_list.index(conditional)
+    block = blocks.block(parent)
 
-    assert(label_index >= 0 and cond_index >= 0)
-    assert(label_index != cond_index)
+    assert(label in block and conditional in block)
+    assert(label is not conditional)
 
-    if label_index > cond_index:
+    if block.precedes(conditional, label):
         # Goto is before the label.
         # In this case, we guard the statements from the goto to the label in a
         # new conditional.
         cond = negate(conditional.cond)
-        in_between = parent_list[cond_index+1:label_index]
+        in_between = block.cut_between(conditional, label)
         between_compound = Compound(in_between)
-        update_parents(between_compound)
+        parents.adopt(between_compound, in_between)
         guard = If(cond, between_compound, None)
-        pre_goto = parent_list[:cond_index]
-        post_conditional = parent_list[label_index:]
-        setattr(parent, attr_name, pre_goto + [guard] + post_conditional)
+        parents.set_parent(between_compound, guard)
+        parents.set_parent(guard, parent)
+        block.replace(conditional, guard)
+        positions.wrap(guard, between_compound, conditional.iftrue, label)
+        positions.forget(conditional.iftrue)
+        return guard
     else:
         # Goto is after the label (or the goto _is_ the label, which means
         # something has gone terribly wrong).
@@ -99,18 +459,27 @@ def remove_siblings(label, conditional):
         # will execute the statements as long as we're jumping.
         # We will _not_ grab the statement from the label, because at this point
         # every label contains a statement that clears its logical variable.
+        # That only runs once, though, so if the goto was moved here and jumps
+        # on its logical variable, the loop has to clear it again each time
+        # around; otherwise a pass that doesn't reach the assignment of the
+        # variable would jump again.
         cond = conditional.cond
-        between_statements = parent_list[label_index+1:cond_index]
+        between_statements = block.cut_between(label, conditional)
+        name = logical_label_name(label)
+        if type(cond) == ID and cond.name == name:
+            between_statements.insert(0, create_assign(name, Constant("int", "0")))
         between_compound = Compound(between_statements)
-        update_parents(between_compound)
+        parents.adopt(between_compound, between_statements)
         do_while = DoWhile(cond, between_compound)
-        pre_to_label = parent_list[:label_index+1]
-        after_goto = parent_list[cond_index+1:]
-        setattr(parent, attr_name, pre_to_label + [do_while] + after_goto)
-
-def are_directly_related(one, two):
+        parents.set_parent(between_compound, do_while)
+        parents.set_parent(do_while, parent)
+        block.replace(conditional, do_while)
+        positions.wrap(do_while, between_compound, label, conditional.iftrue)
+        positions.forget(conditional.iftrue)
+        return do_while
+
+def are_directly_related(parents, one, two):
     """Check if two nodes are directly related.
-    If they don't have parents, this should raise an AttributeError.
 
     Two nodes are siblings iff there exists some sequence of statements such that
     one is present in one, and the other is either present or nested inside of
@@ -120,23 +489,21 @@ def are_directly_related(one, two):
 
     The check is this:
         - At least one has a Compound parent.
-        - The other has that same compound parent somewhere in its parent
-          stack.
+        - The other has that same compound parent somewhere above it.
     """
-    parent_one = one.parents[-1]
-    parent_two = two.parents[-1]
-    if type(parent_one) == Compound and parent_one in two.parents:
+    parent_one = parents.parent(one)
+    parent_two = parents.parent(two)
+    if type(parent_one) == Compound and parents.is_ancestor(parent_one, two):
         # `two` exists in or is nested in the compound that `one` is in.
         return True
-    elif type(parent_two) == Compound and parent_two in one.parents:
+    elif type(parent_two) == Compound and parents.is_ancestor(parent_two, one):
         # `one` exists in or is nested in the compound that `two` is in.
         return True
 
     return False
 
-def are_siblings(one, two):
-    """Check if two nodes with parents are siblings.
-    If they don't have parents, this should raise an AttributeError.
+def are_siblings(parents, one, two):
+    """Check if two nodes are siblings.
 
     They are siblings iff they both exist unnested in a sequence of
     statements. Currently, this is checked by looking to see if
@@ -145,150 +512,155 @@ def are_siblings(one, two):
     I justify this by saying that there can't be any sequence of statements if
     they aren't inside of a Compound.
     """
-    one_parent = one.parents[-1]
-    two_parent = two.parents[-1]
+    one_parent = parents.parent(one)
+    two_parent = parents.parent(two)
 
     under_compound = (type(one_parent) == Compound and
                         type(two_parent) == Compound)
     under_case = (type(one_parent) == Case and
                         type(two_parent) == Case)
 
-    return (under_compound or under_case) and one_parent == two_parent
+    return (under_compound or under_case) and one_parent is two_parent
+
+class GotoLabelFinder(object):
+    """Finds every goto or label under a given node.
+
+    The results will be two lists of Nodes, self.gotos and self.labels. The
+    self.gotos list is actually a list of If Nodes. This isn't so strange, as
+    we're treating the conditional and goto as one unit.
 
-class GotoLabelFinder(NodeVisitor):
-    """Visitor that will find every goto or label under a given node.
+    Every node visited is recorded in self.parent_map, a ParentMap. The offset
+    and level of each label and goto are kept in self.positions, a Positions.
 
-    The results will be two lists of Nodes, self.gotos and self.labels,
-    complete with the offset, level, and parent stack monkey patched on for
-    each.  The self.gotos list is actually a list of If Nodes, with the offset,
-    level, and parent stack of the If. This isn't so strange, as we're treating
-    the conditional and goto as one unit.
+    The gotos are also paired with their labels during the same traversal.
+    self.targets is a dictionary of (label name, [conditionals]) pairs, where
+    the conditionals are the If nodes whose gotos jump to that label. Every
+    label has an entry, even if nothing jumps to it.
+
+    visit() walks the tree with c_ast.walk, so deep nesting doesn't recurse.
     """
 
     def __init__(self):
-        self.offset = 0
         self.level = 0
         self.gotos = []
         self.labels = []
-        self.parents = []
-
-    def level_visit(self, node):
-        node.parents = list(self.parents)
-        self.level += 1
-        self.generic_visit(node)
-        self.level -= 1
-
-    def generic_visit(self, node):
-        self.parents.append(node)
-        for access, child in node.children():
-            self.visit(child)
+        self.parent_map = ParentMap()
+        self.positions = Positions()
+        self.targets = {}
+        self.label_names = set()
+
+    def dangling_gotos(self):
+        """Return the conditionals whose goto targets a label that wasn't
+        found."""
+        return [cond for name, conds in self.targets.items()
+                    if name not in self.label_names
+                    for cond in conds]
+
+    def unused_labels(self):
+        """Return the labels that no conditional goto jumps to."""
+        return [label for label in self.labels if not self.targets[label.name]]
+
+    def visit(self, node):
+        walk(node, self.enter, self.exit)
+
+    def is_leveler(self, node, parent):
+        # A compound only adds a level if it isn't the body of a "leveler."
+        if type(node) == Compound:
+            return type(parent) not in Positions.LEVELERS
+        return type(node) in Positions.LEVELERS
+
+    def is_region(self, node):
+        # The conditional around a goto moves along with it, so there's no
+        # point in marking where it starts and ends.
+        return (type(node) in Positions.REGIONS and
+                    not is_conditional_goto(node))
+
+    def enter(self, node, parent):
+        if parent is not None:
+            self.parent_map.set_parent(node, parent)
+
+        if type(node) == Goto:
+            self.found_goto(node)
+        elif type(node) == Label:
+            self.found_label(node)
+
+        if self.is_leveler(node, parent):
+            self.level += 1
+        if self.is_region(node):
+            self.positions.start(node)
 
-        self.parents.pop()
+    def exit(self, node, parent):
+        if self.is_region(node):
+            self.positions.end(node)
+        if self.is_leveler(node, parent):
+            self.level -= 1
 
-    def visit_Goto(self, node):
+    def found_goto(self, node):
         """
         Append the conditonal parent of the goto to self.gotos, or raise a
         NotImplementedError if that isn't possible.
 
-        The conditional parent will have some extra attributes:
-            parents: List of nodes above the conditional.
-
-        The goto will also have some extra attributes:
-            offset: The offset of the goto.
-            level: The level of the goto.
+        The offset and level of the goto are recorded in self.positions.
         """
-        parents = list(self.parents)
-        parent = parents[-1]
+        parent = self.parent_map.parent(node)
 
         if type(parent) != If:
             line = node.coord.line
             raise NotImplementedError("unsupported unconditional goto statement at line {}".format(line))
 
-        # The parent doesn't have itself as a parent.
-        parent.parents = list(self.parents)[:-1]
-        # Add some goto-specific data to the goto.
-        node.offset = self.offset
-        node.level = self.level
+        self.positions.add(node, self.level)
         self.gotos.append(parent)
+        self.targets.setdefault(node.name, []).append(parent)
 
-        self.offset += 1
-
-    def visit_Label(self, node):
-        """Append the label to self.labels with some extra attributes.
-        Attributes:
-            parents: Nodes above the label.
-            Offset: Offset of the label.
-            Level: Level of the label.
+    def found_label(self, node):
+        """Append the label to self.labels, and record its offset and level in
+        self.positions.
         """
-        node.parents = list(self.parents)
-        node.offset = self.offset
-        node.level = self.level
+        self.positions.add(node, self.level)
         self.labels.append(node)
-        self.offset += 1
-        self.generic_visit(node)
-
-    def visit_If(self, node):
-        self.level_visit(node)
-    def visit_While(self, node):
-        self.level_visit(node)
-    def visit_DoWhile(self, node):
-        self.level_visit(node)
-    def visit_Switch(self, node):
-        self.level_visit(node)
-    def visit_For(self, node):
-        self.level_visit(node)
-
-    def visit_Compound(self, node):
-        # Only increment the level if we're not a part of a "leveler."
-        if not type(self.parents[-1]) in [If, While, DoWhile, Switch, For]:
-            self.level += 1
-            self.generic_visit(node)
-            self.level -= 1
-        else:
-            self.generic_visit(node)
+        self.label_names.add(node.name)
+        self.targets.setdefault(node.name, [])
 
 def is_loop(node):
     return type(node) in [While, DoWhile, For]
 
-def under_loop(node):
+def under_loop(parents, node):
     """Test if a node is under a compound that is under a loop.
     A node is under a loop if its parents are compound, then (loop).
-    If the node doesn't have parents, this will raise an AttributeError.
     """
-    if len(node.parents) < 2:
+    above = parents.lineage(node, 2)
+    if len(above) < 2:
         return False
 
-    compound = node.parents[-1]
-    loop = node.parents[-2]
+    loop, compound = above
     return type(compound) == Compound and is_loop(loop)
 
-def under_if(node):
-    """Test if a node is under a compound that is under an If.
-    If the node doesn't have parents, this will raise an AttributeError.
-    """
-    if len(node.parents) < 2:
+def under_if(parents, node):
+    """Test if a node is under a compound that is under an If."""
+    above = parents.lineage(node, 2)
+    if len(above) < 2:
         return False
-    compound = node.parents[-1]
-    conditional = node.parents[-2]
+
+    conditional, compound = above
     return type(compound) == Compound and type(conditional) == If
 
-def under_switch(node):
+def under_switch(parents, node):
     """Test if a node is under a switch statement.
     This happens if its parents are case, then compound, then switch.
-    If the node doesn't have parents, this will raise an AttributeError.
     """
-    if len(node.parents) < 3:
+    above = parents.lineage(node, 3)
+    if len(above) < 3:
         return False
 
-    switch, compound, case = node.parents[-3:]
+    switch, compound, case = above
     return (type(case) == Case and type(compound) == Compound and
                 type(switch) == Switch)
 
-def move_goto_out_switch(conditional):
+def move_goto_out_switch(parents, blocks, positions, conditional):
     """Move a conditional goto out of a switch statement."""
-    assert(under_switch(conditional))
+    assert(under_switch(parents, conditional))
 
-    above_compound, switch, switch_compound, case = conditional.parents[-4:]
+    above_compound, switch, switch_compound, case = parents.lineage(conditional, 4)
 
     if type(above_compound) != Compound:
         raise NotImplementedError("Only support switch statements under "
@@ -306,23 +678,19 @@ def move_goto_out_switch(conditional):
     # If the logical variable is true, then break out of the switch.
     guard = If(ID(name), Break(), None)
 
-    cond_index = case.stmts.index(conditional)
-    assert(cond_index >= 0)
-
-    case.stmts[cond_index] = set_logical
-    case.stmts.insert(cond_index+1, guard)
-
-    switch_index = above_compound.block_items.index(switch)
-    above_compound.block_items.insert(switch_index+1, conditional)
+    case_block = blocks.block(case)
+    case_block.replace(conditional, set_logical)
+    case_block.insert_after(set_logical, guard)
+    parents.adopt(case, [set_logical, guard])
 
-    # We moved above three parents, so remove three of them from the conditional
-    # to make sure that later checks work.
-    conditional.parents = conditional.parents[:-3]
+    blocks.block(above_compound).insert_after(switch, conditional)
+    parents.set_parent(conditional, above_compound)
+    positions.move_out(goto, switch)
 
-def move_goto_out_loop(conditional):
+def move_goto_out_loop(parents, blocks, positions, conditional):
     """Move a conditional goto out of a loop statement."""
-    assert(under_loop(conditional))
-    parent_compound, loop, loop_compound = conditional.parents[-3:]
+    assert(under_loop(parents, conditional))
+    parent_compound, loop, loop_compound = parents.lineage(conditional, 3)
 
     if type(parent_compound) != Compound:
         raise NotImplementedError("Can only pull gotos out of loops that are "
@@ -340,41 +708,37 @@ def move_goto_out_loop(conditional):
     # If the logical variable is true, then break out of the loop.
     guard = If(ID(name), Break(), None)
 
-    cond_index = loop_compound.block_items.index(conditional)
-    assert(cond_index >= 0)
-
-    loop_compound.block_items[cond_index] = set_logical
-    loop_compound.block_items.insert(cond_index+1, guard)
-
-    loop_index = parent_compound.block_items.index(loop)
-    parent_compound.block_items.insert(loop_index+1, conditional)
+    loop_block = blocks.block(loop_compound)
+    loop_block.replace(conditional, set_logical)
+    loop_block.insert_after(set_logical, guard)
+    parents.adopt(loop_compound, [set_logical, guard])
 
-    # We moved above two parents, so remove two of them from the conditional to
-    # make sure that later checks work.
-    conditional.parents = conditional.parents[:-2]
+    blocks.block(parent_compound).insert_after(loop, conditional)
+    parents.set_parent(conditional, parent_compound)
+    positions.move_out(goto, loop)
 
-def declare_regular_variable(var_id, type_name, init, function):
-    """Declare `type_name var_id = init` at the top of `function`.
+def declare_regular_variable(prologue, var_id, type_name, init):
+    """Declare `type_name var_id = init` in `prologue`.
     This is "regular" in the sense that there are no storage qualifiers.
 
+    :prologue: The Prologue of the function being eliminated.
     :var_id: A node of type ID.
     :type_name: A string specificing what type the variable is.
     :init: A node specifiying what the initial value is.
-    :function: The FuncDef node where this variable will be declared.
     :returns: Nothing.
     """
     id_type = IdentifierType([type_name])
     type_decl = TypeDecl(var_id.name, [], id_type)
-    decl = Decl(var_id, [], [], [], type_decl, init, None)
+    decl = Decl(var_id.name, [], [], [], type_decl, init, None)
 
-    function.body.block_items.insert(0, decl)
+    prologue.add(decl)
 
-def declare_logic_variable(name, function):
-    """Declare the variable `int name = 0` at the top of `function`."""
+def declare_logic_variable(prologue, name):
+    """Declare the variable `int name = 0` in `prologue`."""
     var_id = ID(name)
     type_name = "int"
     logical_value = Constant(type_name, "0")
-    declare_regular_variable(var_id, type_name, logical_value, function)
+    declare_regular_variable(prologue, var_id, type_name, logical_value)
 
 def create_assign(name, val):
     var_id = ID(name)
@@ -383,57 +747,80 @@ def create_assign(name, val):
 def logical_label_name(goto_label):
     return "goto_{}".format(goto_label.name)
 
-def logic_init(labels, func):
+def logic_init(parents, blocks, prologue, labels):
     """
-    Declare a logical variable `goto_LABEL = 0` for each label in `labels` at
-    the top of `func`. Also, reinitialize it to 0 at the label.
+    Declare a logical variable `goto_LABEL = 0` for each label in `labels` in
+    `prologue`. Also, reinitialize it to 0 at the label.
     This is only useful if each label is actually _in_ the function.
     """
 
     for label in labels:
-        parent = label.parents[-1]
-        to_insert = []
-        if type(parent) == Compound:
-            to_insert = parent.block_items
-        elif type(parent) == Case:
-            to_insert = parent.stmts
-        else:
+        parent = parents.parent(label)
+        if type(parent) not in [Compound, Case]:
             raise NotImplementedError("Can only initialize labels under compounds or cases for now!")
 
-        declare_logic_variable("goto_{}".format(label.name), func)
+        declare_logic_variable(prologue, "goto_{}".format(label.name))
 
         val = Constant("int", "0")
         clear_logical_var = create_assign(logical_label_name(label), val)
-        label_index = to_insert.index(label)
 
         # Move the statement that the label holds to after the label,
         # and the setting to 0 into the label. Make sure we update parents.
-        to_insert.insert(label_index + 1, label.stmt)
+        blocks.block(parent).insert_after(label, label.stmt)
+        parents.set_parent(label.stmt, parent)
         label.stmt = clear_logical_var
-        update_parents(parent)
+        parents.set_parent(clear_logical_var, label)
 
-def move_goto_in_loop(conditional, label):
+def move_goto_in_loop(parents, blocks, positions, conditional, label):
     """Move a goto in a loop-statement."""
     assert(is_conditional_goto(conditional))
-    assert(under_loop(label))
+    assert(under_loop(parents, label))
 
     goto = conditional.iftrue
-    loop = label.parents[-2]
-    loop_compound = label.parents[-1]
-    compound = conditional.parents[-1]
-
-    place_inwards_cond_guard(compound, conditional, loop)
+    loop, loop_compound = parents.lineage(label, 2)
+    compound = parents.parent(conditional)
     logical_name = logical_label_name(label)
+
+    if type(loop) == For and type(loop.init) == DeclList:
+        if any(type(decl.init) == InitList for decl in loop.init.decls):
+            raise NotImplementedError("can't move gotos into for loops that "
+                                        "declare arrays or structs!")
+
+    guard = place_inwards_cond_guard(parents, blocks, positions, compound, conditional, loop)
+    if type(loop) == For:
+        skip_for_init(parents, blocks, guard, loop, logical_name)
     loop.cond = BinaryOp("||", ID(logical_name), loop.cond)
-    loop_compound.block_items.insert(0, conditional)
+    blocks.block(loop_compound).insert_after(None, conditional)
     conditional.cond = ID(logical_name)
-    update_parents(loop_compound)
-
-def move_goto_out_if(conditional):
+    parents.set_parent(conditional, loop_compound)
+    positions.move_in(goto, loop_compound)
+
+def skip_for_init(parents, blocks, guard, loop, logical_name):
+    """Keep the init of the for loop `loop` from running when a goto jumps into
+    it, as the guard before the loop keeps the statements before it from
+    running. An expression is moved into the guard. Declarations have to stay
+    in the loop, so they keep whatever value they have when jumping, as they
+    would have after a real goto.
+    """
+    if type(loop.init) == DeclList:
+        decls = []
+        for decl in loop.init.decls:
+            # The original declaration may be shared with a plan's copy.
+            decl = shallow_copy(decl)
+            if decl.init is not None:
+                decl.init = TernaryOp(ID(logical_name), ID(decl.name), decl.init)
+            decls.append(decl)
+        loop.init = DeclList(decls)
+    elif loop.init is not None:
+        blocks.block(guard.iftrue).append(loop.init)
+        parents.set_parent(loop.init, guard.iftrue)
+        loop.init = None
+
+def move_goto_out_if(parents, blocks, positions, conditional):
     """Move a conditional goto out of an if-statement."""
-    assert(under_if(conditional))
+    assert(under_if(parents, conditional))
 
-    above_if, if_stmt, if_compound = conditional.parents[-3:]
+    above_if, if_stmt, if_compound = parents.lineage(conditional, 3)
 
     if (type(above_if) != Compound):
         raise NotImplementedError("can't perform OT on an if-statement not under a compound!")
@@ -443,24 +830,26 @@ def move_goto_out_if(conditional):
     cond = conditional.cond
     set_logical = create_assign(logical_name, cond)
 
-    cond_index = if_compound.block_items.index(conditional)
-    assert(cond_index >= 0)
-    after_goto = if_compound.block_items[cond_index+1:]
+    if_block = blocks.block(if_compound)
+    after_goto = if_block.cut_between(conditional, None)
 
     guard_block = Compound(after_goto)
     guard = If(negate(ID(logical_name)), guard_block, None)
-    if_compound.block_items = if_compound.block_items[:cond_index] + [set_logical, guard]
+    if_block.replace(conditional, set_logical)
+    if_block.insert_after(set_logical, guard)
 
     # Make conditional dependent on logical variable.
     conditional.cond = ID(logical_name)
-    update_parents(guard_block)
+    parents.adopt(guard_block, after_goto)
+    parents.set_parent(guard_block, guard)
+    parents.adopt(if_compound, [set_logical, guard])
+    positions.wrap(guard, guard_block, goto, positions.end_of(if_compound))
 
-    if_index = above_if.block_items.index(if_stmt)
-    assert(if_index >= 0)
-    above_if.block_items.insert(if_index + 1, conditional)
-    update_parents(above_if)
+    blocks.block(above_if).insert_after(if_stmt, conditional)
+    parents.set_parent(conditional, above_if)
+    positions.move_out(goto, if_stmt)
 
-def place_inwards_cond_guard(parent_compound, conditional, in_stmt):
+def place_inwards_cond_guard(parents, blocks, positions, parent_compound, conditional, in_stmt):
     """Place the guarding conditional and change the goto's condition for IT.
     In effect, this places a new conditional that guards the statements between
     `conditional` and `in_stmt`, using `conditional.cond` as the guard's
@@ -471,18 +860,17 @@ def place_inwards_cond_guard(parent_compound, conditional, in_stmt):
     if type(parent_compound) != Compound:
         raise NotImplementedError("can only move gotos into statements whose parents are compounds!")
 
-    if not are_siblings(conditional, in_stmt):
+    if not are_siblings(parents, conditional, in_stmt):
         raise NotImplementedError("nested IT not implemented yet!")
 
-    cond_index = parent_compound.block_items.index(conditional)
-    stmt_index = parent_compound.block_items.index(in_stmt)
+    block = blocks.block(parent_compound)
+    assert(conditional in block and in_stmt in block)
+    assert(conditional is not in_stmt)
 
-    if cond_index > stmt_index:
+    if block.precedes(in_stmt, conditional):
         raise NotImplementedError("goto lifting not implemented yet!")
 
-    assert(cond_index >= 0 and stmt_index >= 0 and cond_index != stmt_index)
-
-    between_stmts = parent_compound.block_items[cond_index+1:stmt_index]
+    between_stmts = block.cut_between(conditional, in_stmt)
     between_compound = Compound(between_stmts)
 
     goto = conditional.iftrue
@@ -491,34 +879,34 @@ def place_inwards_cond_guard(parent_compound, conditional, in_stmt):
     set_logical = create_assign(logical_name, cond)
     guard = If(negate(ID(logical_name)), between_compound, None)
 
-    bi = parent_compound.block_items
-    parent_compound.block_items = bi[:cond_index] + [set_logical, guard, in_stmt] + bi[stmt_index+1:]
+    block.replace(conditional, set_logical)
+    block.insert_after(set_logical, guard)
 
-    # The nodes moved inside of a guard have gained two parents, while
-    # update_parents currently (2016-02-08) only checks for one.
-    for node in between_compound.block_items:
-        if "parents" in node.__dict__:
-            node.parents = node.parents + [guard, guard.iftrue]
-    update_parents(parent_compound)
+    # Only the moved nodes need their parent changed; everything nested inside
+    # of them picks up the guard through the parent map.
+    parents.adopt(between_compound, between_stmts)
+    parents.set_parent(between_compound, guard)
+    parents.adopt(parent_compound, [set_logical, guard])
+    positions.wrap(guard, between_compound, goto, positions.start_of(in_stmt))
 
     return guard
 
-def move_goto_in_if(conditional, label):
+def move_goto_in_if(parents, blocks, positions, conditional, label):
     """Move a goto into an if-statement."""
-    assert(under_if(label))
-    above_compound = conditional.parents[-1]
-    if_compound = label.parents[-1]
-    if_stmt = label.parents[-2]
+    assert(under_if(parents, label))
+    above_compound = parents.parent(conditional)
+    if_stmt, if_compound = parents.lineage(label, 2)
 
     if if_stmt.iftrue != if_compound:
         raise NotImplementedError("only support labels in the 'then' clause for IT!")
 
-    place_inwards_cond_guard(above_compound, conditional, if_stmt)
+    place_inwards_cond_guard(parents, blocks, positions, above_compound, conditional, if_stmt)
     logical_name = logical_label_name(label)
     if_stmt.cond = BinaryOp("||", ID(logical_name), if_stmt.cond)
-    if_compound.block_items.insert(0, conditional)
+    blocks.block(if_compound).insert_after(None, conditional)
     conditional.cond = ID(logical_name)
-    update_parents(if_compound)
+    parents.set_parent(conditional, if_compound)
+    positions.move_in(conditional.iftrue, if_compound)
 
 def logical_switch_name(switch):
     # https://stackoverflow.com/questions/279561
@@ -528,17 +916,17 @@ def logical_switch_name(switch):
     logical_switch_name.counter += 1
     return "switch_var_" + str(logical_switch_name.counter)
 
-def move_goto_in_switch(conditional, label, func):
+def move_goto_in_switch(parents, blocks, positions, prologue, conditional, label):
     """Move a goto into a switch statement."""
-    assert(under_switch(label))
-    switch, compound, case = label.parents[-3:]
-    above_compound = conditional.parents[-1]
+    assert(under_switch(parents, label))
+    switch, compound, case = parents.lineage(label, 3)
+    above_compound = parents.parent(conditional)
 
-    guard = place_inwards_cond_guard(above_compound, conditional, switch)
+    guard = place_inwards_cond_guard(parents, blocks, positions, above_compound, conditional, switch)
 
     switch_var = switch.cond;
     logical_name = logical_switch_name(switch)
-    declare_logic_variable(logical_switch_name(switch), func)
+    declare_logic_variable(prologue, logical_name)
 
     # This makes the logical variable exactly the switch variable.
     continue_switch = create_assign(logical_name, switch_var)
@@ -548,82 +936,811 @@ def move_goto_in_switch(conditional, label, func):
     label_name = logical_label_name(conditional.iftrue)
     switch.cond = ID(logical_name)
     # If the goto's cond was false, then continue as normal.
-    guard.iftrue.block_items.append(continue_switch)
+    blocks.block(guard.iftrue).append(continue_switch)
+    parents.set_parent(continue_switch, guard.iftrue)
     # If the goto's cond was true, then force jumping to the switch case.
     guard.iffalse = steal_switch
+    parents.set_parent(steal_switch, guard)
 
-    case.stmts.insert(0, conditional)
+    blocks.block(case).insert_after(None, conditional)
     conditional.cond = ID(label_name)
-    conditional.parents += [switch, compound, case]
+    parents.set_parent(conditional, case)
+    positions.move_in(conditional.iftrue, case)
 
 def negate(exp):
     return UnaryOp("!", exp)
 
-def do_it(func_node):
-    t = GotoLabelFinder()
-    t.visit(func_node)
-    labels = t.labels
-    gotos = t.gotos
-    d = pair_goto_labels(labels, gotos)
-    logic_init(t.labels, func_node)
-
-    for label in t.labels:
-        for conditional in d[label.name]:
-            while not are_siblings(label, conditional):
-                if not are_directly_related(label, conditional):
-                    print("Skipping two indirectly related nodes...")
-                    break
+def guard_flags(node, flags):
+    """Return the set of flags tested by `node` if it is a guard, an
+    `if (!goto_x && ...)` with only a compound body and every name in `flags`.
+    Return None otherwise.
+    """
+    if type(node) != If or node.iffalse is not None or type(node.iftrue) != Compound:
+        return None
+
+    return negated_flags(node.cond, flags)
+
+def negated_flags(cond, flags):
+    if type(cond) == UnaryOp and cond.op == "!" and type(cond.expr) == ID:
+        if cond.expr.name in flags:
+            return frozenset([cond.expr.name])
+    elif type(cond) == BinaryOp and cond.op == "&&":
+        left = negated_flags(cond.left, flags)
+        right = negated_flags(cond.right, flags)
+        if left is not None and right is not None:
+            return left | right
+
+    return None
+
+class GuardScanner(NodeVisitor):
+    """Visitor that finds what keeps statements from moving past a guard: the
+    variables they assign, and whether control can enter them other than from
+    the top, through a label or a case of an enclosing switch.
+    """
+
+    def __init__(self, labels_are_entries):
+        self.labels_are_entries = labels_are_entries
+        self.assigned = set()
+        self.entered = False
+        self.switches = 0
+
+    def visit_Assignment(self, node):
+        if type(node.lvalue) == ID:
+            self.assigned.add(node.lvalue.name)
+        self.generic_visit(node)
+
+    def visit_Label(self, node):
+        if self.labels_are_entries:
+            self.entered = True
+        self.generic_visit(node)
+
+    def visit_Case(self, node):
+        if self.switches == 0:
+            self.entered = True
+        self.generic_visit(node)
+
+    visit_Default = visit_Case
+
+    def visit_Switch(self, node):
+        self.switches += 1
+        self.generic_visit(node)
+        self.switches -= 1
+
+    def keeps_flags(self, tested):
+        """Return if running the statements visited so far from the top can't
+        change any flag in `tested`, and there is no other way into them."""
+        return not self.entered and not (self.assigned & tested)
+
+def scan_guard_body(guard, labels_are_entries):
+    """Return a GuardScanner that visited the statements of `guard`."""
+    scanner = GuardScanner(labels_are_entries)
+    for stmt in guard.iftrue.block_items or []:
+        scanner.visit(stmt)
+
+    return scanner
+
+def declares(stmts):
+    return any(type(stmt) == Decl for stmt in stmts)
 
-                if under_if(conditional):
-                    print("Moving out of a conditional...")
-                    move_goto_out_if(conditional)
-                elif under_loop(conditional):
-                    print("Moving out of a loop...")
-                    move_goto_out_loop(conditional)
-                elif under_switch(conditional):
-                    print("Moving out of a switch...")
-                    move_goto_out_switch(conditional)
-                elif under_loop(label):
-                    print("Moving into a loop...")
-                    move_goto_in_loop(conditional, label)
-                elif under_switch(label):
-                    print("Moving into a switch...")
-                    move_goto_in_switch(conditional, label, func)
-                elif under_if(label):
-                    print("Moving into an if-statement...")
-                    move_goto_in_if(conditional, label)
-                else:
-                    print("Nothing we can do for the non-looped...")
+def merge_guards(node, flags, labels_are_entries, log=None, function=None):
+    """Merge the guards on the flags in `flags` under `node`, bottom up.
+
+    Eliminating several gotos out of the same region leaves chains of guards
+    on the same flags. Three shapes are merged, as long as the statements that
+    end up behind a guard they weren't behind before can't change its flags
+    or be jumped into, and no declaration changes scope:
+
+        if (!a) { A } if (!a) { B }     ->  if (!a) { A B }
+        if (!a) { A if (!a) { B } C }   ->  if (!a) { A B C }
+        if (!a) { if (!b) { B } }       ->  if (!a && !b) { B }
+
+    Labels only count as a way in if `labels_are_entries`, that is if the
+    function still has gotos. Every merge is reported to `log`.
+    Returns the number of guards removed.
+    """
+    merged = 0
+    for stmt in statements_postorder(node):
+        tested = guard_flags(stmt, flags)
+        if tested is not None:
+            count = merge_nested(stmt, tested, flags, labels_are_entries, log, function)
+            if count:
+                stmts, more = merge_adjacent(stmt.iftrue.block_items, flags,
+                                             labels_are_entries, log, function)
+                stmt.iftrue.block_items = stmts
+                merged += count + more
+
+        if type(stmt) in [Compound, Case, Default]:
+            attr = statements_attr(stmt)
+            stmts, count = merge_adjacent(getattr(stmt, attr), flags,
+                                          labels_are_entries, log, function)
+            setattr(stmt, attr, stmts)
+            merged += count
+
+    return merged
+
+def merge_nested(guard, tested, flags, labels_are_entries, log, function):
+    merged = 0
+    changed = True
+    while changed:
+        changed = False
+        stmts = guard.iftrue.block_items or []
+
+        if len(stmts) == 1 and guard_flags(stmts[0], flags) is not None:
+            inner = stmts[0]
+            if not negated_flags(inner.cond, flags) <= tested:
+                guard.cond = BinaryOp("&&", guard.cond, inner.cond)
+                tested = tested | negated_flags(inner.cond, flags)
+
+            guard.iftrue = inner.iftrue
+            changed = True
+        else:
+            # The scanner has visited the statements before the current one.
+            scanner = GuardScanner(labels_are_entries)
+            for i, stmt in enumerate(stmts):
+                inner_tested = guard_flags(stmt, flags)
+                if (inner_tested is not None and inner_tested <= tested and
+                        not declares(stmt.iftrue.block_items or []) and
+                        scanner.keeps_flags(inner_tested)):
+                    guard.iftrue.block_items = (stmts[:i] +
+                                                (stmt.iftrue.block_items or []) +
+                                                stmts[i + 1:])
+                    changed = True
                     break
+                scanner.visit(stmt)
+
+        if changed:
+            merged += 1
+            if log is not None:
+                log.event("merge_nested", function, None,
+                          flags=sorted(tested))
+
+    return merged
+
+def merge_adjacent(stmts, flags, labels_are_entries, log, function):
+    """Return `stmts` with neighbouring guards on the same flags merged, and
+    the number of guards removed."""
+    if not stmts:
+        return stmts, 0
+
+    merged = 0
+    result = [stmts[0]]
+    # The scanner of the body of result[-1], once it was needed. Merging guards
+    # only moves statements between them, so merging another guard into it
+    # only adds what the scanner finds in that guard.
+    scanner = None
+    for stmt in stmts[1:]:
+        previous = result[-1]
+        tested = guard_flags(stmt, flags)
+        if (tested is not None and guard_flags(previous, flags) == tested and
+                not declares(previous.iftrue.block_items or [])):
+            if scanner is None:
+                scanner = scan_guard_body(previous, labels_are_entries)
+            keeps = scanner.keeps_flags(tested)
+        else:
+            keeps = False
+
+        if keeps:
+            for moved in stmt.iftrue.block_items or []:
+                scanner.visit(moved)
+            body, count = merge_adjacent((previous.iftrue.block_items or []) +
+                                         (stmt.iftrue.block_items or []),
+                                         flags, labels_are_entries, log, function)
+            previous.iftrue.block_items = body
+            merged += count + 1
+            if log is not None:
+                log.event("merge_adjacent", function, None,
+                          flags=sorted(tested))
+        else:
+            result.append(stmt)
+            scanner = None
+
+    return result, merged
+
+def goto_label_pairs(finder):
+    """Return (label, conditional) pairs with the labels in the order they
+    were found, and the gotos of each label in the order they were found."""
+    return [(label, conditional) for label in finder.labels
+                for conditional in finder.targets[label.name]]
+
+class DiscoveryOrder(object):
+    """The goto/label pairs to eliminate, handed out in the order they were
+    found."""
+
+    def __init__(self, positions, pairs):
+        self.pairs = deque(pairs)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def pop(self):
+        return self.pairs.popleft()
+
+class NearestFirstOrder(object):
+    """The goto/label pairs to eliminate, closest first.
+
+    Eliminating a pair wraps the statements between the goto and the label in
+    a guard or a do-while loop. Any other goto in there ends up nested one
+    level deeper, and has to be moved out of the new statement with another
+    flag assignment and guard. Pairs that are close together can't contain
+    pairs that are further apart, so doing them first avoids most of that. Ties
+    go to the more deeply nested pair, then to the earlier goto, so the order
+    is the same on every run.
+
+    The distances and levels are read from `positions` as the earlier
+    eliminations left them, so each choice sees the function as it is now.
+    The pairs are kept in a heap keyed by what their cost was when it was
+    pushed. Only the pair being eliminated moves, so the cost of another pair
+    only goes down when it's wrapped in a new statement, which Positions
+    reports through its `deepened` list, or when the offsets are renumbered,
+    which rebuilds the heap. Any other key that's out of date is too low, so
+    it's pushed again with its new cost when it comes up.
+    """
+
+    def __init__(self, positions, pairs):
+        self.positions = positions
+        self.pairs = list(pairs)
+        self.pending = set(range(len(self.pairs)))
+        # The pairs of each goto and label.
+        self.owners = {}
+        for i, (label, conditional) in enumerate(self.pairs):
+            self.owners.setdefault(label, []).append(i)
+            self.owners.setdefault(conditional.iftrue, []).append(i)
+
+        positions.deepened = []
+        self.rebuild()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def cost(self, i):
+        label, conditional = self.pairs[i]
+        goto = conditional.iftrue
+        positions = self.positions
+        return (positions.distance(goto, label),
+                -max(positions.level(goto), positions.level(label)),
+                positions.offset(goto))
+
+    def rebuild(self):
+        self.renumbered = self.positions.renumbered()
+        del self.positions.deepened[:]
+        self.heap = [(self.cost(i), i) for i in self.pending]
+        heapq.heapify(self.heap)
+
+    def pop(self):
+        positions = self.positions
+        if positions.renumbered() != self.renumbered:
+            self.rebuild()
+        else:
+            for node in positions.deepened:
+                for i in self.owners.get(node, ()):
+                    if i in self.pending:
+                        heapq.heappush(self.heap, (self.cost(i), i))
+            del positions.deepened[:]
+
+        while True:
+            key, i = heapq.heappop(self.heap)
+            if i not in self.pending:
+                continue
+
+            cost = self.cost(i)
+            if cost != key:
+                heapq.heappush(self.heap, (cost, i))
+                continue
+
+            self.pending.remove(i)
+            return self.pairs[i]
+
+ORDERS = {
+    "discovery": DiscoveryOrder,
+    "nearest": NearestFirstOrder,
+}
+
+def do_it(func_node, log=None, order="nearest"):
+    """Eliminate the gotos in `func_node`.
+    Every transformation is reported to `log`, an EventLog. If no log is given,
+    nothing is reported. `order` names the class in ORDERS that hands out the
+    goto/label pairs to eliminate.
+    """
+    if log is None:
+        log = EventLog()
 
-                print("One iteration done...")
+    # Switch variable names only have to be unique inside of one function, so
+    # restart the numbering to keep the output independent of what was
+    # eliminated before.
+    logical_switch_name.counter = -1
 
-            if are_siblings(label, conditional):
-                print("Siblings!")
-                remove_siblings(label, conditional)
+    name = func_node.decl.name
+    started = time.perf_counter()
+    statements_before = count_statements(func_node)
+
+    t = GotoLabelFinder()
+    t.visit(func_node)
+    parents = t.parent_map
+    positions = t.positions
+    blocks = BlockIndex()
+    prologue = Prologue()
+    logic_init(parents, blocks, prologue, t.labels)
+
+    for conditional in t.dangling_gotos():
+        log.event("dangling_goto", name, conditional.iftrue.name)
+    for label in t.unused_labels():
+        log.event("unused_label", name, label.name)
+
+    pairs = ORDERS[order](positions, goto_label_pairs(t))
+    while pairs:
+        label, conditional = pairs.pop()
+
+        while not are_siblings(parents, label, conditional):
+            if not are_directly_related(parents, label, conditional):
+                log.event("skip_unrelated", name, label.name)
+                break
+
+            began = time.perf_counter()
+            if under_if(parents, conditional):
+                kind = "outward_if"
+                move_goto_out_if(parents, blocks, positions, conditional)
+            elif under_loop(parents, conditional):
+                kind = "outward_loop"
+                move_goto_out_loop(parents, blocks, positions, conditional)
+            elif under_switch(parents, conditional):
+                kind = "outward_switch"
+                move_goto_out_switch(parents, blocks, positions, conditional)
+            elif under_loop(parents, label):
+                kind = "inward_loop"
+                move_goto_in_loop(parents, blocks, positions, conditional, label)
+            elif under_switch(parents, label):
+                kind = "inward_switch"
+                move_goto_in_switch(parents, blocks, positions, prologue, conditional, label)
+            elif under_if(parents, label):
+                kind = "inward_if"
+                move_goto_in_if(parents, blocks, positions, conditional, label)
             else:
-                print("Well, we tried.")
+                log.event("skip_unsupported", name, label.name)
+                break
+
+            log.event(kind, name, label.name, time.perf_counter() - began)
+
+        if are_siblings(parents, label, conditional):
+            began = time.perf_counter()
+            wrapper = remove_siblings(parents, blocks, positions, label, conditional)
+            log.event("siblings", name, label.name, time.perf_counter() - began,
+                      wrapper=type(wrapper).__name__)
+
+    flags = len(prologue)
+    prologue.emit(blocks, func_node)
+    blocks.flush()
+
+    merge_guards(func_node.body,
+                 set(logical_label_name(label) for label in t.labels),
+                 has_goto(func_node), log, name)
+
+    log.function_done(name, flags, statements_before,
+                      count_statements(func_node),
+                      time.perf_counter() - started)
+
+def count_statements(node):
+    """Return how many statements there are in every block under `node`.
+
+    The tree is walked without recursing, since after an elimination the
+    function can be nested deeper than the recursion limit allows."""
+    count = 0
+    for child in statements_postorder(node):
+        if type(child) == Compound:
+            count += len(child.block_items or [])
+        elif type(child) in (Case, Default):
+            count += len(child.stmts or [])
+
+    return count
+
+class EventLog(object):
+    """Structured record of what an elimination did.
+
+    Every transformation is an event: a dictionary with the kind of the event,
+    the function and label it happened for, and how many seconds it took. If
+    `stream` is given, each event is written to it as a line of JSON;
+    otherwise events are only counted. summary() gives the totals of a run.
+    """
 
-if __name__ == "__main__":
-    import sys
+    OUTWARD = ["outward_if", "outward_loop", "outward_switch"]
+    INWARD = ["inward_if", "inward_loop", "inward_switch"]
+    SKIPS = ["skip_unrelated", "skip_unsupported", "dangling_goto"]
+    MERGES = ["merge_adjacent", "merge_nested"]
+
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.counts = Counter()
+        self.functions = 0
+        self.failures = 0
+        self.flag_variables = 0
+        self.statements_before = 0
+        self.statements_after = 0
+        self.seconds = 0.0
+
+    def event(self, kind, function, label, seconds=0.0, **details):
+        self.counts[kind] += 1
+        if self.stream is not None:
+            record = {"event": kind, "function": function, "label": label,
+                      "seconds": seconds}
+            record.update(details)
+            self.stream.write(json.dumps(record) + "\n")
+
+    def function_done(self, function, flags, statements_before,
+                      statements_after, seconds):
+        self.functions += 1
+        self.flag_variables += flags
+        self.statements_before += statements_before
+        self.statements_after += statements_after
+        self.seconds += seconds
+        self.event("function_done", function, None, seconds,
+                   flag_variables=flags,
+                   statements_before=statements_before,
+                   statements_after=statements_after)
+
+    def function_failed(self, function, error):
+        self.failures += 1
+        self.event("function_failed", function, None, error=error)
+
+    def merge(self, other):
+        """Add the totals of `other` to this log. Its events aren't replayed."""
+        self.counts.update(other.counts)
+        self.functions += other.functions
+        self.failures += other.failures
+        self.flag_variables += other.flag_variables
+        self.statements_before += other.statements_before
+        self.statements_after += other.statements_after
+        self.seconds += other.seconds
+
+    def summary(self):
+        if self.statements_before:
+            growth = self.statements_after / self.statements_before
+        else:
+            growth = 1.0
+
+        return {
+            "functions": self.functions,
+            "failures": self.failures,
+            "outward_moves": sum(self.counts[k] for k in self.OUTWARD),
+            "inward_moves": sum(self.counts[k] for k in self.INWARD),
+            "sibling_eliminations": self.counts["siblings"],
+            "merged_guards": sum(self.counts[k] for k in self.MERGES),
+            "skips": sum(self.counts[k] for k in self.SKIPS),
+            "unused_labels": self.counts["unused_label"],
+            "flag_variables": self.flag_variables,
+            "statements_before": self.statements_before,
+            "statements_after": self.statements_after,
+            "statement_growth": growth,
+            "seconds": self.seconds,
+        }
+
+    def write_summary(self, f):
+        json.dump(self.summary(), f, indent=2, sort_keys=True)
+        f.write("\n")
+
+class Plan(EventLog):
+    """What eliminating the gotos of one function would do.
+
+    A Plan is an EventLog that keeps every event as a step, so it holds the
+    sequence of moves, sibling eliminations and skips for each label, along
+    with the totals. See plan_function.
+    """
+
+    def __init__(self, function):
+        EventLog.__init__(self)
+        self.function = function
+        self.steps = []
+        self.error = None
+
+    def event(self, kind, function, label, seconds=0.0, **details):
+        EventLog.event(self, kind, function, label, seconds, **details)
+        if kind not in ["function_done", "function_failed"]:
+            step = {"event": kind, "label": label}
+            step.update(details)
+            self.steps.append(step)
+
+    def function_failed(self, function, error):
+        EventLog.function_failed(self, function, error)
+        self.error = error
+
+    def summary(self):
+        summary = EventLog.summary(self)
+        wrappers = Counter(step.get("wrapper") for step in self.steps)
+        summary.update({
+            "function": self.function,
+            "error": self.error,
+            "steps": self.steps,
+            # Outward moves out of an if and every inward move wrap statements
+            # in a new `if (!goto_x)` guard, as do forward sibling removals.
+            # Each merge takes one away again.
+            "guards": (self.counts["outward_if"] +
+                        sum(self.counts[k] for k in self.INWARD) +
+                        wrappers["If"] -
+                        sum(self.counts[k] for k in self.MERGES)),
+            "do_while_loops": wrappers["DoWhile"],
+        })
+        return summary
+
+# The fields of each statement node that hold other statements.
+STATEMENT_FIELDS = {
+    FuncDef: ["body"],
+    Compound: ["block_items"],
+    If: ["iftrue", "iffalse"],
+    While: ["stmt"],
+    DoWhile: ["stmt"],
+    For: ["stmt"],
+    Switch: ["stmt"],
+    Case: ["stmts"],
+    Default: ["stmts"],
+    Label: ["stmt"],
+}
+
+def statement_children(node):
+    """Return the statements directly under `node`, in order."""
+    children = []
+    for field in STATEMENT_FIELDS.get(type(node), ()):
+        child = getattr(node, field)
+        if type(child) == list:
+            children.extend(child)
+        elif child is not None:
+            children.append(child)
+
+    return children
+
+def statements_postorder(node):
+    """Yield `node` and every statement under it, each after the statements
+    under it. Expressions and declarations aren't walked into, and the
+    statements of a node are read when the walk reaches it."""
+    stack = [(node, iter(statement_children(node)))]
+    while stack:
+        parent, children = stack[-1]
+        for child in children:
+            stack.append((child, iter(statement_children(child))))
+            break
+        else:
+            stack.pop()
+            yield parent
+
+def shallow_copy(node):
+    """Return a copy of `node` that shares all of its attributes.
+
+    The slots are copied directly; copy.copy would go through __getstate__,
+    which builds the Coord of the original node."""
+    cls = type(node)
+    clone = cls.__new__(cls)
+    for name in cls.__slots__:
+        if name != "__weakref__" and hasattr(node, name):
+            setattr(clone, name, getattr(node, name))
+
+    return clone
+
+def skeleton_copy(node):
+    """Return a copy of `node` where every statement is copied, but
+    expressions and declarations are shared with the original.
+
+    The transformations never change an expression in place, they only
+    replace or wrap it, so running do_it on the copy leaves the original alone.
+    The statements still to be copied are kept on a stack, since a long
+    else-if chain nests deeper than the recursion limit allows.
+    """
+    top = [node]
+    # Each entry is a list and an index into it, or a copied statement and one
+    # of its fields, that still holds the original.
+    stack = [(top, 0)]
+    while stack:
+        owner, key = stack.pop()
+        if type(owner) == list:
+            original = owner[key]
+        else:
+            original = getattr(owner, key)
+
+        if type(original) == list:
+            skeleton = list(original)
+            stack.extend((skeleton, i) for i in range(len(skeleton)))
+        elif type(original) in STATEMENT_FIELDS:
+            skeleton = shallow_copy(original)
+            stack.extend((skeleton, field)
+                         for field in STATEMENT_FIELDS[type(original)]
+                         if getattr(original, field) is not None)
+        else:
+            continue
+
+        if type(owner) == list:
+            owner[key] = skeleton
+        else:
+            setattr(owner, key, skeleton)
+
+    return top[0]
+
+def plan_function(func_node, order="nearest"):
+    """Return the Plan for eliminating the gotos of `func_node` in the given
+    `order`, without changing it.
 
-    filename = ""
-    function_name = ""
+    The real elimination runs on a skeleton copy of the function, so the plan
+    is exact, including whether it would fail, but nothing is deep copied and
+    no code is generated. That trades speed for exactness: planning costs
+    about as much as `do_it` itself, and only saves the copy and the code
+    generation, which take several times longer than `do_it` (see README).
+    """
+    name = func_node.decl.name
+    plan = Plan(name)
     try:
-        filename = sys.argv[1]
-    except IndexError:
-        filename = "./test.c"
+        do_it(skeleton_copy(func_node), plan, order)
+    except Exception as e:
+        plan.function_failed(name, failure_message(e))
+
+    return plan
+
+def plan_summary(func_node, order="nearest"):
+    return plan_function(func_node, order).summary()
 
+def has_goto(node):
+    """Return if there is a goto statement anywhere under `node`."""
+    return any(type(stmt) == Goto for stmt in statements_postorder(node))
+
+def goto_functions(ast):
+    """Return a list of (index, FuncDef) pairs for every function definition in
+    `ast.ext` that contains a goto statement.
+    """
+    return [(i, node) for i, node in enumerate(ast.ext)
+                if type(node) == FuncDef and has_goto(node)]
+
+def failure_message(error):
+    """Return the message to report for an elimination that raised `error`.
+    A NotImplementedError says what isn't supported; anything else is a bug,
+    so its type is kept."""
+    if type(error) == NotImplementedError:
+        return str(error)
+
+    return "{}: {}".format(type(error).__name__, error)
+
+def eliminate_function(func_node, keep_events=False, order="nearest"):
+    """Run `do_it` on `func_node` and return (func_node, error, log, events).
+    This is meant to run in a worker process, so the function is returned
+    instead of just being modified. If the elimination raises, error is the
+    failure_message of the exception and func_node is None, so that one
+    function can't take down the rest of the translation unit.
+
+    log is the EventLog of the run without its stream, and events is the text
+    the log wrote if `keep_events` is set, or None.
+    """
+    stream = io.StringIO() if keep_events else None
+    log = EventLog(stream)
     try:
-        function_name = sys.argv[2]
-    except IndexError:
-        function_name = "main"
+        do_it(func_node, log, order)
+    except Exception as e:
+        error = failure_message(e)
+        log.function_failed(func_node.decl.name, error)
+        func_node = None
+    else:
+        error = None
+
+    log.stream = None
+    events = stream.getvalue() if keep_events else None
+    return func_node, error, log, events
+
+def map_functions(executor, work, nodes, *args):
+    """Yield the result of work(node, *args) for each node in `nodes`, in
+    order, each run in a process of `executor`.
+
+    A function nested too deeply to be pickled, or whose result is, can't go
+    to a worker process. It runs in this process instead, on a skeleton copy,
+    so that the original is left alone just as when a worker runs it.
+    """
+    futures = [executor.submit(work, node, *args) for node in nodes]
+    for node, future in zip(nodes, futures):
+        try:
+            yield future.result()
+        except (RecursionError, pickle.PicklingError):
+            yield work(skeleton_copy(node), *args)
+
+def eliminate_translation_unit(ast, jobs=None, log=None, order="nearest"):
+    """Eliminate the gotos from every function in `ast` that has one.
+    Functions are independent once parsed, so each one is handed to a process
+    pool of `jobs` workers (the number of CPUs if None), or eliminated here if
+    they can't be (see map_functions). Transformed functions replace the
+    originals in `ast.ext`; functions that fail keep their original body.
+
+    The events of every function are written to `log`, an EventLog, as the
+    functions finish, and their totals are added to it.
+
+    Returns a list of (function name, error message) pairs for the failures.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    targets = goto_functions(ast)
+    failures = []
+    keep_events = log is not None and log.stream is not None
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        nodes = [node for i, node in targets]
+        results = map_functions(executor, eliminate_function, nodes,
+                                keep_events, order)
+        for (i, original), result in zip(targets, results):
+            func_node, error, function_log, events = result
+            if log is not None:
+                log.merge(function_log)
+                if events:
+                    log.stream.write(events)
+
+            if error is not None:
+                failures.append((original.decl.name, error))
+            else:
+                ast.ext[i] = func_node
+
+    return failures
+
+def plan_translation_unit(ast, jobs=None, order="nearest"):
+    """Plan the elimination of every function in `ast` that has a goto, using
+    a process pool of `jobs` workers. Returns a list with the summary of each
+    Plan, in the order of the functions.
+    """
+    from concurrent.futures import ProcessPoolExecutor
 
-    ast = pycparser.parse_file(filename, use_cpp=True,
+    nodes = [node for i, node in goto_functions(ast)]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(map_functions(executor, plan_summary, nodes, order))
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Eliminate goto statements "
+                                        "from a C file.")
+    parser.add_argument("filename", nargs="?", default="./test.c")
+    parser.add_argument("function", nargs="?", default="main")
+    parser.add_argument("--all", action="store_true",
+                        help="eliminate gotos from every function and print "
+                             "the whole translation unit")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes for --all "
+                             "(default: number of CPUs)")
+    parser.add_argument("-o", "--output", default=None,
+                        help="write the --all result here instead of stdout")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="write every transformation to stderr as a "
+                             "line of JSON")
+    parser.add_argument("--plan", action="store_true",
+                        help="only print a JSON plan of the elimination; "
+                             "nothing is transformed")
+    parser.add_argument("--metrics", default=None, metavar="FILE",
+                        help="write a JSON summary of the run to FILE "
+                             "('-' for stderr)")
+    parser.add_argument("--order", choices=sorted(ORDERS), default="nearest",
+                        help="order in which goto/label pairs are eliminated "
+                             "(default: nearest)")
+    args = parser.parse_args()
+
+    ast = pycparser.parse_file(args.filename, use_cpp=True,
                     cpp_args="-I/usr/share/python3-pycparser/fake_libc_include")
-    func = get_function(ast, function_name)
     generator = c_generator.CGenerator()
+    log = EventLog(sys.stderr if args.verbose else None)
+
+    if args.plan:
+        if args.all:
+            plans = plan_translation_unit(ast, args.jobs, args.order)
+        else:
+            plans = [plan_summary(get_function(ast, args.function), args.order)]
+
+        json.dump(plans, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    elif args.all:
+        failures = eliminate_translation_unit(ast, args.jobs, log, args.order)
+        for name, error in failures:
+            sys.stderr.write("{}: {}\n".format(name, error))
+
+        if args.output is None:
+            generator.write(ast, sys.stdout)
+        else:
+            with open(args.output, "w") as f:
+                generator.write(ast, f)
+    else:
+        func = get_function(ast, args.function)
+
+        print(generator.visit(func))
+        do_it(func, log, args.order)
+        print(generator.visit(func))
 
-    print(generator.visit(func))
-    do_it(func)
-    print(generator.visit(func))
+    if args.metrics == "-":
+        log.write_summary(sys.stderr)
+    elif args.metrics is not None:
+        with open(args.metrics, "w") as f:
+            log.write_summary(f)
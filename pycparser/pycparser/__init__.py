@@ -10,11 +10,23 @@
 __all__ = ['c_lexer', 'c_parser', 'c_ast']
 __version__ = '2.14'
 
+import sys
+import threading
+from collections import deque
 from subprocess import Popen, PIPE
+from .astcache import ParseCache
 from .c_parser import CParser
+from .c_preprocessor import CPreprocessor
+from .cppcache import PreprocessCache
+from .plyparser import ParseError
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
-def preprocess_file(filename, cpp_path='cpp', cpp_args=''):
+
+def preprocess_file(filename, cpp_path='cpp', cpp_args='', cache=None):
     """ Preprocess a file using cpp.
 
         filename:
@@ -25,15 +37,33 @@ def preprocess_file(filename, cpp_path='cpp', cpp_args=''):
             Refer to the documentation of parse_file for the meaning of these
             arguments.
 
-        When successful, returns the preprocessed file's contents.
-        Errors from cpp will be printed out.
+        cache:
+            Optional PreprocessCache. If it holds the output for this file
+            and none of the files it included changed, cpp isn't run.
+
+        When successful, returns the preprocessed file's contents, and
+        prints any warnings from cpp. If cpp fails, RuntimeError is raised
+        with its errors.
     """
-    path_list = [cpp_path]
     if isinstance(cpp_args, list):
-        path_list += cpp_args
+        args = cpp_args
     elif cpp_args != '':
-        path_list += [cpp_args]
-    path_list += [filename]
+        args = [cpp_args]
+    else:
+        args = []
+
+    if cache is not None:
+        try:
+            key = cache.key(filename, cpp_path, args)
+        except (IOError, OSError):
+            # cpp reports the error, as it would without the cache.
+            cache = None
+        else:
+            text = cache.get(key)
+            if text is not None:
+                return text
+
+    path_list = [cpp_path] + args + [filename]
 
     try:
         # Note the use of universal_newlines to treat all newlines
@@ -41,18 +71,27 @@ def preprocess_file(filename, cpp_path='cpp', cpp_args=''):
         #
         pipe = Popen(   path_list,
                         stdout=PIPE,
+                        stderr=PIPE,
                         universal_newlines=True)
-        text = pipe.communicate()[0]
+        text, errors = pipe.communicate()
     except OSError as e:
         raise RuntimeError("Unable to invoke 'cpp'.  " +
             'Make sure its path was passed correctly\n' +
             ('Original error: %s' % e))
 
+    if pipe.returncode != 0:
+        raise RuntimeError('cpp failed on %s (exit status %d):\n%s' % (
+            filename, pipe.returncode, errors))
+    if errors:
+        sys.stderr.write(errors)
+
+    if cache is not None:
+        cache.put(key, text)
     return text
 
 
 def parse_file(filename, use_cpp=False, cpp_path='cpp', cpp_args='',
-               parser=None):
+               parser=None, cpp_cache=None, preprocessor=None, ast_cache=None):
     """ Parse a C file using pycparser.
 
         filename:
@@ -77,17 +116,323 @@ def parse_file(filename, use_cpp=False, cpp_path='cpp', cpp_args='',
         parser:
             Optional parser object to be used instead of the default CParser
 
+        cpp_cache:
+            Optional PreprocessCache to reuse the output of cpp from, if
+            use_cpp is True.
+
+        preprocessor:
+            Optional CPreprocessor to preprocess the file with in this
+            process, if use_cpp is True, instead of running cpp. cpp_path,
+            cpp_args and cpp_cache are then ignored; the preprocessor has
+            its own arguments. Reusing one for many files saves reading
+            the headers they share again.
+
+        ast_cache:
+            Optional astcache.ParseCache. If it holds the AST of the text
+            of the file (after preprocessing, if use_cpp is True), the AST
+            is loaded from it instead of parsing the text, and otherwise
+            the AST is added to it.
+
         When successful, an AST is returned. ParseError can be
-        thrown if the file doesn't parse successfully.
+        thrown if the file doesn't parse successfully, and RuntimeError
+        if cpp fails on it.
+    """
+    text = _read_file(filename, use_cpp, cpp_path, cpp_args, cpp_cache,
+                      preprocessor)
+
+    return _parse_cached(parser, filename, text, ast_cache)
+
+
+def parse_files(filenames, use_cpp=False, cpp_path='cpp', cpp_args='',
+                parser=None, jobs=1, cpp_cache=None, cpp_jobs=1,
+                preprocessor=None, ast_cache=None):
+    """ Parse many C files, yielding a (filename, result) pair for each of
+        them in order, where result is the FileAST of the file or the
+        exception that kept it from being parsed: a ParseError, or an
+        IOError or RuntimeError from reading or preprocessing it.
+
+        filenames:
+            An iterable of the names of the files to parse.
+
+        use_cpp, cpp_path, cpp_args, cpp_cache, preprocessor, ast_cache:
+            Refer to the documentation of parse_file. Each worker process
+            gets its own copy of preprocessor, and uses ast_cache itself.
+
+        parser:
+            Optional parser object to be used instead of the default CParser
+            when jobs is 1, or in this process for a file whose AST can't
+            be sent back from a worker.
+
+        jobs:
+            The number of worker processes to parse with, or None for one
+            per CPU. With 1, the files are parsed in this process. At most
+            2 * jobs files are given to the workers ahead of the one being
+            yielded, so filenames is only consumed as fast as they parse.
+            A file whose AST is too deeply nested to be pickled back from
+            a worker is parsed again in this process.
+
+        cpp_jobs:
+            If use_cpp is True, the number of cpp processes to run at once,
+            or None for one per CPU. With more than 1, files are
+            preprocessed by threads in this process while earlier files are
+            being parsed, and each is handed to the parser as soon as it's
+            its turn. At most 2 * cpp_jobs files are preprocessed ahead of
+            the parser, so cpp waits when parsing falls behind. Not used
+            with a preprocessor.
+
+        Only one parser is built per process, however many files it parses,
+        and it's reset before each file, so a file can't see the typedefs
+        of the previous one or be affected by an error in it.
+    """
+    cpp_jobs = _count(cpp_jobs)
+    if use_cpp and cpp_jobs > 1 and preprocessor is None:
+        texts = _preprocess_ahead(filenames, cpp_path, cpp_args, cpp_cache,
+                                  cpp_jobs, 2 * cpp_jobs)
+        for result in _parse_texts(texts, parser, jobs, ast_cache):
+            yield result
+        return
+
+    if jobs == 1:
+        if parser is None:
+            parser = CParser()
+        for filename in filenames:
+            yield filename, _parse_one(parser, filename, use_cpp, cpp_path,
+                                       cpp_args, cpp_cache, preprocessor,
+                                       ast_cache)
+        return
+
+    from multiprocessing import Pool
+
+    def parse_here(parser, filename, use_cpp, cpp_path, cpp_args, cpp_cache,
+                   ast_cache):
+        return _parse_one(parser, filename, use_cpp, cpp_path, cpp_args,
+                          cpp_cache, preprocessor, ast_cache)
+
+    jobs = _count(jobs)
+    pool = Pool(jobs, _init_worker, (preprocessor,))
+    try:
+        work = ((filename, (filename, use_cpp, cpp_path, cpp_args, cpp_cache,
+                            ast_cache))
+                    for filename in filenames)
+        for result in _map_in_order(pool, _parse_in_worker, work, 2 * jobs,
+                                    parse_here, parser):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _count(jobs):
+    # The number of jobs to run, where None means one per CPU.
+    if jobs is None:
+        from multiprocessing import cpu_count
+        return cpu_count()
+    return jobs
+
+
+class _Preprocessing(object):
+    """ A file handed to the threads of _preprocess_ahead. result is the
+        preprocessed text, or the exception that kept it from being
+        preprocessed, once done is set. error is any other exception
+        preprocessing raised, which finished() raises again.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def finished(self):
+        """ Waits for the file to be preprocessed, and returns (filename,
+            result).
+        """
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.filename, self.result
+
+
+def _preprocess_ahead(filenames, cpp_path, cpp_args, cpp_cache, cpp_jobs,
+                      window):
+    """ Yields (filename, text) for each of filenames in order, where text is
+        the output of cpp or the exception from running it. cpp_jobs threads
+        preprocess the files, and the next files are only taken from
+        filenames while fewer than window of them are preprocessed or being
+        preprocessed and not yet yielded.
+    """
+    tasks = queue.Queue()
 
-        Errors from cpp will be printed out.
+    def work():
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            try:
+                task.result = preprocess_file(task.filename, cpp_path,
+                                              cpp_args, cpp_cache)
+            except (IOError, OSError, RuntimeError) as e:
+                task.result = e
+            except Exception as e:
+                # Raised in the caller's thread, as it would be without
+                # the threads.
+                task.error = e
+            finally:
+                task.done.set()
+
+    threads = [threading.Thread(target=work) for i in range(cpp_jobs)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    pending = deque()
+    try:
+        for filename in filenames:
+            task = _Preprocessing(filename)
+            tasks.put(task)
+            pending.append(task)
+            if len(pending) >= window:
+                yield pending.popleft().finished()
+
+        while pending:
+            yield pending.popleft().finished()
+    finally:
+        # If the caller stopped early, drop the files no thread has started
+        # on yet; the threads finish the ones they're running and exit.
+        try:
+            while True:
+                tasks.get_nowait()
+        except queue.Empty:
+            pass
+        for thread in threads:
+            tasks.put(None)
+
+
+def _parse_texts(texts, parser, jobs, ast_cache=None):
+    """ Parses the (filename, text) pairs from texts, where text may also be
+        an exception to pass through, yielding (filename, result) in order.
+        With more than one job, at most 2 * jobs texts are given to the
+        workers at once, so texts is only consumed as fast as they parse.
+    """
+    if jobs == 1:
+        if parser is None:
+            parser = CParser()
+        for filename, text in texts:
+            yield filename, _parse_text(parser, filename, text, ast_cache)
+        return
+
+    from multiprocessing import Pool
+
+    jobs = _count(jobs)
+    pool = Pool(jobs, _init_worker)
+    try:
+        work = ((filename, (filename, text, ast_cache))
+                    for filename, text in texts)
+        for result in _map_in_order(pool, _parse_text_in_worker, work,
+                                    2 * jobs, _parse_text, parser):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _map_in_order(pool, func, work, window, parse_here, parser):
+    """ Runs func(*args) in pool for the (filename, args) pairs from work,
+        yielding (filename, result) in order. At most window of them are
+        given to pool at once, so work is only consumed as fast as the
+        results are taken. A result that can't be sent back from a worker,
+        like the AST of a file too deeply nested to pickle, is made in this
+        process instead, by parse_here(parser, *args), with a new CParser if
+        parser is None.
     """
+    from multiprocessing.pool import MaybeEncodingError
+
+    pending = deque()
+    parsers = [parser]
+
+    def finished():
+        filename, args, result = pending.popleft()
+        try:
+            return filename, result.get()
+        except MaybeEncodingError:
+            if parsers[0] is None:
+                parsers[0] = CParser()
+            return filename, parse_here(parsers[0], *args)
+
+    for filename, args in work:
+        pending.append((filename, args, pool.apply_async(func, args)))
+        if len(pending) >= window:
+            yield finished()
+
+    while pending:
+        yield finished()
+
+
+def _read_file(filename, use_cpp, cpp_path, cpp_args, cpp_cache=None,
+               preprocessor=None):
+    if use_cpp and preprocessor is not None:
+        return preprocessor.preprocess(filename)
     if use_cpp:
-        text = preprocess_file(filename, cpp_path, cpp_args)
-    else:
-        with open(filename, 'rU') as f:
-            text = f.read()
+        return preprocess_file(filename, cpp_path, cpp_args, cpp_cache)
+
+    # Python 3 always reads with universal newlines, and no longer
+    # accepts the U mode.
+    with open(filename, 'rU' if sys.version_info[0] < 3 else 'r') as f:
+        return f.read()
+
+
+def _parse_one(parser, filename, use_cpp, cpp_path, cpp_args, cpp_cache,
+               preprocessor=None, ast_cache=None):
+    try:
+        text = _read_file(filename, use_cpp, cpp_path, cpp_args, cpp_cache,
+                          preprocessor)
+    except (IOError, OSError, RuntimeError) as e:
+        return e
+    return _parse_text(parser, filename, text, ast_cache)
+
+
+def _parse_text(parser, filename, text, ast_cache=None):
+    if isinstance(text, Exception):
+        return text
+    try:
+        return _parse_cached(parser, filename, text, ast_cache)
+    except (ParseError, RuntimeError) as e:
+        return e
+
+
+def _parse_cached(parser, filename, text, ast_cache):
+    # Parses text with parser, or a new CParser if it's None, unless its AST
+    # is in ast_cache.
+    if ast_cache is not None:
+        key = ast_cache.key(text, filename)
+        ast = ast_cache.get(key)
+        if ast is not None:
+            return ast
 
     if parser is None:
         parser = CParser()
-    return parser.parse(text, filename)
+    ast = parser.parse(text, filename)
+    if ast_cache is not None:
+        ast_cache.put(key, ast)
+    return ast
+
+
+# The parser and preprocessor of a parse_files worker process.
+_worker_parser = None
+_worker_preprocessor = None
+
+
+def _init_worker(preprocessor=None):
+    global _worker_parser, _worker_preprocessor
+    _worker_parser = CParser()
+    _worker_preprocessor = preprocessor
+
+
+def _parse_in_worker(filename, use_cpp, cpp_path, cpp_args, cpp_cache,
+                     ast_cache):
+    return _parse_one(_worker_parser, filename, use_cpp, cpp_path,
+                                cpp_args, cpp_cache, _worker_preprocessor,
+                                ast_cache)
+
+
+def _parse_text_in_worker(filename, text, ast_cache=None):
+    return _parse_text(_worker_parser, filename, text, ast_cache)
@@ -10,6 +10,7 @@
 # Copyright (C) 2008-2015, Eli Bendersky
 # License: BSD
 #-----------------------------------------------------------------
+import hashlib
 import pprint
 from string import Template
 
@@ -30,11 +31,26 @@ class ASTCodeGenerator(object):
             cfg_filename=self.cfg_filename)
 
         src += _PROLOGUE_CODE
-        for node_cfg in self.node_cfg:
-            src += node_cfg.generate_source() + '\n\n'
-
+        for code, node_cfg in enumerate(self.node_cfg, 1):
+            src += node_cfg.generate_source(code) + '\n\n'
+
+        src += Template(_EPILOGUE_CODE).substitute(
+            cfg_filename=self.cfg_filename,
+            schema=self.schema(),
+            loaders=''.join('    %s._load,\n' % node_cfg.name
+                            for node_cfg in self.node_cfg))
         file.write(src)
 
+    def schema(self):
+        """ A hash of the node definitions and of the layout of the records
+            _dump() writes, which changes whenever either does.
+        """
+        definitions = [(node_cfg.name, node_cfg.contents)
+                       for node_cfg in self.node_cfg]
+        h = hashlib.sha1()
+        h.update(repr((_RECORD_LAYOUT, definitions)).encode('utf-8'))
+        return h.hexdigest()
+
     def parse_cfgfile(self, filename):
         """ Parse the configuration file and yield pairs of
             (name, contents) for each node.
@@ -65,6 +81,7 @@ class NodeCfg(object):
     """
     def __init__(self, name, contents):
         self.name = name
+        self.contents = contents
         self.all_entries = []
         self.attr = []
         self.child = []
@@ -81,10 +98,21 @@ class NodeCfg(object):
             else:
                 self.attr.append(entry)
 
-    def generate_source(self):
+            if clean_entry in _LOAD_LOCALS:
+                raise RuntimeError("Entry %r of %s is a local of _load" % (
+                    clean_entry, name))
+
+    def generate_source(self, code):
+        """ The source of the node class. code is the number that tells
+            its records from those of the other classes.
+        """
         src = self._gen_init()
         src += '\n' + self._gen_children()
+        src += '\n' + self._gen_iter_children()
+        src += '\n' + self._gen_dump(code)
+        src += '\n' + self._gen_load()
         src += '\n' + self._gen_attr_names()
+        src += '\n' + self._gen_child_names()
         return src
 
     def _gen_init(self):
@@ -92,14 +120,19 @@ class NodeCfg(object):
 
         if self.all_entries:
             args = ', '.join(self.all_entries)
+            slots = ', '.join("'{0}'".format(e) for e in self.all_entries)
+            slots += ", '_coord', '_annotations', '__weakref__'"
             arglist = '(self, %s, coord=None)' % args
         else:
+            slots = "'_coord', '_annotations', '__weakref__'"
             arglist = '(self, coord=None)'
 
+        src += "    __slots__ = (%s)\n" % slots
         src += "    def __init__%s:\n" % arglist
 
-        for name in self.all_entries + ['coord']:
+        for name in self.all_entries:
             src += "        self.%s = %s\n" % (name, name)
+        src += "        self._coord = coord\n"
 
         return src
 
@@ -127,10 +160,101 @@ class NodeCfg(object):
 
         return src
 
+    def _gen_iter_children(self):
+        src = '    def iter_children(self):\n'
+
+        if self.child or self.seq_child:
+            for child in self.child:
+                src += (
+                    '        if self.%(child)s is not None:\n'
+                    '            yield self.%(child)s\n') % dict(child=child)
+
+            for seq_child in self.seq_child:
+                src += (
+                    '        for child in (self.%(child)s or []):\n'
+                    '            yield child\n') % dict(child=seq_child)
+        else:
+            src += '        return iter(())\n'
+
+        return src
+
+    def _gen_dump(self, code):
+        # The record of a node is its code, its position, an entry for each
+        # attribute, 1 or 0 for each child that is there or None, and the
+        # length of each sequence of children, or -1 for None.
+        src = '    def _dump(self, codes, value, position):\n'
+        src += '        codes.extend((\n'
+        src += '            %d,\n' % code
+        src += '            position(self._coord),\n'
+        for attr in self.attr:
+            src += '            value(self.%s),\n' % attr
+        for child in self.child:
+            src += '            0 if self.%s is None else 1,\n' % child
+        for seq_child in self.seq_child:
+            src += '            -1 if self.%(c)s is None else len(self.%(c)s),\n' % (
+                dict(c=seq_child))
+        src += '        ))\n'
+        return src
+
+    def _gen_load(self):
+        # The children of the node are on top of the stack, in the order
+        # of iter_children(), so they are taken off in reverse.
+        src = '    @staticmethod\n'
+        src += '    def _load(codes, i, table, positions, stack):\n'
+
+        offset = 2
+        for attr in self.attr:
+            src += (
+                '        c = codes[i + %(offset)d]\n'
+                '        %(attr)s = table[c] if c >= 0 else list(table[~c])\n') % (
+                    dict(offset=offset, attr=attr))
+            offset += 1
+
+        child_offsets = []
+        for child in self.child:
+            child_offsets.append((child, offset))
+            offset += 1
+        seq_offsets = []
+        for seq_child in self.seq_child:
+            seq_offsets.append((seq_child, offset))
+            offset += 1
+
+        for seq_child, seq_offset in reversed(seq_offsets):
+            src += (
+                '        n = codes[i + %(offset)d]\n'
+                '        if n < 0:\n'
+                '            %(child)s = None\n'
+                '        else:\n'
+                '            %(child)s = stack[len(stack) - n:]\n'
+                '            del stack[len(stack) - n:]\n') % (
+                    dict(offset=seq_offset, child=seq_child))
+        for child, child_offset in reversed(child_offsets):
+            src += '        %s = stack.pop() if codes[i + %d] else None\n' % (
+                child, child_offset)
+
+        args = ''.join('%s, ' % e for e in self.all_entries)
+        src += '        stack.append(%s(%spositions[codes[i + 1]]))\n' % (
+            self.name, args)
+        src += '        return i + %d\n' % offset
+        return src
+
     def _gen_attr_names(self):
         src = "    attr_names = (" + ''.join("%r, " % nm for nm in self.attr) + ')'
         return src
 
+    def _gen_child_names(self):
+        src = "    child_names = (" + ''.join(
+            "%r, " % nm for nm in self.child + self.seq_child) + ')'
+        return src
+
+
+# The names _load uses for its own locals, which entries can't have.
+_LOAD_LOCALS = frozenset(['codes', 'i', 'table', 'positions', 'stack', 'c', 'n'])
+
+# The version of the layout of the records _dump writes, part of the schema.
+# Bump it when _gen_dump or _gen_load change what a record holds.
+_RECORD_LAYOUT = 1
+
 
 _PROLOGUE_COMMENT = \
 r'''#-----------------------------------------------------------------
@@ -155,15 +279,79 @@ r'''#-----------------------------------------------------------------
 _PROLOGUE_CODE = r'''
 import sys
 
+from .plyparser import Coord, position_coord
+
 
 class Node(object):
     """ Abstract base class for AST nodes.
     """
+    __slots__ = ()
     def children(self):
         """ A sequence of all children that are Nodes
         """
         pass
 
+    def iter_children(self):
+        """ Iterates over the children that are Nodes, in the same order
+            as children(), without building a sequence of (name, child)
+            pairs. The names of the attributes holding children are in
+            the class attribute child_names.
+        """
+        pass
+
+    def annotate(self, key, value):
+        """ Attaches value to the node under key, for analyses that need
+            to keep their own data on nodes. The dictionary holding the
+            annotations is only created for the first one, so nodes that
+            aren't annotated stay as small as their slots.
+        """
+        try:
+            annotations = self._annotations
+        except AttributeError:
+            annotations = self._annotations = {}
+        annotations[key] = value
+
+    def annotation(self, key, default=None):
+        """ The value annotated under key, or default if there is none.
+        """
+        try:
+            return self._annotations.get(key, default)
+        except AttributeError:
+            return default
+
+    def clear_annotations(self):
+        """ Removes every annotation from the node.
+        """
+        try:
+            del self._annotations
+        except AttributeError:
+            pass
+
+    @property
+    def coord(self):
+        """ The Coord of the node, or None. The parser gives the nodes it
+            builds a compact position instead, and their Coord is only
+            built, and kept, when this is first read.
+        """
+        coord = self._coord
+        if coord is not None and not isinstance(coord, Coord):
+            coord = self._coord = position_coord(coord)
+        return coord
+
+    @coord.setter
+    def coord(self, coord):
+        self._coord = coord
+
+    def __getstate__(self):
+        # A pickled node holds its Coord, not the position the parser gave
+        # it, so a copy doesn't depend on how positions are represented.
+        state = {}
+        for name in self.__slots__:
+            if name != '__weakref__' and hasattr(self, name):
+                state[name] = getattr(self, name)
+        state['_coord'] = self.coord
+        return None, state
+
     def show(self, buf=sys.stdout, offset=0, attrnames=False, nodenames=False, showcoord=False, _my_node_name=None):
         """ Pretty print the Node and all its attributes and
             children (recursively) to a buffer.
@@ -215,6 +403,81 @@ class Node(object):
                 _my_node_name=child_name)
 
 
+def walk(node, enter=None, exit=None):
+    """ Walks the tree under node depth first, keeping the nodes still to
+        be visited on an explicit stack instead of recursing, so that deep
+        trees (long else-if chains, long && chains) can't exceed the
+        recursion limit.
+
+        enter(node, parent) is called before the children of a node are
+        walked, and exit(node, parent) after them. parent is None for the
+        node the walk starts from. If enter returns False, the children of
+        that node are skipped; exit is still called for it.
+    """
+    if enter is None or enter(node, None) is not False:
+        stack = [(node, None, node.iter_children())]
+    else:
+        stack = [(node, None, iter(()))]
+
+    while stack:
+        parent, grandparent, children = stack[-1]
+        for child in children:
+            if enter is None or enter(child, parent) is not False:
+                stack.append((child, parent, child.iter_children()))
+                break
+            elif exit is not None:
+                exit(child, parent)
+        else:
+            stack.pop()
+            if exit is not None:
+                exit(parent, grandparent)
+
+
+def preorder(node):
+    """ Yields node and every node under it, each before its children.
+    """
+    yield node
+    stack = [node.iter_children()]
+    while stack:
+        for child in stack[-1]:
+            yield child
+            stack.append(child.iter_children())
+            break
+        else:
+            stack.pop()
+
+
+def postorder(node):
+    """ Yields node and every node under it, each after its children.
+    """
+    stack = [(node, node.iter_children())]
+    while stack:
+        parent, children = stack[-1]
+        for child in children:
+            stack.append((child, child.iter_children()))
+            break
+        else:
+            stack.pop()
+            yield parent
+
+
+def _function(method):
+    # The plain function behind a method, bound or unbound.
+    return getattr(method, '__func__', method)
+
+
+def _class_cache(cls, name):
+    # The dict stored as attribute `name` of cls itself, not inherited,
+    # created the first time it's asked for. Caches kept in the class they're
+    # for go away with it, unlike a module-level dict keyed by class.
+    try:
+        return cls.__dict__[name]
+    except KeyError:
+        cache = {}
+        setattr(cls, name, cache)
+        return cache
+
+
 class NodeVisitor(object):
     """ A base NodeVisitor class for visiting c_ast nodes.
         Subclass it and define your own visit_XXX methods, where
@@ -245,24 +508,125 @@ class NodeVisitor(object):
             generic_visit() on the node.
             You can use:
                 NodeVisitor.generic_visit(self, node)
+        *   A visit_XXX method or generic_visit set on the visitor
+            object itself, rather than its class, is used as long as it's
+            set before the visitor first visits a node.
         *   Modeled after Python's own AST visiting facilities
             (the ast module of Python 3.0)
     """
+    # Each visitor class keeps a _dispatch dict in its own __dict__ (see
+    # _class_cache) with the method that visits each node class, as a plain
+    # function: visit_XXX, or generic_visit if there is none, along with the
+    # name of visit_XXX. It also records in _overrides_visit whether it
+    # overrides visit().
+
+    def _lookup(self, node):
+        cls = self.__class__
+        name = 'visit_' + node.__class__.__name__
+        method = getattr(cls, name, cls.generic_visit)
+        entry = (_function(method), name)
+        _class_cache(cls, '_dispatch')[node.__class__] = entry
+        return entry
+
+    def _has_own_methods(self):
+        # Whether visit_XXX methods or generic_visit were set on this
+        # visitor itself rather than its class, which the dispatch tables
+        # don't know about. Checked the first time it visits a node and
+        # kept in _own_methods, so other visitors take the fast path.
+        own = self.__dict__
+        try:
+            return own['_own_methods']
+        except KeyError:
+            found = 'generic_visit' in own or any(
+                name.startswith('visit_') for name in own)
+            self._own_methods = found
+            return found
+
+    def _own_method(self, name):
+        # The visit_XXX method of this visitor if it was set on the instance
+        # rather than its class, or the generic_visit falling back for it.
+        own = self.__dict__
+        if name in own or 'generic_visit' in own:
+            return getattr(self, name, self.generic_visit)
+        return None
+
     def visit(self, node):
         """ Visit a node.
         """
-        method = 'visit_' + node.__class__.__name__
-        visitor = getattr(self, method, self.generic_visit)
-        return visitor(node)
+        try:
+            method, name = self.__class__.__dict__['_dispatch'][node.__class__]
+        except KeyError:
+            method, name = self._lookup(node)
+        try:
+            has_own_methods = self.__dict__['_own_methods']
+        except KeyError:
+            has_own_methods = self._has_own_methods()
+        if has_own_methods:
+            own = self._own_method(name)
+            if own is not None:
+                return own(node)
+        return method(self, node)
 
     def generic_visit(self, node):
         """ Called if no explicit visitor function exists for a
             node. Implements preorder visiting of the node.
+
+            The nodes under node are walked with walk(), so nodes that
+            have no visit_XXX method don't cost a level of recursion each.
+            If the visitor class overrides visit(), each child is given to
+            it instead.
         """
-        for c_name, c in node.children():
-            self.visit(c)
+        cls = self.__class__
+        try:
+            overrides_visit = cls.__dict__['_overrides_visit']
+        except KeyError:
+            overrides_visit = _function(cls.visit) is not _visit
+            cls._overrides_visit = overrides_visit
+        if overrides_visit:
+            for child in node.iter_children():
+                self.visit(child)
+            return
+
+        dispatch = _class_cache(cls, '_dispatch')
+        has_own_methods = self._has_own_methods()
+
+        def enter(child, parent):
+            if parent is None:
+                return True
+
+            try:
+                method, name = dispatch[child.__class__]
+            except KeyError:
+                method, name = self._lookup(child)
+
+            if has_own_methods:
+                own = self._own_method(name)
+                if own is not None:
+                    own(child)
+                    return False
+            if method is _generic_visit:
+                return True
+            method(self, child)
+            return False
+
+        walk(node, enter)
+
+
+_visit = _function(NodeVisitor.visit)
+_generic_visit = _function(NodeVisitor.generic_visit)
+
+
+'''
 
+_EPILOGUE_CODE = r'''# A hash of the node definitions in $cfg_filename and of the layout of
+# the records written by Node._dump(), so that astcache only loads trees
+# written for the same nodes.
+SCHEMA = '$schema'
 
+# Node._load of each record code, for astcache.
+_loaders = (
+    None,
+$loaders)
 '''
 
 
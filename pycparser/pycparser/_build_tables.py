@@ -24,10 +24,11 @@ from pycparser import c_parser
 c_parser.CParser(
     lex_optimize=True,
     yacc_debug=False,
-    yacc_optimize=True)
+    yacc_optimize=True,
+    tabcache=False)
 
 # Load to compile into .pyc
 #
 import lextab
 import yacctab
-import c_ast
+from pycparser import c_ast
@@ -0,0 +1,221 @@
+#-----------------------------------------------------------------
+# pycparser: astcache.py
+#
+# Compact binary serialization of c_ast trees, and an on-disk
+# cache of the ASTs of preprocessed C files built on it, so that
+# text that was parsed before isn't parsed again.
+#
+# Copyright (C) 2008-2015, Eli Bendersky
+# License: BSD
+#-----------------------------------------------------------------
+import gc
+import hashlib
+import marshal
+import os
+import struct
+import tempfile
+import zlib
+
+from . import c_ast
+from .cppcache import cache_subdir, evict
+from .plyparser import Coord, position, position_coord
+
+
+# The version of the format around the records of c_ast, written after the
+# magic bytes along with the version of marshal and c_ast.SCHEMA.
+FORMAT_VERSION = 1
+
+_MAGIC = b'PYCAST'
+_HEADER = struct.Struct('<6sBB40s')
+
+
+class SchemaError(ValueError):
+    """ Raised by loads() for data written by another version of the format
+        or of c_ast.
+    """
+    pass
+
+
+def dumps(node):
+    """ Returns node and the tree under it serialized as bytes, which
+        loads() turns back into an equal tree.
+
+        The attributes of the nodes may be None, strings, numbers or lists
+        of them. The coord of a node is kept as its file and line; a column
+        isn't.
+    """
+    # Every distinct attribute value and position is stored once, and the
+    # records refer to it by index. A list is stored as a tuple, and
+    # referred to by the complement of its index, so that loads() gives
+    # each node its own list.
+    table = []
+    table_indexes = {}
+
+    def value(v):
+        cls = v.__class__
+        key = (cls, tuple(v) if cls is list else v)
+        try:
+            return table_indexes[key]
+        except KeyError:
+            index = len(table)
+            table.append(key[1])
+            code = table_indexes[key] = ~index if cls is list else index
+            return code
+
+    # Index 0 is None; a position is stored as the index of its file in
+    # files and its line.
+    files = []
+    file_indexes = {}
+    lines = [None]
+    position_indexes = {None: 0}
+
+    def node_position(coord):
+        if isinstance(coord, Coord):
+            coord = position(coord.file, coord.line)
+        try:
+            return position_indexes[coord]
+        except KeyError:
+            c = position_coord(coord)
+            file_index = file_indexes.get(c.file)
+            if file_index is None:
+                file_index = file_indexes[c.file] = len(files)
+                files.append(c.file)
+            index = position_indexes[coord] = len(lines)
+            lines.append((file_index, c.line))
+            return index
+
+    codes = []
+    for n in c_ast.postorder(node):
+        n._dump(codes, value, node_position)
+
+    payload = marshal.dumps((tuple(table), tuple(files), tuple(lines), codes))
+    header = _HEADER.pack(_MAGIC, FORMAT_VERSION, marshal.version,
+                          c_ast.SCHEMA.encode('ascii'))
+    return header + zlib.compress(payload)
+
+
+def loads(data):
+    """ Returns the tree serialized in data by dumps(). SchemaError is
+        raised if data was written by another version of the format or of
+        c_ast, and ValueError if it's corrupt.
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError('Not a serialized AST')
+    magic, version, marshal_version, schema = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise ValueError('Not a serialized AST')
+    if (version != FORMAT_VERSION or marshal_version != marshal.version or
+            schema != c_ast.SCHEMA.encode('ascii')):
+        raise SchemaError('AST serialized with a different schema')
+
+    try:
+        payload = zlib.decompress(data[_HEADER.size:])
+        table, files, lines, codes = marshal.loads(payload)
+    except (zlib.error, EOFError, TypeError, ValueError):
+        raise ValueError('Corrupt serialized AST')
+
+    # The nodes get positions, like those the parser gives them.
+    positions = [None]
+    for file_index, line in lines[1:]:
+        positions.append(position(files[file_index], line))
+
+    # Nothing made here is garbage, and the collections that the many new
+    # nodes would set off take several times longer than building them.
+    loaders = c_ast._loaders
+    stack = []
+    i = 0
+    end = len(codes)
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        while i < end:
+            i = loaders[codes[i]](codes, i, table, positions, stack)
+    except (IndexError, TypeError):
+        raise ValueError('Corrupt serialized AST')
+    finally:
+        if collecting:
+            gc.enable()
+    if len(stack) != 1:
+        raise ValueError('Corrupt serialized AST')
+    return stack[0]
+
+
+class ParseCache(object):
+    """ Cache of the ASTs of preprocessed C text.
+
+        An entry is keyed by a hash of the text and of the file name it was
+        parsed with, and holds the AST serialized by dumps(). Entries
+        written by another version of c_ast aren't used, and are replaced
+        when the text is parsed again.
+
+        directory:
+            Where to keep the entries. Defaults to an ast directory in
+            tablecache.cache_dir(). If there is no usable directory,
+            nothing is cached.
+
+        max_size:
+            The most bytes the entries may take up. When new entries make
+            them take more, the least recently used ones are removed until
+            they take up three quarters of it, as in
+            cppcache.PreprocessCache.
+    """
+    def __init__(self, directory=None, max_size=256 * 1024 * 1024):
+        self.directory = cache_subdir(directory, 'ast')
+        self.max_size = max_size
+        self._size = None
+
+    def key(self, text, filename):
+        """ Returns the key of the entry for text, parsed as filename.
+        """
+        h = hashlib.sha1()
+        h.update(text.encode('utf-8'))
+        h.update(b'\0')
+        h.update(filename.encode('utf-8'))
+        return h.hexdigest()
+
+    def get(self, key):
+        """ Returns the cached AST for key, or None if there is none or it
+            was written by another version of c_ast.
+        """
+        if self.directory is None:
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                ast = loads(f.read())
+        except (IOError, OSError, ValueError):
+            return None
+
+        # The modification time of an entry is when it was last used.
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return ast
+
+    def put(self, key, ast):
+        """ Caches ast, the result of parsing the text of key.
+        """
+        if self.directory is None:
+            return
+
+        data = dumps(ast)
+        try:
+            fd, tmp = tempfile.mkstemp(prefix='.tmp', dir=self.directory)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            getattr(os, 'replace', os.rename)(tmp, self._path(key))
+        except (IOError, OSError):
+            return
+
+        # Only count the entries again when the count crosses max_size.
+        if self._size is not None and \
+                self._size + len(data) <= self.max_size:
+            self._size += len(data)
+        else:
+            self._size = evict(self.directory, '.ast', self.max_size,
+                               self.max_size * 3 // 4)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.ast')
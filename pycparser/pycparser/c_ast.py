@@ -18,16 +18,79 @@
 
 import sys
 
+from .plyparser import Coord, position_coord
+
 
 class Node(object):
-    __slots__ = ()
     """ Abstract base class for AST nodes.
     """
+    __slots__ = ()
     def children(self):
         """ A sequence of all children that are Nodes
         """
         pass
 
+    def iter_children(self):
+        """ Iterates over the children that are Nodes, in the same order
+            as children(), without building a sequence of (name, child)
+            pairs. The names of the attributes holding children are in
+            the class attribute child_names.
+        """
+        pass
+
+    def annotate(self, key, value):
+        """ Attaches value to the node under key, for analyses that need
+            to keep their own data on nodes. The dictionary holding the
+            annotations is only created for the first one, so nodes that
+            aren't annotated stay as small as their slots.
+        """
+        try:
+            annotations = self._annotations
+        except AttributeError:
+            annotations = self._annotations = {}
+        annotations[key] = value
+
+    def annotation(self, key, default=None):
+        """ The value annotated under key, or default if there is none.
+        """
+        try:
+            return self._annotations.get(key, default)
+        except AttributeError:
+            return default
+
+    def clear_annotations(self):
+        """ Removes every annotation from the node.
+        """
+        try:
+            del self._annotations
+        except AttributeError:
+            pass
+
+    @property
+    def coord(self):
+        """ The Coord of the node, or None. The parser gives the nodes it
+            builds a compact position instead, and their Coord is only
+            built, and kept, when this is first read.
+        """
+        coord = self._coord
+        if coord is not None and not isinstance(coord, Coord):
+            coord = self._coord = position_coord(coord)
+        return coord
+
+    @coord.setter
+    def coord(self, coord):
+        self._coord = coord
+
+    def __getstate__(self):
+        # A pickled node holds its Coord, not the position the parser gave
+        # it, so a copy doesn't depend on how positions are represented.
+        state = {}
+        for name in self.__slots__:
+            if name != '__weakref__' and hasattr(self, name):
+                state[name] = getattr(self, name)
+        state['_coord'] = self.coord
+        return None, state
+
     def show(self, buf=sys.stdout, offset=0, attrnames=False, nodenames=False, showcoord=False, _my_node_name=None):
         """ Pretty print the Node and all its attributes and
             children (recursively) to a buffer.
@@ -79,6 +142,81 @@ class Node(object):
                 _my_node_name=child_name)
 
 
+def walk(node, enter=None, exit=None):
+    """ Walks the tree under node depth first, keeping the nodes still to
+        be visited on an explicit stack instead of recursing, so that deep
+        trees (long else-if chains, long && chains) can't exceed the
+        recursion limit.
+
+        enter(node, parent) is called before the children of a node are
+        walked, and exit(node, parent) after them. parent is None for the
+        node the walk starts from. If enter returns False, the children of
+        that node are skipped; exit is still called for it.
+    """
+    if enter is None or enter(node, None) is not False:
+        stack = [(node, None, node.iter_children())]
+    else:
+        stack = [(node, None, iter(()))]
+
+    while stack:
+        parent, grandparent, children = stack[-1]
+        for child in children:
+            if enter is None or enter(child, parent) is not False:
+                stack.append((child, parent, child.iter_children()))
+                break
+            elif exit is not None:
+                exit(child, parent)
+        else:
+            stack.pop()
+            if exit is not None:
+                exit(parent, grandparent)
+
+
+def preorder(node):
+    """ Yields node and every node under it, each before its children.
+    """
+    yield node
+    stack = [node.iter_children()]
+    while stack:
+        for child in stack[-1]:
+            yield child
+            stack.append(child.iter_children())
+            break
+        else:
+            stack.pop()
+
+
+def postorder(node):
+    """ Yields node and every node under it, each after its children.
+    """
+    stack = [(node, node.iter_children())]
+    while stack:
+        parent, children = stack[-1]
+        for child in children:
+            stack.append((child, child.iter_children()))
+            break
+        else:
+            stack.pop()
+            yield parent
+
+
+def _function(method):
+    # The plain function behind a method, bound or unbound.
+    return getattr(method, '__func__', method)
+
+
+def _class_cache(cls, name):
+    # The dict stored as attribute `name` of cls itself, not inherited,
+    # created the first time it's asked for. Caches kept in the class they're
+    # for go away with it, unlike a module-level dict keyed by class.
+    try:
+        return cls.__dict__[name]
+    except KeyError:
+        cache = {}
+        setattr(cls, name, cache)
+        return cache
+
+
 class NodeVisitor(object):
     """ A base NodeVisitor class for visiting c_ast nodes.
         Subclass it and define your own visit_XXX methods, where
@@ -109,31 +247,121 @@ class NodeVisitor(object):
             generic_visit() on the node.
             You can use:
                 NodeVisitor.generic_visit(self, node)
+        *   A visit_XXX method or generic_visit set on the visitor
+            object itself, rather than its class, is used as long as it's
+            set before the visitor first visits a node.
         *   Modeled after Python's own AST visiting facilities
             (the ast module of Python 3.0)
     """
+    # Each visitor class keeps a _dispatch dict in its own __dict__ (see
+    # _class_cache) with the method that visits each node class, as a plain
+    # function: visit_XXX, or generic_visit if there is none, along with the
+    # name of visit_XXX. It also records in _overrides_visit whether it
+    # overrides visit().
+
+    def _lookup(self, node):
+        cls = self.__class__
+        name = 'visit_' + node.__class__.__name__
+        method = getattr(cls, name, cls.generic_visit)
+        entry = (_function(method), name)
+        _class_cache(cls, '_dispatch')[node.__class__] = entry
+        return entry
+
+    def _has_own_methods(self):
+        # Whether visit_XXX methods or generic_visit were set on this
+        # visitor itself rather than its class, which the dispatch tables
+        # don't know about. Checked the first time it visits a node and
+        # kept in _own_methods, so other visitors take the fast path.
+        own = self.__dict__
+        try:
+            return own['_own_methods']
+        except KeyError:
+            found = 'generic_visit' in own or any(
+                name.startswith('visit_') for name in own)
+            self._own_methods = found
+            return found
+
+    def _own_method(self, name):
+        # The visit_XXX method of this visitor if it was set on the instance
+        # rather than its class, or the generic_visit falling back for it.
+        own = self.__dict__
+        if name in own or 'generic_visit' in own:
+            return getattr(self, name, self.generic_visit)
+        return None
+
     def visit(self, node):
         """ Visit a node.
         """
-        method = 'visit_' + node.__class__.__name__
-        visitor = getattr(self, method, self.generic_visit)
-        return visitor(node)
+        try:
+            method, name = self.__class__.__dict__['_dispatch'][node.__class__]
+        except KeyError:
+            method, name = self._lookup(node)
+        try:
+            has_own_methods = self.__dict__['_own_methods']
+        except KeyError:
+            has_own_methods = self._has_own_methods()
+        if has_own_methods:
+            own = self._own_method(name)
+            if own is not None:
+                return own(node)
+        return method(self, node)
 
     def generic_visit(self, node):
         """ Called if no explicit visitor function exists for a
             node. Implements preorder visiting of the node.
+
+            The nodes under node are walked with walk(), so nodes that
+            have no visit_XXX method don't cost a level of recursion each.
+            If the visitor class overrides visit(), each child is given to
+            it instead.
         """
-        for c_name, c in node.children():
-            self.visit(c)
+        cls = self.__class__
+        try:
+            overrides_visit = cls.__dict__['_overrides_visit']
+        except KeyError:
+            overrides_visit = _function(cls.visit) is not _visit
+            cls._overrides_visit = overrides_visit
+        if overrides_visit:
+            for child in node.iter_children():
+                self.visit(child)
+            return
+
+        dispatch = _class_cache(cls, '_dispatch')
+        has_own_methods = self._has_own_methods()
+
+        def enter(child, parent):
+            if parent is None:
+                return True
+
+            try:
+                method, name = dispatch[child.__class__]
+            except KeyError:
+                method, name = self._lookup(child)
+
+            if has_own_methods:
+                own = self._own_method(name)
+                if own is not None:
+                    own(child)
+                    return False
+            if method is _generic_visit:
+                return True
+            method(self, child)
+            return False
+
+        walk(node, enter)
+
+
+_visit = _function(NodeVisitor.visit)
+_generic_visit = _function(NodeVisitor.generic_visit)
 
 
 class ArrayDecl(Node):
-    __slots__ = ('type', 'dim', 'dim_quals', 'coord', '__weakref__')
+    __slots__ = ('type', 'dim', 'dim_quals', '_coord', '_annotations', '__weakref__')
     def __init__(self, type, dim, dim_quals, coord=None):
         self.type = type
         self.dim = dim
         self.dim_quals = dim_quals
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -141,14 +369,39 @@ class ArrayDecl(Node):
         if self.dim is not None: nodelist.append(("dim", self.dim))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.type is not None:
+            yield self.type
+        if self.dim is not None:
+            yield self.dim
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            1,
+            position(self._coord),
+            value(self.dim_quals),
+            0 if self.type is None else 1,
+            0 if self.dim is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        dim_quals = table[c] if c >= 0 else list(table[~c])
+        dim = stack.pop() if codes[i + 4] else None
+        type = stack.pop() if codes[i + 3] else None
+        stack.append(ArrayDecl(type, dim, dim_quals, positions[codes[i + 1]]))
+        return i + 5
+
     attr_names = ('dim_quals', )
+    child_names = ('type', 'dim', )
 
 class ArrayRef(Node):
-    __slots__ = ('name', 'subscript', 'coord', '__weakref__')
+    __slots__ = ('name', 'subscript', '_coord', '_annotations', '__weakref__')
     def __init__(self, name, subscript, coord=None):
         self.name = name
         self.subscript = subscript
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -156,15 +409,37 @@ class ArrayRef(Node):
         if self.subscript is not None: nodelist.append(("subscript", self.subscript))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.name is not None:
+            yield self.name
+        if self.subscript is not None:
+            yield self.subscript
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            2,
+            position(self._coord),
+            0 if self.name is None else 1,
+            0 if self.subscript is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        subscript = stack.pop() if codes[i + 3] else None
+        name = stack.pop() if codes[i + 2] else None
+        stack.append(ArrayRef(name, subscript, positions[codes[i + 1]]))
+        return i + 4
+
     attr_names = ()
+    child_names = ('name', 'subscript', )
 
 class Assignment(Node):
-    __slots__ = ('op', 'lvalue', 'rvalue', 'coord', '__weakref__')
+    __slots__ = ('op', 'lvalue', 'rvalue', '_coord', '_annotations', '__weakref__')
     def __init__(self, op, lvalue, rvalue, coord=None):
         self.op = op
         self.lvalue = lvalue
         self.rvalue = rvalue
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -172,15 +447,40 @@ class Assignment(Node):
         if self.rvalue is not None: nodelist.append(("rvalue", self.rvalue))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.lvalue is not None:
+            yield self.lvalue
+        if self.rvalue is not None:
+            yield self.rvalue
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            3,
+            position(self._coord),
+            value(self.op),
+            0 if self.lvalue is None else 1,
+            0 if self.rvalue is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        op = table[c] if c >= 0 else list(table[~c])
+        rvalue = stack.pop() if codes[i + 4] else None
+        lvalue = stack.pop() if codes[i + 3] else None
+        stack.append(Assignment(op, lvalue, rvalue, positions[codes[i + 1]]))
+        return i + 5
+
     attr_names = ('op', )
+    child_names = ('lvalue', 'rvalue', )
 
 class BinaryOp(Node):
-    __slots__ = ('op', 'left', 'right', 'coord', '__weakref__')
+    __slots__ = ('op', 'left', 'right', '_coord', '_annotations', '__weakref__')
     def __init__(self, op, left, right, coord=None):
         self.op = op
         self.left = left
         self.right = right
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -188,24 +488,64 @@ class BinaryOp(Node):
         if self.right is not None: nodelist.append(("right", self.right))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.left is not None:
+            yield self.left
+        if self.right is not None:
+            yield self.right
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            4,
+            position(self._coord),
+            value(self.op),
+            0 if self.left is None else 1,
+            0 if self.right is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        op = table[c] if c >= 0 else list(table[~c])
+        right = stack.pop() if codes[i + 4] else None
+        left = stack.pop() if codes[i + 3] else None
+        stack.append(BinaryOp(op, left, right, positions[codes[i + 1]]))
+        return i + 5
+
     attr_names = ('op', )
+    child_names = ('left', 'right', )
 
 class Break(Node):
-    __slots__ = ('coord', '__weakref__')
+    __slots__ = ('_coord', '_annotations', '__weakref__')
     def __init__(self, coord=None):
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         return ()
 
+    def iter_children(self):
+        return iter(())
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            5,
+            position(self._coord),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        stack.append(Break(positions[codes[i + 1]]))
+        return i + 2
+
     attr_names = ()
+    child_names = ()
 
 class Case(Node):
-    __slots__ = ('expr', 'stmts', 'coord', '__weakref__')
+    __slots__ = ('expr', 'stmts', '_coord', '_annotations', '__weakref__')
     def __init__(self, expr, stmts, coord=None):
         self.expr = expr
         self.stmts = stmts
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -214,14 +554,41 @@ class Case(Node):
             nodelist.append(("stmts[%d]" % i, child))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.expr is not None:
+            yield self.expr
+        for child in (self.stmts or []):
+            yield child
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            6,
+            position(self._coord),
+            0 if self.expr is None else 1,
+            -1 if self.stmts is None else len(self.stmts),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        n = codes[i + 3]
+        if n < 0:
+            stmts = None
+        else:
+            stmts = stack[len(stack) - n:]
+            del stack[len(stack) - n:]
+        expr = stack.pop() if codes[i + 2] else None
+        stack.append(Case(expr, stmts, positions[codes[i + 1]]))
+        return i + 4
+
     attr_names = ()
+    child_names = ('expr', 'stmts', )
 
 class Cast(Node):
-    __slots__ = ('to_type', 'expr', 'coord', '__weakref__')
+    __slots__ = ('to_type', 'expr', '_coord', '_annotations', '__weakref__')
     def __init__(self, to_type, expr, coord=None):
         self.to_type = to_type
         self.expr = expr
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -229,13 +596,35 @@ class Cast(Node):
         if self.expr is not None: nodelist.append(("expr", self.expr))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.to_type is not None:
+            yield self.to_type
+        if self.expr is not None:
+            yield self.expr
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            7,
+            position(self._coord),
+            0 if self.to_type is None else 1,
+            0 if self.expr is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        expr = stack.pop() if codes[i + 3] else None
+        to_type = stack.pop() if codes[i + 2] else None
+        stack.append(Cast(to_type, expr, positions[codes[i + 1]]))
+        return i + 4
+
     attr_names = ()
+    child_names = ('to_type', 'expr', )
 
 class Compound(Node):
-    __slots__ = ('block_items', 'coord', '__weakref__')
+    __slots__ = ('block_items', '_coord', '_annotations', '__weakref__')
     def __init__(self, block_items, coord=None):
         self.block_items = block_items
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -243,14 +632,37 @@ class Compound(Node):
             nodelist.append(("block_items[%d]" % i, child))
         return tuple(nodelist)
 
+    def iter_children(self):
+        for child in (self.block_items or []):
+            yield child
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            8,
+            position(self._coord),
+            -1 if self.block_items is None else len(self.block_items),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        n = codes[i + 2]
+        if n < 0:
+            block_items = None
+        else:
+            block_items = stack[len(stack) - n:]
+            del stack[len(stack) - n:]
+        stack.append(Compound(block_items, positions[codes[i + 1]]))
+        return i + 3
+
     attr_names = ()
+    child_names = ('block_items', )
 
 class CompoundLiteral(Node):
-    __slots__ = ('type', 'init', 'coord', '__weakref__')
+    __slots__ = ('type', 'init', '_coord', '_annotations', '__weakref__')
     def __init__(self, type, init, coord=None):
         self.type = type
         self.init = init
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -258,33 +670,91 @@ class CompoundLiteral(Node):
         if self.init is not None: nodelist.append(("init", self.init))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.type is not None:
+            yield self.type
+        if self.init is not None:
+            yield self.init
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            9,
+            position(self._coord),
+            0 if self.type is None else 1,
+            0 if self.init is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        init = stack.pop() if codes[i + 3] else None
+        type = stack.pop() if codes[i + 2] else None
+        stack.append(CompoundLiteral(type, init, positions[codes[i + 1]]))
+        return i + 4
+
     attr_names = ()
+    child_names = ('type', 'init', )
 
 class Constant(Node):
-    __slots__ = ('type', 'value', 'coord', '__weakref__')
+    __slots__ = ('type', 'value', '_coord', '_annotations', '__weakref__')
     def __init__(self, type, value, coord=None):
         self.type = type
         self.value = value
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
         return tuple(nodelist)
 
+    def iter_children(self):
+        return iter(())
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            10,
+            position(self._coord),
+            value(self.type),
+            value(self.value),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        type = table[c] if c >= 0 else list(table[~c])
+        c = codes[i + 3]
+        value = table[c] if c >= 0 else list(table[~c])
+        stack.append(Constant(type, value, positions[codes[i + 1]]))
+        return i + 4
+
     attr_names = ('type', 'value', )
+    child_names = ()
 
 class Continue(Node):
-    __slots__ = ('coord', '__weakref__')
+    __slots__ = ('_coord', '_annotations', '__weakref__')
     def __init__(self, coord=None):
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         return ()
 
+    def iter_children(self):
+        return iter(())
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            11,
+            position(self._coord),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        stack.append(Continue(positions[codes[i + 1]]))
+        return i + 2
+
     attr_names = ()
+    child_names = ()
 
 class Decl(Node):
-    __slots__ = ('name', 'quals', 'storage', 'funcspec', 'type', 'init', 'bitsize', 'coord', '__weakref__')
+    __slots__ = ('name', 'quals', 'storage', 'funcspec', 'type', 'init', 'bitsize', '_coord', '_annotations', '__weakref__')
     def __init__(self, name, quals, storage, funcspec, type, init, bitsize, coord=None):
         self.name = name
         self.quals = quals
@@ -293,7 +763,7 @@ class Decl(Node):
         self.type = type
         self.init = init
         self.bitsize = bitsize
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -302,13 +772,51 @@ class Decl(Node):
         if self.bitsize is not None: nodelist.append(("bitsize", self.bitsize))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.type is not None:
+            yield self.type
+        if self.init is not None:
+            yield self.init
+        if self.bitsize is not None:
+            yield self.bitsize
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            12,
+            position(self._coord),
+            value(self.name),
+            value(self.quals),
+            value(self.storage),
+            value(self.funcspec),
+            0 if self.type is None else 1,
+            0 if self.init is None else 1,
+            0 if self.bitsize is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        name = table[c] if c >= 0 else list(table[~c])
+        c = codes[i + 3]
+        quals = table[c] if c >= 0 else list(table[~c])
+        c = codes[i + 4]
+        storage = table[c] if c >= 0 else list(table[~c])
+        c = codes[i + 5]
+        funcspec = table[c] if c >= 0 else list(table[~c])
+        bitsize = stack.pop() if codes[i + 8] else None
+        init = stack.pop() if codes[i + 7] else None
+        type = stack.pop() if codes[i + 6] else None
+        stack.append(Decl(name, quals, storage, funcspec, type, init, bitsize, positions[codes[i + 1]]))
+        return i + 9
+
     attr_names = ('name', 'quals', 'storage', 'funcspec', )
+    child_names = ('type', 'init', 'bitsize', )
 
 class DeclList(Node):
-    __slots__ = ('decls', 'coord', '__weakref__')
+    __slots__ = ('decls', '_coord', '_annotations', '__weakref__')
     def __init__(self, decls, coord=None):
         self.decls = decls
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -316,13 +824,36 @@ class DeclList(Node):
             nodelist.append(("decls[%d]" % i, child))
         return tuple(nodelist)
 
+    def iter_children(self):
+        for child in (self.decls or []):
+            yield child
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            13,
+            position(self._coord),
+            -1 if self.decls is None else len(self.decls),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        n = codes[i + 2]
+        if n < 0:
+            decls = None
+        else:
+            decls = stack[len(stack) - n:]
+            del stack[len(stack) - n:]
+        stack.append(DeclList(decls, positions[codes[i + 1]]))
+        return i + 3
+
     attr_names = ()
+    child_names = ('decls', )
 
 class Default(Node):
-    __slots__ = ('stmts', 'coord', '__weakref__')
+    __slots__ = ('stmts', '_coord', '_annotations', '__weakref__')
     def __init__(self, stmts, coord=None):
         self.stmts = stmts
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -330,14 +861,37 @@ class Default(Node):
             nodelist.append(("stmts[%d]" % i, child))
         return tuple(nodelist)
 
+    def iter_children(self):
+        for child in (self.stmts or []):
+            yield child
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            14,
+            position(self._coord),
+            -1 if self.stmts is None else len(self.stmts),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        n = codes[i + 2]
+        if n < 0:
+            stmts = None
+        else:
+            stmts = stack[len(stack) - n:]
+            del stack[len(stack) - n:]
+        stack.append(Default(stmts, positions[codes[i + 1]]))
+        return i + 3
+
     attr_names = ()
+    child_names = ('stmts', )
 
 class DoWhile(Node):
-    __slots__ = ('cond', 'stmt', 'coord', '__weakref__')
+    __slots__ = ('cond', 'stmt', '_coord', '_annotations', '__weakref__')
     def __init__(self, cond, stmt, coord=None):
         self.cond = cond
         self.stmt = stmt
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -345,61 +899,155 @@ class DoWhile(Node):
         if self.stmt is not None: nodelist.append(("stmt", self.stmt))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.cond is not None:
+            yield self.cond
+        if self.stmt is not None:
+            yield self.stmt
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            15,
+            position(self._coord),
+            0 if self.cond is None else 1,
+            0 if self.stmt is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        stmt = stack.pop() if codes[i + 3] else None
+        cond = stack.pop() if codes[i + 2] else None
+        stack.append(DoWhile(cond, stmt, positions[codes[i + 1]]))
+        return i + 4
+
     attr_names = ()
+    child_names = ('cond', 'stmt', )
 
 class EllipsisParam(Node):
-    __slots__ = ('coord', '__weakref__')
+    __slots__ = ('_coord', '_annotations', '__weakref__')
     def __init__(self, coord=None):
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         return ()
 
+    def iter_children(self):
+        return iter(())
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            16,
+            position(self._coord),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        stack.append(EllipsisParam(positions[codes[i + 1]]))
+        return i + 2
+
     attr_names = ()
+    child_names = ()
 
 class EmptyStatement(Node):
-    __slots__ = ('coord', '__weakref__')
+    __slots__ = ('_coord', '_annotations', '__weakref__')
     def __init__(self, coord=None):
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         return ()
 
+    def iter_children(self):
+        return iter(())
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            17,
+            position(self._coord),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        stack.append(EmptyStatement(positions[codes[i + 1]]))
+        return i + 2
+
     attr_names = ()
+    child_names = ()
 
 class Enum(Node):
-    __slots__ = ('name', 'values', 'coord', '__weakref__')
+    __slots__ = ('name', 'values', '_coord', '_annotations', '__weakref__')
     def __init__(self, name, values, coord=None):
         self.name = name
         self.values = values
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
         if self.values is not None: nodelist.append(("values", self.values))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.values is not None:
+            yield self.values
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            18,
+            position(self._coord),
+            value(self.name),
+            0 if self.values is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        name = table[c] if c >= 0 else list(table[~c])
+        values = stack.pop() if codes[i + 3] else None
+        stack.append(Enum(name, values, positions[codes[i + 1]]))
+        return i + 4
+
     attr_names = ('name', )
+    child_names = ('values', )
 
 class Enumerator(Node):
-    __slots__ = ('name', 'value', 'coord', '__weakref__')
+    __slots__ = ('name', 'value', '_coord', '_annotations', '__weakref__')
     def __init__(self, name, value, coord=None):
         self.name = name
         self.value = value
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
         if self.value is not None: nodelist.append(("value", self.value))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.value is not None:
+            yield self.value
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            19,
+            position(self._coord),
+            value(self.name),
+            0 if self.value is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        name = table[c] if c >= 0 else list(table[~c])
+        value = stack.pop() if codes[i + 3] else None
+        stack.append(Enumerator(name, value, positions[codes[i + 1]]))
+        return i + 4
+
     attr_names = ('name', )
+    child_names = ('value', )
 
 class EnumeratorList(Node):
-    __slots__ = ('enumerators', 'coord', '__weakref__')
+    __slots__ = ('enumerators', '_coord', '_annotations', '__weakref__')
     def __init__(self, enumerators, coord=None):
         self.enumerators = enumerators
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -407,13 +1055,36 @@ class EnumeratorList(Node):
             nodelist.append(("enumerators[%d]" % i, child))
         return tuple(nodelist)
 
+    def iter_children(self):
+        for child in (self.enumerators or []):
+            yield child
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            20,
+            position(self._coord),
+            -1 if self.enumerators is None else len(self.enumerators),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        n = codes[i + 2]
+        if n < 0:
+            enumerators = None
+        else:
+            enumerators = stack[len(stack) - n:]
+            del stack[len(stack) - n:]
+        stack.append(EnumeratorList(enumerators, positions[codes[i + 1]]))
+        return i + 3
+
     attr_names = ()
+    child_names = ('enumerators', )
 
 class ExprList(Node):
-    __slots__ = ('exprs', 'coord', '__weakref__')
+    __slots__ = ('exprs', '_coord', '_annotations', '__weakref__')
     def __init__(self, exprs, coord=None):
         self.exprs = exprs
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -421,13 +1092,36 @@ class ExprList(Node):
             nodelist.append(("exprs[%d]" % i, child))
         return tuple(nodelist)
 
+    def iter_children(self):
+        for child in (self.exprs or []):
+            yield child
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            21,
+            position(self._coord),
+            -1 if self.exprs is None else len(self.exprs),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        n = codes[i + 2]
+        if n < 0:
+            exprs = None
+        else:
+            exprs = stack[len(stack) - n:]
+            del stack[len(stack) - n:]
+        stack.append(ExprList(exprs, positions[codes[i + 1]]))
+        return i + 3
+
     attr_names = ()
+    child_names = ('exprs', )
 
 class FileAST(Node):
-    __slots__ = ('ext', 'coord', '__weakref__')
+    __slots__ = ('ext', '_coord', '_annotations', '__weakref__')
     def __init__(self, ext, coord=None):
         self.ext = ext
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -435,16 +1129,39 @@ class FileAST(Node):
             nodelist.append(("ext[%d]" % i, child))
         return tuple(nodelist)
 
+    def iter_children(self):
+        for child in (self.ext or []):
+            yield child
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            22,
+            position(self._coord),
+            -1 if self.ext is None else len(self.ext),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        n = codes[i + 2]
+        if n < 0:
+            ext = None
+        else:
+            ext = stack[len(stack) - n:]
+            del stack[len(stack) - n:]
+        stack.append(FileAST(ext, positions[codes[i + 1]]))
+        return i + 3
+
     attr_names = ()
+    child_names = ('ext', )
 
 class For(Node):
-    __slots__ = ('init', 'cond', 'next', 'stmt', 'coord', '__weakref__')
+    __slots__ = ('init', 'cond', 'next', 'stmt', '_coord', '_annotations', '__weakref__')
     def __init__(self, init, cond, next, stmt, coord=None):
         self.init = init
         self.cond = cond
         self.next = next
         self.stmt = stmt
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -454,14 +1171,44 @@ class For(Node):
         if self.stmt is not None: nodelist.append(("stmt", self.stmt))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.init is not None:
+            yield self.init
+        if self.cond is not None:
+            yield self.cond
+        if self.next is not None:
+            yield self.next
+        if self.stmt is not None:
+            yield self.stmt
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            23,
+            position(self._coord),
+            0 if self.init is None else 1,
+            0 if self.cond is None else 1,
+            0 if self.next is None else 1,
+            0 if self.stmt is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        stmt = stack.pop() if codes[i + 5] else None
+        next = stack.pop() if codes[i + 4] else None
+        cond = stack.pop() if codes[i + 3] else None
+        init = stack.pop() if codes[i + 2] else None
+        stack.append(For(init, cond, next, stmt, positions[codes[i + 1]]))
+        return i + 6
+
     attr_names = ()
+    child_names = ('init', 'cond', 'next', 'stmt', )
 
 class FuncCall(Node):
-    __slots__ = ('name', 'args', 'coord', '__weakref__')
+    __slots__ = ('name', 'args', '_coord', '_annotations', '__weakref__')
     def __init__(self, name, args, coord=None):
         self.name = name
         self.args = args
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -469,14 +1216,36 @@ class FuncCall(Node):
         if self.args is not None: nodelist.append(("args", self.args))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.name is not None:
+            yield self.name
+        if self.args is not None:
+            yield self.args
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            24,
+            position(self._coord),
+            0 if self.name is None else 1,
+            0 if self.args is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        args = stack.pop() if codes[i + 3] else None
+        name = stack.pop() if codes[i + 2] else None
+        stack.append(FuncCall(name, args, positions[codes[i + 1]]))
+        return i + 4
+
     attr_names = ()
+    child_names = ('name', 'args', )
 
 class FuncDecl(Node):
-    __slots__ = ('args', 'type', 'coord', '__weakref__')
+    __slots__ = ('args', 'type', '_coord', '_annotations', '__weakref__')
     def __init__(self, args, type, coord=None):
         self.args = args
         self.type = type
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -484,15 +1253,37 @@ class FuncDecl(Node):
         if self.type is not None: nodelist.append(("type", self.type))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.args is not None:
+            yield self.args
+        if self.type is not None:
+            yield self.type
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            25,
+            position(self._coord),
+            0 if self.args is None else 1,
+            0 if self.type is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        type = stack.pop() if codes[i + 3] else None
+        args = stack.pop() if codes[i + 2] else None
+        stack.append(FuncDecl(args, type, positions[codes[i + 1]]))
+        return i + 4
+
     attr_names = ()
+    child_names = ('args', 'type', )
 
 class FuncDef(Node):
-    __slots__ = ('decl', 'param_decls', 'body', 'coord', '__weakref__')
+    __slots__ = ('decl', 'param_decls', 'body', '_coord', '_annotations', '__weakref__')
     def __init__(self, decl, param_decls, body, coord=None):
         self.decl = decl
         self.param_decls = param_decls
         self.body = body
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -502,51 +1293,136 @@ class FuncDef(Node):
             nodelist.append(("param_decls[%d]" % i, child))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.decl is not None:
+            yield self.decl
+        if self.body is not None:
+            yield self.body
+        for child in (self.param_decls or []):
+            yield child
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            26,
+            position(self._coord),
+            0 if self.decl is None else 1,
+            0 if self.body is None else 1,
+            -1 if self.param_decls is None else len(self.param_decls),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        n = codes[i + 4]
+        if n < 0:
+            param_decls = None
+        else:
+            param_decls = stack[len(stack) - n:]
+            del stack[len(stack) - n:]
+        body = stack.pop() if codes[i + 3] else None
+        decl = stack.pop() if codes[i + 2] else None
+        stack.append(FuncDef(decl, param_decls, body, positions[codes[i + 1]]))
+        return i + 5
+
     attr_names = ()
+    child_names = ('decl', 'body', 'param_decls', )
 
 class Goto(Node):
-    __slots__ = ('name', 'coord', '__weakref__')
+    __slots__ = ('name', '_coord', '_annotations', '__weakref__')
     def __init__(self, name, coord=None):
         self.name = name
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
         return tuple(nodelist)
 
+    def iter_children(self):
+        return iter(())
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            27,
+            position(self._coord),
+            value(self.name),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        name = table[c] if c >= 0 else list(table[~c])
+        stack.append(Goto(name, positions[codes[i + 1]]))
+        return i + 3
+
     attr_names = ('name', )
+    child_names = ()
 
 class ID(Node):
-    __slots__ = ('name', 'coord', '__weakref__')
+    __slots__ = ('name', '_coord', '_annotations', '__weakref__')
     def __init__(self, name, coord=None):
         self.name = name
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
         return tuple(nodelist)
 
+    def iter_children(self):
+        return iter(())
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            28,
+            position(self._coord),
+            value(self.name),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        name = table[c] if c >= 0 else list(table[~c])
+        stack.append(ID(name, positions[codes[i + 1]]))
+        return i + 3
+
     attr_names = ('name', )
+    child_names = ()
 
 class IdentifierType(Node):
-    __slots__ = ('names', 'coord', '__weakref__')
+    __slots__ = ('names', '_coord', '_annotations', '__weakref__')
     def __init__(self, names, coord=None):
         self.names = names
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
         return tuple(nodelist)
 
+    def iter_children(self):
+        return iter(())
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            29,
+            position(self._coord),
+            value(self.names),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        names = table[c] if c >= 0 else list(table[~c])
+        stack.append(IdentifierType(names, positions[codes[i + 1]]))
+        return i + 3
+
     attr_names = ('names', )
+    child_names = ()
 
 class If(Node):
-    __slots__ = ('cond', 'iftrue', 'iffalse', 'coord', '__weakref__')
+    __slots__ = ('cond', 'iftrue', 'iffalse', '_coord', '_annotations', '__weakref__')
     def __init__(self, cond, iftrue, iffalse, coord=None):
         self.cond = cond
         self.iftrue = iftrue
         self.iffalse = iffalse
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -555,13 +1431,39 @@ class If(Node):
         if self.iffalse is not None: nodelist.append(("iffalse", self.iffalse))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.cond is not None:
+            yield self.cond
+        if self.iftrue is not None:
+            yield self.iftrue
+        if self.iffalse is not None:
+            yield self.iffalse
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            30,
+            position(self._coord),
+            0 if self.cond is None else 1,
+            0 if self.iftrue is None else 1,
+            0 if self.iffalse is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        iffalse = stack.pop() if codes[i + 4] else None
+        iftrue = stack.pop() if codes[i + 3] else None
+        cond = stack.pop() if codes[i + 2] else None
+        stack.append(If(cond, iftrue, iffalse, positions[codes[i + 1]]))
+        return i + 5
+
     attr_names = ()
+    child_names = ('cond', 'iftrue', 'iffalse', )
 
 class InitList(Node):
-    __slots__ = ('exprs', 'coord', '__weakref__')
+    __slots__ = ('exprs', '_coord', '_annotations', '__weakref__')
     def __init__(self, exprs, coord=None):
         self.exprs = exprs
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -569,28 +1471,72 @@ class InitList(Node):
             nodelist.append(("exprs[%d]" % i, child))
         return tuple(nodelist)
 
+    def iter_children(self):
+        for child in (self.exprs or []):
+            yield child
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            31,
+            position(self._coord),
+            -1 if self.exprs is None else len(self.exprs),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        n = codes[i + 2]
+        if n < 0:
+            exprs = None
+        else:
+            exprs = stack[len(stack) - n:]
+            del stack[len(stack) - n:]
+        stack.append(InitList(exprs, positions[codes[i + 1]]))
+        return i + 3
+
     attr_names = ()
+    child_names = ('exprs', )
 
 class Label(Node):
-    __slots__ = ('name', 'stmt', 'coord', '__weakref__')
+    __slots__ = ('name', 'stmt', '_coord', '_annotations', '__weakref__')
     def __init__(self, name, stmt, coord=None):
         self.name = name
         self.stmt = stmt
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
         if self.stmt is not None: nodelist.append(("stmt", self.stmt))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.stmt is not None:
+            yield self.stmt
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            32,
+            position(self._coord),
+            value(self.name),
+            0 if self.stmt is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        name = table[c] if c >= 0 else list(table[~c])
+        stmt = stack.pop() if codes[i + 3] else None
+        stack.append(Label(name, stmt, positions[codes[i + 1]]))
+        return i + 4
+
     attr_names = ('name', )
+    child_names = ('stmt', )
 
 class NamedInitializer(Node):
-    __slots__ = ('name', 'expr', 'coord', '__weakref__')
+    __slots__ = ('name', 'expr', '_coord', '_annotations', '__weakref__')
     def __init__(self, name, expr, coord=None):
         self.name = name
         self.expr = expr
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -599,13 +1545,40 @@ class NamedInitializer(Node):
             nodelist.append(("name[%d]" % i, child))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.expr is not None:
+            yield self.expr
+        for child in (self.name or []):
+            yield child
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            33,
+            position(self._coord),
+            0 if self.expr is None else 1,
+            -1 if self.name is None else len(self.name),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        n = codes[i + 3]
+        if n < 0:
+            name = None
+        else:
+            name = stack[len(stack) - n:]
+            del stack[len(stack) - n:]
+        expr = stack.pop() if codes[i + 2] else None
+        stack.append(NamedInitializer(name, expr, positions[codes[i + 1]]))
+        return i + 4
+
     attr_names = ()
+    child_names = ('expr', 'name', )
 
 class ParamList(Node):
-    __slots__ = ('params', 'coord', '__weakref__')
+    __slots__ = ('params', '_coord', '_annotations', '__weakref__')
     def __init__(self, params, coord=None):
         self.params = params
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -613,41 +1586,103 @@ class ParamList(Node):
             nodelist.append(("params[%d]" % i, child))
         return tuple(nodelist)
 
+    def iter_children(self):
+        for child in (self.params or []):
+            yield child
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            34,
+            position(self._coord),
+            -1 if self.params is None else len(self.params),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        n = codes[i + 2]
+        if n < 0:
+            params = None
+        else:
+            params = stack[len(stack) - n:]
+            del stack[len(stack) - n:]
+        stack.append(ParamList(params, positions[codes[i + 1]]))
+        return i + 3
+
     attr_names = ()
+    child_names = ('params', )
 
 class PtrDecl(Node):
-    __slots__ = ('quals', 'type', 'coord', '__weakref__')
+    __slots__ = ('quals', 'type', '_coord', '_annotations', '__weakref__')
     def __init__(self, quals, type, coord=None):
         self.quals = quals
         self.type = type
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
         if self.type is not None: nodelist.append(("type", self.type))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.type is not None:
+            yield self.type
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            35,
+            position(self._coord),
+            value(self.quals),
+            0 if self.type is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        quals = table[c] if c >= 0 else list(table[~c])
+        type = stack.pop() if codes[i + 3] else None
+        stack.append(PtrDecl(quals, type, positions[codes[i + 1]]))
+        return i + 4
+
     attr_names = ('quals', )
+    child_names = ('type', )
 
 class Return(Node):
-    __slots__ = ('expr', 'coord', '__weakref__')
+    __slots__ = ('expr', '_coord', '_annotations', '__weakref__')
     def __init__(self, expr, coord=None):
         self.expr = expr
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
         if self.expr is not None: nodelist.append(("expr", self.expr))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.expr is not None:
+            yield self.expr
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            36,
+            position(self._coord),
+            0 if self.expr is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        expr = stack.pop() if codes[i + 2] else None
+        stack.append(Return(expr, positions[codes[i + 1]]))
+        return i + 3
+
     attr_names = ()
+    child_names = ('expr', )
 
 class Struct(Node):
-    __slots__ = ('name', 'decls', 'coord', '__weakref__')
+    __slots__ = ('name', 'decls', '_coord', '_annotations', '__weakref__')
     def __init__(self, name, decls, coord=None):
         self.name = name
         self.decls = decls
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -655,15 +1690,41 @@ class Struct(Node):
             nodelist.append(("decls[%d]" % i, child))
         return tuple(nodelist)
 
+    def iter_children(self):
+        for child in (self.decls or []):
+            yield child
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            37,
+            position(self._coord),
+            value(self.name),
+            -1 if self.decls is None else len(self.decls),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        name = table[c] if c >= 0 else list(table[~c])
+        n = codes[i + 3]
+        if n < 0:
+            decls = None
+        else:
+            decls = stack[len(stack) - n:]
+            del stack[len(stack) - n:]
+        stack.append(Struct(name, decls, positions[codes[i + 1]]))
+        return i + 4
+
     attr_names = ('name', )
+    child_names = ('decls', )
 
 class StructRef(Node):
-    __slots__ = ('name', 'type', 'field', 'coord', '__weakref__')
+    __slots__ = ('name', 'type', 'field', '_coord', '_annotations', '__weakref__')
     def __init__(self, name, type, field, coord=None):
         self.name = name
         self.type = type
         self.field = field
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -671,14 +1732,39 @@ class StructRef(Node):
         if self.field is not None: nodelist.append(("field", self.field))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.name is not None:
+            yield self.name
+        if self.field is not None:
+            yield self.field
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            38,
+            position(self._coord),
+            value(self.type),
+            0 if self.name is None else 1,
+            0 if self.field is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        type = table[c] if c >= 0 else list(table[~c])
+        field = stack.pop() if codes[i + 4] else None
+        name = stack.pop() if codes[i + 3] else None
+        stack.append(StructRef(name, type, field, positions[codes[i + 1]]))
+        return i + 5
+
     attr_names = ('type', )
+    child_names = ('name', 'field', )
 
 class Switch(Node):
-    __slots__ = ('cond', 'stmt', 'coord', '__weakref__')
+    __slots__ = ('cond', 'stmt', '_coord', '_annotations', '__weakref__')
     def __init__(self, cond, stmt, coord=None):
         self.cond = cond
         self.stmt = stmt
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -686,15 +1772,37 @@ class Switch(Node):
         if self.stmt is not None: nodelist.append(("stmt", self.stmt))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.cond is not None:
+            yield self.cond
+        if self.stmt is not None:
+            yield self.stmt
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            39,
+            position(self._coord),
+            0 if self.cond is None else 1,
+            0 if self.stmt is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        stmt = stack.pop() if codes[i + 3] else None
+        cond = stack.pop() if codes[i + 2] else None
+        stack.append(Switch(cond, stmt, positions[codes[i + 1]]))
+        return i + 4
+
     attr_names = ()
+    child_names = ('cond', 'stmt', )
 
 class TernaryOp(Node):
-    __slots__ = ('cond', 'iftrue', 'iffalse', 'coord', '__weakref__')
+    __slots__ = ('cond', 'iftrue', 'iffalse', '_coord', '_annotations', '__weakref__')
     def __init__(self, cond, iftrue, iffalse, coord=None):
         self.cond = cond
         self.iftrue = iftrue
         self.iffalse = iffalse
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -703,74 +1811,196 @@ class TernaryOp(Node):
         if self.iffalse is not None: nodelist.append(("iffalse", self.iffalse))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.cond is not None:
+            yield self.cond
+        if self.iftrue is not None:
+            yield self.iftrue
+        if self.iffalse is not None:
+            yield self.iffalse
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            40,
+            position(self._coord),
+            0 if self.cond is None else 1,
+            0 if self.iftrue is None else 1,
+            0 if self.iffalse is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        iffalse = stack.pop() if codes[i + 4] else None
+        iftrue = stack.pop() if codes[i + 3] else None
+        cond = stack.pop() if codes[i + 2] else None
+        stack.append(TernaryOp(cond, iftrue, iffalse, positions[codes[i + 1]]))
+        return i + 5
+
     attr_names = ()
+    child_names = ('cond', 'iftrue', 'iffalse', )
 
 class TypeDecl(Node):
-    __slots__ = ('declname', 'quals', 'type', 'coord', '__weakref__')
+    __slots__ = ('declname', 'quals', 'type', '_coord', '_annotations', '__weakref__')
     def __init__(self, declname, quals, type, coord=None):
         self.declname = declname
         self.quals = quals
         self.type = type
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
         if self.type is not None: nodelist.append(("type", self.type))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.type is not None:
+            yield self.type
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            41,
+            position(self._coord),
+            value(self.declname),
+            value(self.quals),
+            0 if self.type is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        declname = table[c] if c >= 0 else list(table[~c])
+        c = codes[i + 3]
+        quals = table[c] if c >= 0 else list(table[~c])
+        type = stack.pop() if codes[i + 4] else None
+        stack.append(TypeDecl(declname, quals, type, positions[codes[i + 1]]))
+        return i + 5
+
     attr_names = ('declname', 'quals', )
+    child_names = ('type', )
 
 class Typedef(Node):
-    __slots__ = ('name', 'quals', 'storage', 'type', 'coord', '__weakref__')
+    __slots__ = ('name', 'quals', 'storage', 'type', '_coord', '_annotations', '__weakref__')
     def __init__(self, name, quals, storage, type, coord=None):
         self.name = name
         self.quals = quals
         self.storage = storage
         self.type = type
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
         if self.type is not None: nodelist.append(("type", self.type))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.type is not None:
+            yield self.type
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            42,
+            position(self._coord),
+            value(self.name),
+            value(self.quals),
+            value(self.storage),
+            0 if self.type is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        name = table[c] if c >= 0 else list(table[~c])
+        c = codes[i + 3]
+        quals = table[c] if c >= 0 else list(table[~c])
+        c = codes[i + 4]
+        storage = table[c] if c >= 0 else list(table[~c])
+        type = stack.pop() if codes[i + 5] else None
+        stack.append(Typedef(name, quals, storage, type, positions[codes[i + 1]]))
+        return i + 6
+
     attr_names = ('name', 'quals', 'storage', )
+    child_names = ('type', )
 
 class Typename(Node):
-    __slots__ = ('name', 'quals', 'type', 'coord', '__weakref__')
+    __slots__ = ('name', 'quals', 'type', '_coord', '_annotations', '__weakref__')
     def __init__(self, name, quals, type, coord=None):
         self.name = name
         self.quals = quals
         self.type = type
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
         if self.type is not None: nodelist.append(("type", self.type))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.type is not None:
+            yield self.type
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            43,
+            position(self._coord),
+            value(self.name),
+            value(self.quals),
+            0 if self.type is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        name = table[c] if c >= 0 else list(table[~c])
+        c = codes[i + 3]
+        quals = table[c] if c >= 0 else list(table[~c])
+        type = stack.pop() if codes[i + 4] else None
+        stack.append(Typename(name, quals, type, positions[codes[i + 1]]))
+        return i + 5
+
     attr_names = ('name', 'quals', )
+    child_names = ('type', )
 
 class UnaryOp(Node):
-    __slots__ = ('op', 'expr', 'coord', '__weakref__')
+    __slots__ = ('op', 'expr', '_coord', '_annotations', '__weakref__')
     def __init__(self, op, expr, coord=None):
         self.op = op
         self.expr = expr
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
         if self.expr is not None: nodelist.append(("expr", self.expr))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.expr is not None:
+            yield self.expr
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            44,
+            position(self._coord),
+            value(self.op),
+            0 if self.expr is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        op = table[c] if c >= 0 else list(table[~c])
+        expr = stack.pop() if codes[i + 3] else None
+        stack.append(UnaryOp(op, expr, positions[codes[i + 1]]))
+        return i + 4
+
     attr_names = ('op', )
+    child_names = ('expr', )
 
 class Union(Node):
-    __slots__ = ('name', 'decls', 'coord', '__weakref__')
+    __slots__ = ('name', 'decls', '_coord', '_annotations', '__weakref__')
     def __init__(self, name, decls, coord=None):
         self.name = name
         self.decls = decls
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -778,14 +2008,40 @@ class Union(Node):
             nodelist.append(("decls[%d]" % i, child))
         return tuple(nodelist)
 
+    def iter_children(self):
+        for child in (self.decls or []):
+            yield child
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            45,
+            position(self._coord),
+            value(self.name),
+            -1 if self.decls is None else len(self.decls),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        name = table[c] if c >= 0 else list(table[~c])
+        n = codes[i + 3]
+        if n < 0:
+            decls = None
+        else:
+            decls = stack[len(stack) - n:]
+            del stack[len(stack) - n:]
+        stack.append(Union(name, decls, positions[codes[i + 1]]))
+        return i + 4
+
     attr_names = ('name', )
+    child_names = ('decls', )
 
 class While(Node):
-    __slots__ = ('cond', 'stmt', 'coord', '__weakref__')
+    __slots__ = ('cond', 'stmt', '_coord', '_annotations', '__weakref__')
     def __init__(self, cond, stmt, coord=None):
         self.cond = cond
         self.stmt = stmt
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
@@ -793,17 +2049,113 @@ class While(Node):
         if self.stmt is not None: nodelist.append(("stmt", self.stmt))
         return tuple(nodelist)
 
+    def iter_children(self):
+        if self.cond is not None:
+            yield self.cond
+        if self.stmt is not None:
+            yield self.stmt
+
+    def _dump(self, codes, value, position):
+        codes.extend((
+            46,
+            position(self._coord),
+            0 if self.cond is None else 1,
+            0 if self.stmt is None else 1,
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        stmt = stack.pop() if codes[i + 3] else None
+        cond = stack.pop() if codes[i + 2] else None
+        stack.append(While(cond, stmt, positions[codes[i + 1]]))
+        return i + 4
+
     attr_names = ()
+    child_names = ('cond', 'stmt', )
 
 class Pragma(Node):
-    __slots__ = ('string', 'coord', '__weakref__')
+    __slots__ = ('string', '_coord', '_annotations', '__weakref__')
     def __init__(self, string, coord=None):
         self.string = string
-        self.coord = coord
+        self._coord = coord
 
     def children(self):
         nodelist = []
         return tuple(nodelist)
 
-    attr_names = ('string', )
+    def iter_children(self):
+        return iter(())
 
+    def _dump(self, codes, value, position):
+        codes.extend((
+            47,
+            position(self._coord),
+            value(self.string),
+        ))
+
+    @staticmethod
+    def _load(codes, i, table, positions, stack):
+        c = codes[i + 2]
+        string = table[c] if c >= 0 else list(table[~c])
+        stack.append(Pragma(string, positions[codes[i + 1]]))
+        return i + 3
+
+    attr_names = ('string', )
+    child_names = ()
+
+# A hash of the node definitions in _c_ast.cfg and of the layout of
+# the records written by Node._dump(), so that astcache only loads trees
+# written for the same nodes.
+SCHEMA = '7dffa2df37091f8a22082a6be685dfc114cdb8d5'
+
+# Node._load of each record code, for astcache.
+_loaders = (
+    None,
+    ArrayDecl._load,
+    ArrayRef._load,
+    Assignment._load,
+    BinaryOp._load,
+    Break._load,
+    Case._load,
+    Cast._load,
+    Compound._load,
+    CompoundLiteral._load,
+    Constant._load,
+    Continue._load,
+    Decl._load,
+    DeclList._load,
+    Default._load,
+    DoWhile._load,
+    EllipsisParam._load,
+    EmptyStatement._load,
+    Enum._load,
+    Enumerator._load,
+    EnumeratorList._load,
+    ExprList._load,
+    FileAST._load,
+    For._load,
+    FuncCall._load,
+    FuncDecl._load,
+    FuncDef._load,
+    Goto._load,
+    ID._load,
+    IdentifierType._load,
+    If._load,
+    InitList._load,
+    Label._load,
+    NamedInitializer._load,
+    ParamList._load,
+    PtrDecl._load,
+    Return._load,
+    Struct._load,
+    StructRef._load,
+    Switch._load,
+    TernaryOp._load,
+    TypeDecl._load,
+    Typedef._load,
+    Typename._load,
+    UnaryOp._load,
+    Union._load,
+    While._load,
+    Pragma._load,
+)
@@ -6,13 +6,30 @@
 # Copyright (C) 2008-2015, Eli Bendersky
 # License: BSD
 #------------------------------------------------------------------------------
+import sys
+
 from . import c_ast
 
 
+# The types of the text chunks _run() yields; on Python 2 a chunk may
+# also be unicode, from a node holding unicode strings.
+if sys.version_info[0] < 3:
+    _TEXT_TYPES = (str, unicode)
+else:
+    _TEXT_TYPES = str
+
+
 class CGenerator(object):
     """ Uses the same visitor pattern as c_ast.NodeVisitor, but modified to
         return a value from each visit method, using string accumulation in
         generic_visit.
+
+        write() generates the same code into a file-like object instead.
+        Statements, everything that contains them and binary operators are
+        generated as a stream of chunks by the _chunks_* methods, which the
+        matching visit_* methods join into a string. A chunk is either a
+        string or an iterable of more chunks; _run() flattens them with an
+        explicit stack, so deep nesting doesn't recurse.
     """
     def __init__(self):
         # Statements start with indentation of self.indent_level spaces, using
@@ -23,16 +40,62 @@ class CGenerator(object):
     def _make_indent(self):
         return ' ' * self.indent_level
 
+    # The visit_XXX and _chunks_XXX methods of each generator class for each
+    # node class, as plain functions, so they're only looked up once. They're
+    # kept in the _dispatch and _chunk_dispatch dicts in the __dict__ of the
+    # generator class itself (see c_ast._class_cache).
+
     def visit(self, node):
-        method = 'visit_' + node.__class__.__name__
-        return getattr(self, method, self.generic_visit)(node)
+        try:
+            method = self.__class__.__dict__['_dispatch'][node.__class__]
+        except KeyError:
+            cls = self.__class__
+            method = getattr(cls, 'visit_' + node.__class__.__name__,
+                             cls.generic_visit)
+            method = getattr(method, '__func__', method)
+            c_ast._class_cache(cls, '_dispatch')[node.__class__] = method
+        return method(self, node)
+
+    def write(self, node, stream):
+        """ Generates code for node and writes it to stream, anything with a
+            write method, as it goes. The result is the same as visit(node),
+            but the whole output is never held in memory: only the
+            statements enclosing the current one are.
+        """
+        for chunk in self._run(self._chunks(node)):
+            stream.write(chunk)
+
+    def _run(self, chunks):
+        stack = [iter(chunks)]
+        while stack:
+            for chunk in stack[-1]:
+                if isinstance(chunk, _TEXT_TYPES):
+                    yield chunk
+                else:
+                    stack.append(iter(chunk))
+                    break
+            else:
+                stack.pop()
+
+    def _chunks(self, node):
+        try:
+            method = self.__class__.__dict__['_chunk_dispatch'][node.__class__]
+        except KeyError:
+            cls = self.__class__
+            method = getattr(cls, '_chunks_' + node.__class__.__name__, None)
+            method = getattr(method, '__func__', method)
+            c_ast._class_cache(cls, '_chunk_dispatch')[node.__class__] = method
+
+        if method is None:
+            return [self.visit(node)]
+        return method(self, node)
 
     def generic_visit(self, node):
         #~ print('generic:', type(node))
         if node is None:
             return ''
         else:
-            return ''.join(self.visit(c) for c_name, c in node.children())
+            return ''.join(self.visit(c) for c in node.iter_children())
 
     def visit_Constant(self, n):
         return n.value
@@ -72,11 +135,30 @@ class CGenerator(object):
             return '%s%s' % (n.op, operand)
 
     def visit_BinaryOp(self, n):
-        lval_str = self._parenthesize_if(n.left,
-                            lambda d: not self._is_simple_node(d))
-        rval_str = self._parenthesize_if(n.right,
-                            lambda d: not self._is_simple_node(d))
-        return '%s %s %s' % (lval_str, n.op, rval_str)
+        return ''.join(self._run(self._chunks_BinaryOp(n)))
+
+    def _chunks_BinaryOp(self, n):
+        yield self._operand_chunks(n.left)
+        yield ' %s ' % n.op
+        yield self._operand_chunks(n.right)
+
+    def _operand_chunks(self, n):
+        # Streaming version of _parenthesize_unless_simple.
+        if self._is_simple_node(n):
+            yield self._visit_expr(n)
+        else:
+            yield '('
+            yield self._expr_chunks(n)
+            yield ')'
+
+    def _expr_chunks(self, n):
+        # Streaming version of _visit_expr.
+        if isinstance(n, c_ast.InitList):
+            return ['{', self._chunks(n), '}']
+        elif isinstance(n, c_ast.ExprList):
+            return ['(', self._chunks(n), ')']
+        else:
+            return self._chunks(n)
 
     def visit_Assignment(self, n):
         rval_str = self._parenthesize_if(
@@ -149,34 +231,39 @@ class CGenerator(object):
         return s
 
     def visit_FuncDef(self, n):
-        decl = self.visit(n.decl)
+        return ''.join(self._run(self._chunks_FuncDef(n)))
+
+    def _chunks_FuncDef(self, n):
+        yield self.visit(n.decl) + '\n'
         self.indent_level = 0
-        body = self.visit(n.body)
         if n.param_decls:
-            knrdecls = ';\n'.join(self.visit(p) for p in n.param_decls)
-            return decl + '\n' + knrdecls + ';\n' + body + '\n'
-        else:
-            return decl + '\n' + body + '\n'
+            yield ';\n'.join(self.visit(p) for p in n.param_decls) + ';\n'
+        yield self._chunks(n.body)
+        yield '\n'
 
     def visit_FileAST(self, n):
-        s = ''
+        return ''.join(self._run(self._chunks_FileAST(n)))
+
+    def _chunks_FileAST(self, n):
         for ext in n.ext:
             if isinstance(ext, c_ast.FuncDef):
-                s += self.visit(ext)
+                yield self._chunks(ext)
             elif isinstance(ext, c_ast.Pragma):
-                s += self.visit(ext) + '\n'
+                yield self.visit(ext) + '\n'
             else:
-                s += self.visit(ext) + ';\n'
-        return s
+                yield self.visit(ext) + ';\n'
 
     def visit_Compound(self, n):
-        s = self._make_indent() + '{\n'
+        return ''.join(self._run(self._chunks_Compound(n)))
+
+    def _chunks_Compound(self, n):
+        yield self._make_indent() + '{\n'
         self.indent_level += 2
         if n.block_items:
-            s += ''.join(self._generate_stmt(stmt) for stmt in n.block_items)
+            for stmt in n.block_items:
+                yield self._stmt_chunks(stmt)
         self.indent_level -= 2
-        s += self._make_indent() + '}\n'
-        return s
+        yield self._make_indent() + '}\n'
 
     def visit_EmptyStatement(self, n):
         return ';'
@@ -202,60 +289,78 @@ class CGenerator(object):
         return s
 
     def visit_If(self, n):
+        return ''.join(self._run(self._chunks_If(n)))
+
+    def _chunks_If(self, n):
         s = 'if ('
         if n.cond: s += self.visit(n.cond)
-        s += ')\n'
-        s += self._generate_stmt(n.iftrue, add_indent=True)
+        yield s + ')\n'
+        yield self._stmt_chunks(n.iftrue, add_indent=True)
         if n.iffalse:
-            s += self._make_indent() + 'else\n'
-            s += self._generate_stmt(n.iffalse, add_indent=True)
-        return s
+            yield self._make_indent() + 'else\n'
+            yield self._stmt_chunks(n.iffalse, add_indent=True)
 
     def visit_For(self, n):
+        return ''.join(self._run(self._chunks_For(n)))
+
+    def _chunks_For(self, n):
         s = 'for ('
         if n.init: s += self.visit(n.init)
         s += ';'
         if n.cond: s += ' ' + self.visit(n.cond)
         s += ';'
         if n.next: s += ' ' + self.visit(n.next)
-        s += ')\n'
-        s += self._generate_stmt(n.stmt, add_indent=True)
-        return s
+        yield s + ')\n'
+        yield self._stmt_chunks(n.stmt, add_indent=True)
 
     def visit_While(self, n):
+        return ''.join(self._run(self._chunks_While(n)))
+
+    def _chunks_While(self, n):
         s = 'while ('
         if n.cond: s += self.visit(n.cond)
-        s += ')\n'
-        s += self._generate_stmt(n.stmt, add_indent=True)
-        return s
+        yield s + ')\n'
+        yield self._stmt_chunks(n.stmt, add_indent=True)
 
     def visit_DoWhile(self, n):
-        s = 'do\n'
-        s += self._generate_stmt(n.stmt, add_indent=True)
-        s += self._make_indent() + 'while ('
+        return ''.join(self._run(self._chunks_DoWhile(n)))
+
+    def _chunks_DoWhile(self, n):
+        yield 'do\n'
+        yield self._stmt_chunks(n.stmt, add_indent=True)
+        s = self._make_indent() + 'while ('
         if n.cond: s += self.visit(n.cond)
-        s += ');'
-        return s
+        yield s + ');'
 
     def visit_Switch(self, n):
-        s = 'switch (' + self.visit(n.cond) + ')\n'
-        s += self._generate_stmt(n.stmt, add_indent=True)
-        return s
+        return ''.join(self._run(self._chunks_Switch(n)))
+
+    def _chunks_Switch(self, n):
+        yield 'switch (' + self.visit(n.cond) + ')\n'
+        yield self._stmt_chunks(n.stmt, add_indent=True)
 
     def visit_Case(self, n):
-        s = 'case ' + self.visit(n.expr) + ':\n'
+        return ''.join(self._run(self._chunks_Case(n)))
+
+    def _chunks_Case(self, n):
+        yield 'case ' + self.visit(n.expr) + ':\n'
         for stmt in n.stmts:
-            s += self._generate_stmt(stmt, add_indent=True)
-        return s
+            yield self._stmt_chunks(stmt, add_indent=True)
 
     def visit_Default(self, n):
-        s = 'default:\n'
+        return ''.join(self._run(self._chunks_Default(n)))
+
+    def _chunks_Default(self, n):
+        yield 'default:\n'
         for stmt in n.stmts:
-            s += self._generate_stmt(stmt, add_indent=True)
-        return s
+            yield self._stmt_chunks(stmt, add_indent=True)
 
     def visit_Label(self, n):
-        return n.name + ':\n' + self._generate_stmt(n.stmt)
+        return ''.join(self._run(self._chunks_Label(n)))
+
+    def _chunks_Label(self, n):
+        yield n.name + ':\n'
+        yield self._stmt_chunks(n.stmt)
 
     def visit_Goto(self, n):
         return 'goto ' + n.name + ';'
@@ -306,6 +411,11 @@ class CGenerator(object):
             for individual visit_* methods to handle different treatment of
             some statements in this context.
         """
+        return ''.join(self._run(self._stmt_chunks(n, add_indent)))
+
+    def _stmt_chunks(self, n, add_indent=False):
+        """ Streaming version of _generate_stmt.
+        """
         typ = type(n)
         if add_indent: self.indent_level += 2
         indent = self._make_indent()
@@ -319,15 +429,20 @@ class CGenerator(object):
             # These can also appear in an expression context so no semicolon
             # is added to them automatically
             #
-            return indent + self.visit(n) + ';\n'
+            return [indent + self.visit(n) + ';\n']
         elif typ in (c_ast.Compound,):
             # No extra indentation required before the opening brace of a
             # compound - because it consists of multiple lines it has to
             # compute its own indentation.
             #
-            return self.visit(n)
+            return self._chunks(n)
         else:
-            return indent + self.visit(n) + '\n'
+            return self._indented_chunks(indent, n)
+
+    def _indented_chunks(self, indent, n):
+        yield indent
+        yield self._chunks(n)
+        yield '\n'
 
     def _generate_decl(self, n):
         """ Generation from a Decl node.
@@ -70,6 +70,18 @@ class CLexer(object):
         """
         self.lexer.lineno = 1
 
+    def reset(self, filename=''):
+        """ Resets everything the lexer remembers from its last input, so
+            it can start on a new file: the line number, the file name, the
+            last token, and the lexer state, which a syntax error can leave
+            inside a #line or #pragma.
+        """
+        self.filename = filename
+        self.last_token = None
+        self.pp_line = self.pp_filename = None
+        self.lexer.begin('INITIAL')
+        self.reset_lineno()
+
     def input(self, text):
         self.lexer.input(text)
 
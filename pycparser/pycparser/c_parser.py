@@ -11,6 +11,7 @@ import re
 from .ply import yacc
 
 from . import c_ast
+from . import tablecache
 from .c_lexer import CLexer
 from .plyparser import PLYParser, Coord, ParseError
 from .ast_transforms import fix_switch_cases
@@ -24,7 +25,8 @@ class CParser(PLYParser):
             yacc_optimize=True,
             yacctab='pycparser.yacctab',
             yacc_debug=False,
-            taboutputdir=''):
+            taboutputdir='',
+            tabcache=False):
         """ Create a new CParser.
 
             Some arguments for controlling the debug/optimization
@@ -69,17 +71,37 @@ class CParser(PLYParser):
             taboutputdir:
                 Set this parameter to control the location of generated
                 lextab and yacctab files.
-        """
+
+            tabcache:
+                Set to True to keep the tables of the optimized lexer and
+                parser in a per-user cache directory (see
+                tablecache.cache_dir) instead of lextab and yacctab, named
+                by a hash of the lexer and grammar rules, or to a directory
+                to cache them there. They are then only generated once for
+                each version of the rules, even when pycparser is installed
+                read-only. Ignored if taboutputdir is set. By default the
+                tables are lextab and yacctab, as shipped with pycparser,
+                and nothing is written to the cache.
+        """
+        if tabcache and not taboutputdir and (lex_optimize or yacc_optimize):
+            if tabcache is True:
+                tabcache = tablecache.cache_dir()
+        else:
+            tabcache = None
+
         self.clex = CLexer(
             error_func=self._lex_error_func,
             on_lbrace_func=self._lex_on_lbrace_func,
             on_rbrace_func=self._lex_on_rbrace_func,
             type_lookup_func=self._lex_type_lookup_func)
 
-        self.clex.build(
-            optimize=lex_optimize,
-            lextab=lextab,
-            outputdir=taboutputdir)
+        if tabcache and lex_optimize:
+            tablecache.build_lexer(self.clex, tabcache)
+        else:
+            self.clex.build(
+                optimize=lex_optimize,
+                lextab=lextab,
+                outputdir=taboutputdir)
         self.tokens = self.clex.tokens
 
         rules_with_opt = [
@@ -102,13 +124,20 @@ class CParser(PLYParser):
         for rule in rules_with_opt:
             self._create_opt_rule(rule)
 
-        self.cparser = yacc.yacc(
-            module=self,
-            start='translation_unit_or_empty',
-            debug=yacc_debug,
-            optimize=yacc_optimize,
-            tabmodule=yacctab,
-            outputdir=taboutputdir)
+        if tabcache and yacc_optimize:
+            self.cparser = tablecache.build_parser(
+                module=self,
+                start='translation_unit_or_empty',
+                directory=tabcache,
+                debug=yacc_debug)
+        else:
+            self.cparser = yacc.yacc(
+                module=self,
+                start='translation_unit_or_empty',
+                debug=yacc_debug,
+                optimize=yacc_optimize,
+                tabmodule=yacctab,
+                outputdir=taboutputdir)
 
         # Stack of scopes for keeping track of symbols. _scope_stack[-1] is
         # the current (topmost) scope. Each scope is a dictionary that
@@ -136,8 +165,9 @@ class CParser(PLYParser):
             debuglevel:
                 Debug level to yacc
         """
-        self.clex.filename = filename
-        self.clex.reset_lineno()
+        self.clex.reset(filename)
+        self._position_file = None
+        self._positions = None
         self._scope_stack = [dict()]
         self._last_yielded_token = None
         return self.cparser.parse(
@@ -319,7 +349,7 @@ class CParser(PLYParser):
             if not isinstance(tn, c_ast.IdentifierType):
                 if len(typename) > 1:
                     self._parse_error(
-                        "Invalid multiple types specified", tn.coord)
+                        "Invalid multiple types specified", tn._coord)
                 else:
                     type.type = tn
                     return decl
@@ -329,17 +359,17 @@ class CParser(PLYParser):
             #
             if not isinstance(decl.type, c_ast.FuncDecl):
                 self._parse_error(
-                        "Missing type in declaration", decl.coord)
+                        "Missing type in declaration", decl._coord)
             type.type = c_ast.IdentifierType(
                     ['int'],
-                    coord=decl.coord)
+                    coord=decl._coord)
         else:
             # At this point, we know that typename is a list of IdentifierType
             # nodes. Concatenate all the names into a single list.
             #
             type.type = c_ast.IdentifierType(
                 [name for id in typename for name in id.names],
-                coord=typename[0].coord)
+                coord=typename[0]._coord)
         return decl
 
     def _add_declaration_specifier(self, declspec, newspec, kind):
@@ -393,7 +423,7 @@ class CParser(PLYParser):
                 declname=spec['type'][-1].names[0],
                 type=None,
                 quals=None,
-                coord=spec['type'][-1].coord)
+                coord=spec['type'][-1]._coord)
             # Remove the "new" type's name from the end of spec['type']
             del spec['type'][-1]
 
@@ -417,7 +447,7 @@ class CParser(PLYParser):
                     quals=spec['qual'],
                     storage=spec['storage'],
                     type=decl['decl'],
-                    coord=decl['decl'].coord)
+                    coord=decl['decl']._coord)
             else:
                 declaration = c_ast.Decl(
                     name=None,
@@ -427,7 +457,7 @@ class CParser(PLYParser):
                     type=decl['decl'],
                     init=decl.get('init'),
                     bitsize=decl.get('bitsize'),
-                    coord=decl['decl'].coord)
+                    coord=decl['decl']._coord)
 
             if isinstance(declaration.type,
                     (c_ast.Struct, c_ast.Union, c_ast.IdentifierType)):
@@ -440,9 +470,9 @@ class CParser(PLYParser):
             #
             if typedef_namespace:
                 if is_typedef:
-                    self._add_typedef_name(fixed_decl.name, fixed_decl.coord)
+                    self._add_typedef_name(fixed_decl.name, fixed_decl._coord)
                 else:
-                    self._add_identifier(fixed_decl.name, fixed_decl.coord)
+                    self._add_identifier(fixed_decl.name, fixed_decl._coord)
 
             declarations.append(fixed_decl)
 
@@ -462,7 +492,7 @@ class CParser(PLYParser):
             decl=declaration,
             param_decls=param_decls,
             body=body,
-            coord=decl.coord)
+            coord=decl._coord)
 
     def _select_struct_union_class(self, token):
         """ Given a token (either STRUCT or UNION), selects the
@@ -635,7 +665,7 @@ class CParser(PLYParser):
                     type=ty[0],
                     init=None,
                     bitsize=None,
-                    coord=ty[0].coord)]
+                    coord=ty[0]._coord)]
 
             # However, this case can also occur on redeclared identifiers in
             # an inner scope.  The trouble is that the redeclared type's name
@@ -936,7 +966,7 @@ class CParser(PLYParser):
                             | enumerator_list COMMA enumerator
         """
         if len(p) == 2:
-            p[0] = c_ast.EnumeratorList([p[1]], p[1].coord)
+            p[0] = c_ast.EnumeratorList([p[1]], p[1]._coord)
         elif len(p) == 3:
             p[0] = p[1]
         else:
@@ -955,7 +985,7 @@ class CParser(PLYParser):
             enumerator = c_ast.Enumerator(
                         p[1], p[3],
                         self._coord(p.lineno(1)))
-        self._add_identifier(enumerator.name, enumerator.coord)
+        self._add_identifier(enumerator.name, enumerator._coord)
 
         p[0] = enumerator
 
@@ -1008,7 +1038,7 @@ class CParser(PLYParser):
             type=None,
             dim=p[4] if len(p) > 5 else p[3],
             dim_quals=quals,
-            coord=p[1].coord)
+            coord=p[1]._coord)
 
         p[0] = self._type_modify_decl(decl=p[1], modifier=arr)
 
@@ -1027,7 +1057,7 @@ class CParser(PLYParser):
             type=None,
             dim=p[5],
             dim_quals=dim_quals,
-            coord=p[1].coord)
+            coord=p[1]._coord)
 
         p[0] = self._type_modify_decl(decl=p[1], modifier=arr)
 
@@ -1040,7 +1070,7 @@ class CParser(PLYParser):
             type=None,
             dim=c_ast.ID(p[4], self._coord(p.lineno(4))),
             dim_quals=p[3] if p[3] != None else [],
-            coord=p[1].coord)
+            coord=p[1]._coord)
 
         p[0] = self._type_modify_decl(decl=p[1], modifier=arr)
 
@@ -1051,7 +1081,7 @@ class CParser(PLYParser):
         func = c_ast.FuncDecl(
             args=p[3],
             type=None,
-            coord=p[1].coord)
+            coord=p[1]._coord)
 
         # To see why _get_yacc_lookahead_token is needed, consider:
         #   typedef char TT;
@@ -1068,7 +1098,7 @@ class CParser(PLYParser):
             if func.args is not None:
                 for param in func.args.params:
                     if isinstance(param, c_ast.EllipsisParam): break
-                    self._add_identifier(param.name, param.coord)
+                    self._add_identifier(param.name, param._coord)
 
         p[0] = self._type_modify_decl(decl=p[1], modifier=func)
 
@@ -1122,7 +1152,7 @@ class CParser(PLYParser):
                             | parameter_list COMMA parameter_declaration
         """
         if len(p) == 2: # single parameter
-            p[0] = c_ast.ParamList([p[1]], p[1].coord)
+            p[0] = c_ast.ParamList([p[1]], p[1]._coord)
         else:
             p[1].params.append(p[3])
             p[0] = p[1]
@@ -1174,7 +1204,7 @@ class CParser(PLYParser):
                             | identifier_list COMMA identifier
         """
         if len(p) == 2: # single parameter
-            p[0] = c_ast.ParamList([p[1]], p[1].coord)
+            p[0] = c_ast.ParamList([p[1]], p[1]._coord)
         else:
             p[1].params.append(p[3])
             p[0] = p[1]
@@ -1199,7 +1229,7 @@ class CParser(PLYParser):
         """
         if len(p) == 3: # single initializer
             init = p[2] if p[1] is None else c_ast.NamedInitializer(p[1], p[2])
-            p[0] = c_ast.InitList([init], p[2].coord)
+            p[0] = c_ast.InitList([init], p[2]._coord)
         else:
             init = p[4] if p[3] is None else c_ast.NamedInitializer(p[3], p[4])
             p[1].exprs.append(init)
@@ -1276,7 +1306,7 @@ class CParser(PLYParser):
             type=None,
             dim=p[3],
             dim_quals=[],
-            coord=p[1].coord)
+            coord=p[1]._coord)
 
         p[0] = self._type_modify_decl(decl=p[1], modifier=arr)
 
@@ -1296,7 +1326,7 @@ class CParser(PLYParser):
             type=None,
             dim=c_ast.ID(p[3], self._coord(p.lineno(3))),
             dim_quals=[],
-            coord=p[1].coord)
+            coord=p[1]._coord)
 
         p[0] = self._type_modify_decl(decl=p[1], modifier=arr)
 
@@ -1315,7 +1345,7 @@ class CParser(PLYParser):
         func = c_ast.FuncDecl(
             args=p[3],
             type=None,
-            coord=p[1].coord)
+            coord=p[1]._coord)
 
         p[0] = self._type_modify_decl(decl=p[1], modifier=func)
 
@@ -1426,7 +1456,7 @@ class CParser(PLYParser):
             p[0] = p[1]
         else:
             if not isinstance(p[1], c_ast.ExprList):
-                p[1] = c_ast.ExprList([p[1]], p[1].coord)
+                p[1] = c_ast.ExprList([p[1]], p[1]._coord)
 
             p[1].exprs.append(p[3])
             p[0] = p[1]
@@ -1442,7 +1472,7 @@ class CParser(PLYParser):
         if len(p) == 2:
             p[0] = p[1]
         else:
-            p[0] = c_ast.Assignment(p[2], p[1], p[3], p[1].coord)
+            p[0] = c_ast.Assignment(p[2], p[1], p[3], p[1]._coord)
 
     # K&R2 defines these as many separate rules, to encode
     # precedence and associativity. Why work hard ? I'll just use
@@ -1475,7 +1505,7 @@ class CParser(PLYParser):
         if len(p) == 2:
             p[0] = p[1]
         else:
-            p[0] = c_ast.TernaryOp(p[1], p[3], p[5], p[1].coord)
+            p[0] = c_ast.TernaryOp(p[1], p[3], p[5], p[1]._coord)
 
     def p_binary_expression(self, p):
         """ binary_expression   : cast_expression
@@ -1501,7 +1531,7 @@ class CParser(PLYParser):
         if len(p) == 2:
             p[0] = p[1]
         else:
-            p[0] = c_ast.BinaryOp(p[2], p[1], p[3], p[1].coord)
+            p[0] = c_ast.BinaryOp(p[2], p[1], p[3], p[1]._coord)
 
     def p_cast_expression_1(self, p):
         """ cast_expression : unary_expression """
@@ -1520,7 +1550,7 @@ class CParser(PLYParser):
                                 | MINUSMINUS unary_expression
                                 | unary_operator cast_expression
         """
-        p[0] = c_ast.UnaryOp(p[1], p[2], p[2].coord)
+        p[0] = c_ast.UnaryOp(p[1], p[2], p[2]._coord)
 
     def p_unary_expression_3(self, p):
         """ unary_expression    : SIZEOF unary_expression
@@ -1547,13 +1577,13 @@ class CParser(PLYParser):
 
     def p_postfix_expression_2(self, p):
         """ postfix_expression  : postfix_expression LBRACKET expression RBRACKET """
-        p[0] = c_ast.ArrayRef(p[1], p[3], p[1].coord)
+        p[0] = c_ast.ArrayRef(p[1], p[3], p[1]._coord)
 
     def p_postfix_expression_3(self, p):
         """ postfix_expression  : postfix_expression LPAREN argument_expression_list RPAREN
                                 | postfix_expression LPAREN RPAREN
         """
-        p[0] = c_ast.FuncCall(p[1], p[3] if len(p) == 5 else None, p[1].coord)
+        p[0] = c_ast.FuncCall(p[1], p[3] if len(p) == 5 else None, p[1]._coord)
 
     def p_postfix_expression_4(self, p):
         """ postfix_expression  : postfix_expression PERIOD ID
@@ -1562,13 +1592,13 @@ class CParser(PLYParser):
                                 | postfix_expression ARROW TYPEID
         """
         field = c_ast.ID(p[3], self._coord(p.lineno(3)))
-        p[0] = c_ast.StructRef(p[1], p[2], field, p[1].coord)
+        p[0] = c_ast.StructRef(p[1], p[2], field, p[1]._coord)
 
     def p_postfix_expression_5(self, p):
         """ postfix_expression  : postfix_expression PLUSPLUS
                                 | postfix_expression MINUSMINUS
         """
-        p[0] = c_ast.UnaryOp('p' + p[2], p[1], p[1].coord)
+        p[0] = c_ast.UnaryOp('p' + p[2], p[1], p[1]._coord)
 
     def p_postfix_expression_6(self, p):
         """ postfix_expression  : LPAREN type_name RPAREN brace_open initializer_list brace_close
@@ -1607,7 +1637,7 @@ class CParser(PLYParser):
                                         | argument_expression_list COMMA assignment_expression
         """
         if len(p) == 2: # single expr
-            p[0] = c_ast.ExprList([p[1]], p[1].coord)
+            p[0] = c_ast.ExprList([p[1]], p[1]._coord)
         else:
             p[1].exprs.append(p[3])
             p[0] = p[1]
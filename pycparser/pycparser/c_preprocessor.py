@@ -0,0 +1,324 @@
+#-----------------------------------------------------------------
+# pycparser: c_preprocessor.py
+#
+# CPreprocessor class: a C preprocessor that runs in the current
+# process, built on ply.cpp, so that preprocessing a file doesn't
+# need a cpp subprocess.
+#
+# Copyright (C) 2008-2015, Eli Bendersky
+# License: BSD
+#-----------------------------------------------------------------
+import os
+
+from .ply import cpp, lex
+from .ply.lex import LexToken
+
+
+# (name, value) of the macros the C99 standard has the implementation
+# define, which CPreprocessor defines before the ones of cpp_args.
+PREDEFINED = [
+    ('__STDC__', '1'),
+    ('__STDC_VERSION__', '199901L'),
+    ('__STDC_HOSTED__', '1'),
+]
+
+
+class CPreprocessor(object):
+    """ Preprocesses C files in this process with the preprocessor of
+        ply.cpp, producing text with linemarkers like the output of cpp.
+
+        Headers are read and split into tokens once and then reused by
+        every file this object preprocesses, for as long as their size and
+        modification time don't change. A header whose contents are all
+        inside an #ifndef include guard, or that has #pragma once, isn't
+        read again when it's included a second time by a file and its
+        guard is defined (or it had #pragma once). The values of #if
+        expressions are cached too, along with the definitions of the
+        macros they use, so a conditional in a header that every file
+        includes is only evaluated again where those macros differ.
+
+        Each file starts with the macros of PREDEFINED, those of ply.cpp
+        (__FILE__, __LINE__, __DATE__ and __TIME__) and those given in
+        cpp_args defined. Unlike cpp, none of the compiler's own macros,
+        like __GNUC__ or __x86_64__, are; give the ones the headers need in
+        cpp_args. Not supported, and passed through or skipped without an
+        error: #error, #warning, #line, #include_next, the _Pragma operator,
+        __COUNTER__, __has_include and __VA_OPT__.
+
+        cpp_args:
+            -I, -D and -U options, in the format of parse_file's cpp_args:
+            a string with one of them, or a list of strings. The argument
+            of an option may be in the same string or the next one.
+    """
+    def __init__(self, cpp_args=''):
+        self.include_dirs = []
+        # (name, value) of the predefined macros and -D options, with value
+        # None for -U.
+        self.defines = list(PREDEFINED)
+
+        if not isinstance(cpp_args, list):
+            cpp_args = [cpp_args] if cpp_args else []
+        args = iter(cpp_args)
+        for arg in args:
+            option, value = arg[:2], arg[2:]
+            if option not in ('-I', '-D', '-U'):
+                raise ValueError('Unsupported cpp argument: %r' % arg)
+            if not value:
+                value = next(args, '')
+                if not value:
+                    raise ValueError('Missing argument to %s' % option)
+
+            if option == '-I':
+                self.include_dirs.append(value)
+            elif option == '-D':
+                name, _, body = value.partition('=')
+                self.defines.append((name, body if _ else '1'))
+            else:
+                self.defines.append((value, None))
+
+        self._lexer = None
+        self._headers = {}
+        self._expressions = {}
+
+    def preprocess(self, filename):
+        """ Preprocesses filename and returns the result. IOError is raised
+            if it can't be read, and RuntimeError, like preprocess_file
+            raises when cpp fails, if a file it includes can't be found.
+            Other problems with directives are printed, and the directives
+            are skipped, as ply.cpp does.
+        """
+        pp = _FilePreprocessor(self._get_lexer(), self._headers)
+        pp.expr_cache = self._expressions
+        for path in self.include_dirs:
+            pp.add_path(path)
+        for name, value in self.defines:
+            if value is None:
+                pp.undef([_token('CPP_ID', name)])
+            else:
+                pp.define('%s %s' % (name, value))
+
+        header = pp.read(filename)
+        if header is None:
+            raise IOError('Unable to read %r' % filename)
+        dirname = os.path.dirname(filename)
+        if dirname:
+            pp.temp_path.insert(0, dirname)
+        return _text(pp.parsefile(header, filename))
+
+    def _get_lexer(self):
+        if self._lexer is None:
+            self._lexer = lex.lex(module=cpp, optimize=False, debug=False)
+        return self._lexer
+
+    def __getstate__(self):
+        # The lexer can't be pickled, so a copy in another process builds
+        # its own, and starts with nothing cached.
+        state = self.__dict__.copy()
+        state['_lexer'] = None
+        state['_headers'] = {}
+        state['_expressions'] = {}
+        return state
+
+
+# The type of the tokens _FilePreprocessor yields when the file the tokens
+# after it come from changes. The value is the name of that file.
+_LINEMARKER = 'CPP_LINEMARKER'
+
+
+class _Header(object):
+    """ A file split into lines of tokens, as group_lines() returns them.
+        stamp is the (size, modification time) of the file they were read
+        from, guard the macro of its include guard or None, and once is
+        True if it has #pragma once. ply.cpp copies the tokens it changes,
+        so every file including the header shares them.
+    """
+    def __init__(self, stamp, lines, guard, once):
+        self.stamp = stamp
+        self.lines = lines
+        self.guard = guard
+        self.once = once
+
+
+
+class _FilePreprocessor(cpp.Preprocessor):
+    """ The ply.cpp Preprocessor for one file, taking the headers it includes
+        from headers, a dictionary of _Header by absolute path shared by all
+        the files of a CPreprocessor.
+    """
+    def __init__(self, lexer, headers):
+        cpp.Preprocessor.__init__(self, lexer)
+        self.headers = headers
+        # Absolute paths of the files included so far.
+        self.included = set()
+
+    def read(self, filename):
+        """ Returns the _Header of filename, reading it if it isn't cached or
+            changed, or None if it can't be read.
+        """
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+        stamp = (st.st_size, st.st_mtime)
+
+        key = os.path.abspath(filename)
+        header = self.headers.get(key)
+        if header is None or header.stamp != stamp:
+            try:
+                with open(filename) as f:
+                    text = f.read()
+            except (IOError, OSError):
+                return None
+            lines = list(self.group_lines(cpp.trigraph(text)))
+            header = _Header(stamp, lines, _include_guard(lines),
+                             _pragma_once(lines))
+            self.headers[key] = header
+        return header
+
+    def parsefile(self, header, filename):
+        """ Yields the tokens of header, the contents of filename, preceded
+            by a linemarker token.
+        """
+        self.included.add(os.path.abspath(filename))
+        yield _token(_LINEMARKER, filename)
+        for tok in self.parselines(header.lines, filename):
+            yield tok
+
+    def include(self, tokens):
+        found = self.include_name(tokens)
+        if not found:
+            return
+        filename, path = found
+        for p in path:
+            iname = os.path.join(p, filename)
+            header = self.read(iname)
+            if header is not None:
+                break
+        else:
+            raise RuntimeError("%s:%d: Couldn't find '%s'"
+                               % (self.source, tokens[0].lineno, filename))
+
+        if header.guard is not None and header.guard in self.macros:
+            return
+        if header.once and os.path.abspath(iname) in self.included:
+            return
+
+        source = self.source
+        dname = os.path.dirname(iname)
+        if dname:
+            self.temp_path.insert(0, dname)
+        for tok in self.parsefile(header, iname):
+            yield tok
+        if dname:
+            del self.temp_path[0]
+        yield _token(_LINEMARKER, source)
+
+    def group_lines(self, input):
+        # ply.cpp keeps comments as tokens, and a // comment takes the
+        # newline ending its line with it. Comments are replaced with
+        # whitespace, ending the line after a // comment.
+        current_line = []
+        for line in cpp.Preprocessor.group_lines(self, input):
+            for tok in line:
+                if tok.type == 'CPP_COMMENT':
+                    tok.type = self.t_SPACE
+                    tok.value = '\n' if tok.value.endswith('\n') else ' '
+                current_line.append(tok)
+                if tok.type in self.t_WS and '\n' in tok.value:
+                    yield current_line
+                    current_line = []
+        if current_line:
+            yield current_line
+
+
+def _token(type, value, lineno=1):
+    tok = LexToken()
+    tok.type = type
+    tok.value = value
+    tok.lineno = lineno
+    tok.lexpos = 0
+    return tok
+
+
+def _significant(line):
+    # The tokens of line that aren't whitespace.
+    return [tok for tok in line if tok.type != 'CPP_WS']
+
+
+def _directive(tokens):
+    # The name of the directive in tokens, a line without whitespace, or
+    # None if it isn't one.
+    if len(tokens) > 1 and tokens[0].value == '#':
+        return tokens[1].value
+    return None
+
+
+def _pragma_once(lines):
+    for line in lines:
+        tokens = _significant(line)
+        if (_directive(tokens) == 'pragma' and len(tokens) == 3 and
+                tokens[2].value == 'once'):
+            return True
+    return False
+
+
+def _include_guard(lines):
+    """ Returns the macro X if the lines, besides #pragma once, are all
+        inside #ifndef X ... #endif with no #else or #elif, so that nothing
+        is left of them once X is defined. Otherwise returns None.
+    """
+    guard = None
+    depth = 0
+    closed = False
+    for line in lines:
+        tokens = _significant(line)
+        if not tokens:
+            continue
+        if closed:
+            return None
+
+        name = _directive(tokens)
+        if name == 'pragma' and [t.value for t in tokens[2:]] == ['once']:
+            continue
+        if guard is None:
+            if name == 'ifndef' and len(tokens) == 3:
+                guard = tokens[2].value
+                depth = 1
+                continue
+            return None
+
+        if name in ('if', 'ifdef', 'ifndef'):
+            depth += 1
+        elif name in ('else', 'elif') and depth == 1:
+            return None
+        elif name == 'endif':
+            depth -= 1
+            closed = depth == 0
+    return guard if closed else None
+
+
+def _text(tokens):
+    """ Joins the tokens from _FilePreprocessor into text, with linemarkers
+        or newlines keeping every token on the line it came from.
+    """
+    parts = []
+    filename = None
+    line = None
+    for tok in tokens:
+        if tok.type == _LINEMARKER:
+            filename = tok.value
+            line = None
+            continue
+        if tok.type == 'CPP_WS' and '\n' in tok.value:
+            continue
+
+        if tok.lineno != line:
+            if line is not None and 0 < tok.lineno - line <= 8:
+                parts.append('\n' * (tok.lineno - line))
+            else:
+                parts.append('\n# %d "%s"\n' % (tok.lineno,
+                    filename.replace('\\', '\\\\').replace('"', '\\"')))
+            line = tok.lineno
+        parts.append(str(tok.value))
+    parts.append('\n')
+    return ''.join(parts)
@@ -0,0 +1,226 @@
+#-----------------------------------------------------------------
+# pycparser: cppcache.py
+#
+# On-disk cache of preprocessed C files, so that cpp only runs
+# again when a file or one of the headers it includes changed.
+#
+# Copyright (C) 2008-2015, Eli Bendersky
+# License: BSD
+#-----------------------------------------------------------------
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+
+from .tablecache import cache_dir
+
+
+# How long a temporary file of an interrupted write is left alone before
+# eviction removes it, so that writes in progress aren't disturbed.
+STALE_TMP_AGE = 60 * 60
+
+
+# A linemarker from cpp, '# 12 "file.h" 1 3', or a #line directive.
+_linemarker = re.compile(
+    r'^[ \t]*#[ \t]*(?:line[ \t]+)?\d+[ \t]+"((?:[^"\\]|\\.)*)"',
+    re.MULTILINE)
+_escape = re.compile(r'\\(.)')
+
+
+def included_files(text):
+    """ Returns the files named in the linemarkers of text, the output of
+        cpp, in the order they first appear. cpp's own pseudo files, like
+        <built-in>, are left out.
+    """
+    files = []
+    seen = set()
+    for match in _linemarker.finditer(text):
+        name = _escape.sub(r'\1', match.group(1))
+        if name not in seen and not name.startswith('<'):
+            seen.add(name)
+            files.append(name)
+    return files
+
+
+class PreprocessCache(object):
+    """ Cache of the output of cpp.
+
+        An entry is keyed by the contents and name of the source file,
+        cpp_path, cpp_args and the working directory, and holds the
+        preprocessed text along with the size and modification time of
+        every file cpp included, taken from the linemarkers in its output.
+        The entry is only used while all of those files are unchanged. A
+        header that didn't exist when the entry was made, but would now
+        be found first on the include path, isn't noticed.
+
+        directory:
+            Where to keep the entries. Defaults to a cpp directory in
+            tablecache.cache_dir(). If there is no usable directory,
+            nothing is cached.
+
+        max_size:
+            The most bytes the entries may take up. When new entries make
+            them take more, the least recently used ones are removed until
+            they take up three quarters of it. The size of the entries is
+            only counted again then, and by the first put().
+    """
+    def __init__(self, directory=None, max_size=256 * 1024 * 1024):
+        self.directory = cache_subdir(directory, 'cpp')
+        self.max_size = max_size
+        self._size = None
+
+    def key(self, filename, cpp_path, cpp_args):
+        """ Returns the key of the entry for preprocessing filename with
+            cpp_path and cpp_args, a list of arguments.
+        """
+        h = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            h.update(f.read())
+        h.update(repr((filename, cpp_path, list(cpp_args),
+                       os.getcwd())).encode('utf-8'))
+        return h.hexdigest()
+
+    def get(self, key):
+        """ Returns the cached text for key, or None if there is none or
+            an included file changed since it was cached.
+        """
+        if self.directory is None:
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+        for name, size, mtime in entry['files']:
+            if _stamp(name) != (size, mtime):
+                return None
+
+        # The modification time of an entry is when it was last used.
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry['text']
+
+    def put(self, key, text):
+        """ Caches text, the output of cpp, under key.
+        """
+        if self.directory is None:
+            return
+
+        files = []
+        for name in included_files(text):
+            stamp = _stamp(name)
+            if stamp is None:
+                # Something we can't check later; don't cache it.
+                return
+            files.append([name, stamp[0], stamp[1]])
+
+        data = json.dumps({'files': files, 'text': text})
+        try:
+            fd, tmp = tempfile.mkstemp(prefix='.tmp', dir=self.directory)
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            getattr(os, 'replace', os.rename)(tmp, self._path(key))
+        except (IOError, OSError):
+            return
+
+        # The entries are only counted again when the count crosses
+        # max_size, and then evicted down to three quarters of it, so
+        # that puts don't list the directory. Replaced entries and other
+        # processes sharing the directory make the count an estimate,
+        # which evicting corrects.
+        if self._size is not None and \
+                self._size + len(data) <= self.max_size:
+            self._size += len(data)
+        else:
+            self._size = evict(self.directory, '.json', self.max_size,
+                               self.max_size * 3 // 4)
+
+    def evict(self):
+        """ Removes the least recently used entries until the rest fit in
+            max_size, and stale temporary files.
+        """
+        self._size = evict(self.directory, '.json', self.max_size)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+
+def cache_subdir(directory, name):
+    """ Returns directory, or the name directory in tablecache.cache_dir()
+        if it's None, creating it if needed. Returns None if there is no
+        usable directory.
+    """
+    if directory is None:
+        base = cache_dir()
+        directory = os.path.join(base, name) if base else None
+    if directory is not None and not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            directory = None
+    return directory
+
+
+def evict(directory, suffix, max_size, target=None):
+    """ Removes the least recently used files ending in suffix from
+        directory if they take up more than max_size bytes, until the rest
+        fit in target bytes (max_size by default). A file is used when it's
+        written, and its modification time is updated when it's read.
+        Temporary files left by writes that were interrupted more than
+        STALE_TMP_AGE seconds ago are removed too. Returns how many bytes
+        the remaining files take up.
+    """
+    if target is None:
+        target = max_size
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return 0
+
+    entries = []
+    stale = time.time() - STALE_TMP_AGE
+    for name in names:
+        path = os.path.join(directory, name)
+        if name.startswith('.tmp'):
+            try:
+                if os.stat(path).st_mtime < stale:
+                    os.remove(path)
+            except OSError:
+                pass
+            continue
+        if not name.endswith(suffix):
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, name))
+
+    total = sum(size for mtime, size, name in entries)
+    if total <= max_size:
+        return total
+    for mtime, size, name in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+        total -= size
+    return total
+
+
+def _stamp(name):
+    # (size, modification time) of a file, or None if it's gone.
+    try:
+        st = os.stat(name)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime)
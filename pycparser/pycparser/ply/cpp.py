@@ -9,6 +9,15 @@
 # -----------------------------------------------------------------------------
 from __future__ import generators
 
+import sys
+
+# Some Python 3 compatibility shims
+if sys.version_info[0] < 3:
+    STRING_TYPES = (str, unicode)
+else:
+    STRING_TYPES = str
+    xrange = range
+
 # -----------------------------------------------------------------------------
 # Default preprocessor lexer definitions.   These tokens are enough to get
 # a basic preprocessor working.   Other modules may import these if they want
@@ -67,7 +76,6 @@ def t_error(t):
     return t
 
 import re
-import copy
 import time
 import os.path
 
@@ -116,8 +124,8 @@ def trigraph(input):
 #    .vararg    - Name of the variadic parameter
 #
 # When a macro is created, the macro replacement token sequence is
-# pre-scanned and used to create patch lists that are later used
-# during macro expansion
+# pre-scanned and compiled into a template that is later filled in
+# with the arguments during macro expansion (see macro_prescan())
 # ------------------------------------------------------------------
 
 class Macro(object):
@@ -130,6 +138,252 @@ class Macro(object):
             self.vararg = arglist[-1]
         self.source = None
 
+# Kinds of the pieces of a macro template
+LITERAL = 0      # A token of the replacement, copied
+EXPAND = 1       # An argument, macro expanded
+RAW = 2          # An argument left as it is, as an operand of ##
+STRINGIZE = 3    # An argument converted to a string by #
+
+# Copy a token.  Faster than copy.copy() for the tokens of a lexer.
+def copy_token(tok):
+    new = tok.__class__.__new__(tok.__class__)
+    new.__dict__.update(tok.__dict__)
+    return new
+
+# ------------------------------------------------------------------
+# #if expressions
+#
+# evaluate() computes the value of the expression of an #if or #elif
+# directive, once macros are expanded and defined() is replaced, with
+# the integer arithmetic of the preprocessor: values are 64-bit and
+# signed, unless one of the operands is unsigned, and && || ?: only
+# evaluate the operands they need.  Identifiers left over are 0.
+# ------------------------------------------------------------------
+
+class ExpressionError(Exception):
+    pass
+
+_expr_token = re.compile(r"""\s*(?:
+      (?P<number>(?:0[xX][0-9a-fA-F]+|\d+)[uUlL]*)
+    | (?P<char>L?'(?:[^'\\\n]|\\.)+')
+    | (?P<name>[A-Za-z_]\w*)
+    | (?P<op>&&|\|\||<<|>>|<=|>=|==|!=|[-+*/%&|^~!<>?:(),])
+    )""", re.VERBOSE)
+
+_binary_precedence = {
+    ',': 0,
+    '||': 2, '&&': 3, '|': 4, '^': 5, '&': 6,
+    '==': 7, '!=': 7, '<': 8, '>': 8, '<=': 8, '>=': 8,
+    '<<': 9, '>>': 9, '+': 10, '-': 10, '*': 11, '/': 11, '%': 11,
+}
+_conditional_precedence = 1
+
+_char_escapes = {
+    'n': 10, 't': 9, 'r': 13, 'a': 7, 'b': 8, 'f': 12, 'v': 11,
+    '\\': 92, "'": 39, '"': 34, '?': 63,
+}
+
+_MASK = (1 << 64) - 1
+
+# A value is a tuple (int,unsigned).  Wrap v to the range of its type.
+def _value(v,unsigned):
+    v &= _MASK
+    if not unsigned and v >> 63:
+        v -= 1 << 64
+    return (v,unsigned)
+
+def _number(text):
+    digits = text.rstrip('uUlL')
+    unsigned = 'u' in text[len(digits):].lower()
+    if digits[:2] in ('0x','0X'):
+        v = int(digits[2:],16)
+    elif digits[0] == '0' and len(digits) > 1:
+        try:
+            v = int(digits[1:],8)
+        except ValueError:
+            raise ExpressionError("Invalid octal constant %s" % text)
+    else:
+        v = int(digits)
+    if v >> 63:
+        unsigned = True
+    return _value(v,unsigned)
+
+def _char(text):
+    body = text[text.index("'")+1:-1]
+    v = 0
+    i = 0
+    while i < len(body):
+        c = body[i]
+        if c != '\\':
+            code = ord(c)
+            i += 1
+        elif body[i+1] in _char_escapes:
+            code = _char_escapes[body[i+1]]
+            i += 2
+        elif body[i+1] in 'xX':
+            j = i + 2
+            while j < len(body) and body[j] in '0123456789abcdefABCDEF':
+                j += 1
+            code = int(body[i+2:j] or '0',16) & 0xff
+            i = j
+        elif body[i+1] in '01234567':
+            j = i + 1
+            while j < len(body) and j < i + 4 and body[j] in '01234567':
+                j += 1
+            code = int(body[i+1:j],8) & 0xff
+            i = j
+        else:
+            code = ord(body[i+1])
+            i += 2
+        v = (v << 8) | code
+    if len(body) == 1 or (body[0] == '\\' and v < 256):
+        # A single char is a signed char
+        if v >= 128:
+            v -= 256
+    return _value(v,False)
+
+def _binary(op,a,b):
+    x, xu = a
+    y, yu = b
+    if op in ('<<','>>'):
+        if y < 0 or y >= 64:
+            y = 64 if y >= 0 else 0
+        return _value(x << y if op == '<<' else x >> y,xu)
+    unsigned = xu or yu
+    if unsigned:
+        x &= _MASK
+        y &= _MASK
+    if op == '+':
+        v = x + y
+    elif op == '-':
+        v = x - y
+    elif op == '*':
+        v = x * y
+    elif op in ('/','%'):
+        if y == 0:
+            raise ExpressionError("Division by zero")
+        # C division truncates toward zero
+        q = abs(x) // abs(y)
+        if (x < 0) != (y < 0):
+            q = -q
+        v = q if op == '/' else x - q * y
+    elif op == '&':
+        v = x & y
+    elif op == '^':
+        v = x ^ y
+    elif op == '|':
+        v = x | y
+    elif op == '==':
+        return (int(x == y),False)
+    elif op == '!=':
+        return (int(x != y),False)
+    elif op == '<':
+        return (int(x < y),False)
+    elif op == '>':
+        return (int(x > y),False)
+    elif op == '<=':
+        return (int(x <= y),False)
+    else:
+        return (int(x >= y),False)
+    return _value(v,unsigned)
+
+class _ExpressionParser(object):
+    def __init__(self,text):
+        self.tokens = []
+        pos = 0
+        text = text.rstrip()
+        while pos < len(text):
+            m = _expr_token.match(text,pos)
+            if not m:
+                raise ExpressionError("Unexpected %r" % text[pos:].strip()[:1])
+            self.tokens.append((m.lastgroup,m.group(m.lastgroup)))
+            pos = m.end()
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos][1]
+        return None
+
+    def next(self):
+        if self.pos >= len(self.tokens):
+            raise ExpressionError("Unexpected end of expression")
+        self.pos += 1
+        return self.tokens[self.pos-1]
+
+    def expect(self,op):
+        kind, value = self.next()
+        if value != op:
+            raise ExpressionError("Expected %r, found %r" % (op,value))
+
+    # Parse the expression starting at pos whose binary operators bind at
+    # least as tightly as min_prec, by precedence climbing.  Its value is
+    # computed if evaluate is true, and (0,False) is returned otherwise.
+    def expression(self,min_prec,evaluate):
+        value = self.unary(evaluate)
+        while True:
+            op = self.peek()
+            if op == '?' and min_prec <= _conditional_precedence:
+                self.next()
+                true = value[0] != 0
+                a = self.expression(0,evaluate and true)
+                self.expect(':')
+                b = self.expression(_conditional_precedence,evaluate and not true)
+                value = a if true else b
+                if a[1] or b[1]:
+                    value = _value(value[0],True)
+                continue
+            prec = _binary_precedence.get(op)
+            if prec is None or prec < min_prec:
+                return value
+            self.next()
+            if op == '&&':
+                rhs = self.expression(prec+1,evaluate and value[0] != 0)
+                value = (int(value[0] != 0 and rhs[0] != 0),False)
+            elif op == '||':
+                rhs = self.expression(prec+1,evaluate and value[0] == 0)
+                value = (int(value[0] != 0 or rhs[0] != 0),False)
+            else:
+                rhs = self.expression(prec+1,evaluate)
+                if op == ',':
+                    value = rhs
+                elif evaluate:
+                    value = _binary(op,value,rhs)
+                else:
+                    value = (0,False)
+
+    def unary(self,evaluate):
+        kind, value = self.next()
+        if kind == 'number':
+            return _number(value)
+        elif kind == 'char':
+            return _char(value)
+        elif kind == 'name':
+            return (0,False)
+        elif value == '(':
+            result = self.expression(0,evaluate)
+            self.expect(')')
+            return result
+        elif value in ('+','-','~','!'):
+            v, unsigned = self.unary(evaluate)
+            if value == '-':
+                return _value(-v,unsigned)
+            elif value == '~':
+                return _value(~v,unsigned)
+            elif value == '!':
+                return (int(v == 0),False)
+            return (v,unsigned)
+        raise ExpressionError("Unexpected %r" % value)
+
+def evaluate(text):
+    """Returns the value of the #if expression in text as an int.  Raises
+    ExpressionError if it isn't valid."""
+    parser = _ExpressionParser(text)
+    value = parser.expression(0,True)
+    if parser.pos != len(parser.tokens):
+        raise ExpressionError("Unexpected %r" % parser.peek())
+    return value[0]
+
 # ------------------------------------------------------------------
 # Preprocessor object
 #
@@ -143,6 +397,8 @@ class Preprocessor(object):
             lexer = lex.lexer
         self.lexer = lexer
         self.macros = { }
+        self.paste_types = { }
+        self.expr_cache = { }
         self.path = []
         self.temp_path = []
 
@@ -307,11 +563,12 @@ class Preprocessor(object):
     # ----------------------------------------------------------------------
     # collect_args()
     #
-    # Collects comma separated arguments from a list of tokens.   The arguments
-    # must be enclosed in parenthesis.  Returns a tuple (tokencount,args,positions)
-    # where tokencount is the number of tokens consumed, args is a list of arguments,
-    # and positions is a list of integers containing the starting index of each
-    # argument.  Each argument is represented by a list of tokens.
+    # Collects comma separated arguments from a list of tokens, starting at
+    # index start.   The arguments must be enclosed in parenthesis.  Returns
+    # a tuple (tokencount,args,positions) where tokencount is the number of
+    # tokens consumed, args is a list of arguments, and positions is a list
+    # of integers containing the starting index of each argument, relative
+    # to start.  Each argument is represented by a list of tokens.
     #
     # When collecting arguments, leading and trailing whitespace is removed
     # from each argument.  
@@ -320,7 +577,7 @@ class Preprocessor(object):
     # define new arguments.
     # ----------------------------------------------------------------------
 
-    def collect_args(self,tokenlist):
+    def collect_args(self,tokenlist,start=0):
         args = []
         positions = []
         current_arg = []
@@ -328,14 +585,14 @@ class Preprocessor(object):
         tokenlen = len(tokenlist)
     
         # Search for the opening '('.
-        i = 0
+        i = start
         while (i < tokenlen) and (tokenlist[i].type in self.t_WS):
             i += 1
 
         if (i < tokenlen) and (tokenlist[i].value == '('):
-            positions.append(i+1)
+            positions.append(i+1-start)
         else:
-            self.error(self.source,tokenlist[0].lineno,"Missing '(' in macro arguments")
+            self.error(self.source,tokenlist[start].lineno,"Missing '(' in macro arguments")
             return 0, [], []
 
         i += 1
@@ -348,14 +605,16 @@ class Preprocessor(object):
             elif t.value == ')':
                 nesting -= 1
                 if nesting == 0:
-                    if current_arg:
+                    # The last argument may be empty, as in F(a,), but
+                    # F() has no arguments.
+                    if current_arg or args:
                         args.append(self.tokenstrip(current_arg))
-                        positions.append(i)
-                    return i+1,args,positions
+                        positions.append(i-start)
+                    return i+1-start,args,positions
                 current_arg.append(t)
             elif t.value == ',' and nesting == 1:
                 args.append(self.tokenstrip(current_arg))
-                positions.append(i+1)
+                positions.append(i+1-start)
                 current_arg = []
             else:
                 current_arg.append(t)
@@ -368,162 +627,296 @@ class Preprocessor(object):
     # ----------------------------------------------------------------------
     # macro_prescan()
     #
-    # Examine the macro value (token sequence) and identify patch points
-    # This is used to speed up macro expansion later on---we'll know
-    # right away where to apply patches to the value to form the expansion
+    # Examine the macro value (token sequence) and compile it into a template,
+    # so that expanding the macro is only a matter of filling it in.  Sets
+    #
+    #    .template  - List of (kind,value) pieces.  value is a token for a
+    #                 LITERAL piece and an argument number otherwise
+    #    .pastes    - Set of the indices of the pieces joined by ## to the
+    #                 piece after them
+    #    .var_comma - Index of the comma piece of ", ## __VA_ARGS__", which is
+    #                 left out when the variadic argument is empty, or None
+    #    .simple    - True if the template is only literal tokens
+    #    .first_id  - For a simple macro, the index of its first identifier,
+    #                 where rescanning the expansion starts, or None if there
+    #                 is nothing to rescan
+    #    .ids       - Identifiers in the template, which it may expand
+    #    .key       - Tuple that is equal for equal definitions
     # ----------------------------------------------------------------------
     
     def macro_prescan(self,macro):
-        macro.patch     = []             # Standard macro arguments 
-        macro.str_patch = []             # String conversion expansion
-        macro.var_comma_patch = []       # Variadic macro comma patch
+        arglist = macro.arglist or []
+        value = macro.value
+        template = []
+        pastes = set()
+        var_comma = None
         i = 0
-        while i < len(macro.value):
-            if macro.value[i].type == self.t_ID and macro.value[i].value in macro.arglist:
-                argnum = macro.arglist.index(macro.value[i].value)
+        while i < len(value):
+            tok = value[i]
+            if tok.value == '##' and template:
+                if (macro.variadic and template[-1][0] == LITERAL and
+                        template[-1][1].value == ',' and (i+1) < len(value) and
+                        value[i+1].value == macro.vararg):
+                    var_comma = len(template)-1
+                else:
+                    pastes.add(len(template)-1)
+                i += 1
+                continue
+            if tok.value == '#' and macro.arglist is not None:
                 # Conversion of argument to a string
-                if i > 0 and macro.value[i-1].value == '#':
-                    macro.value[i] = copy.copy(macro.value[i])
-                    macro.value[i].type = self.t_STRING
-                    del macro.value[i-1]
-                    macro.str_patch.append((argnum,i-1))
-                    continue
-                # Concatenation
-                elif (i > 0 and macro.value[i-1].value == '##'):
-                    macro.patch.append(('c',argnum,i-1))
-                    del macro.value[i-1]
-                    continue
-                elif ((i+1) < len(macro.value) and macro.value[i+1].value == '##'):
-                    macro.patch.append(('c',argnum,i))
-                    i += 1
+                j = i + 1
+                while j < len(value) and value[j].type in self.t_WS:
+                    j += 1
+                if j < len(value) and value[j].type == self.t_ID and value[j].value in arglist:
+                    template.append((STRINGIZE,arglist.index(value[j].value)))
+                    i = j + 1
                     continue
-                # Standard expansion
+            if tok.type == self.t_ID and tok.value in arglist:
+                argnum = arglist.index(tok.value)
+                # Operands of ## are not expanded
+                if ((template and len(template)-1 in pastes) or
+                        ((i+1) < len(value) and value[i+1].value == '##')):
+                    template.append((RAW,argnum))
                 else:
-                    macro.patch.append(('e',argnum,i))
-            elif macro.value[i].value == '##':
-                if macro.variadic and (i > 0) and (macro.value[i-1].value == ',') and \
-                        ((i+1) < len(macro.value)) and (macro.value[i+1].type == self.t_ID) and \
-                        (macro.value[i+1].value == macro.vararg):
-                    macro.var_comma_patch.append(i-1)
+                    template.append((EXPAND,argnum))
+            else:
+                template.append((LITERAL,tok))
             i += 1
-        macro.patch.sort(key=lambda x: x[2],reverse=True)
+
+        macro.template = template
+        macro.pastes = pastes
+        macro.var_comma = var_comma
+        macro.simple = not pastes and all(kind == LITERAL for kind, _ in template)
+        macro.ids = [tok.value for kind, tok in template
+                     if kind == LITERAL and tok.type == self.t_ID]
+        macro.key = (tuple([(tok.type,tok.value) for tok in value]),
+                     macro.arglist is not None and tuple(macro.arglist),
+                     macro.variadic)
+        macro.first_id = None
+        if macro.simple:
+            for i, (kind, tok) in enumerate(template):
+                if tok.type == self.t_ID:
+                    macro.first_id = i
+                    break
 
     # ----------------------------------------------------------------------
     # macro_expand_args()
     #
     # Given a Macro and list of arguments (each a token list), this method
-    # returns an expanded version of a macro.  The return value is a token sequence
-    # representing the replacement macro tokens
+    # fills in the template of the macro.  Returns a tuple (rep,rescan) where
+    # rep is the replacement token sequence, and rescan is the index of its
+    # first token that may still be macro expanded, or None if none may.
+    # Arguments are expanded before they are substituted, so only the
+    # identifiers of the template, unexpanded arguments, pasted tokens and
+    # names of macros left in expanded arguments need another look.
+    #
+    # The tokens of rep are copies that the caller may change.  If owned is
+    # true, the tokens of args are such copies too, and are used as they are.
     # ----------------------------------------------------------------------
 
-    def macro_expand_args(self,macro,args):
-        # Make a copy of the macro token sequence
-        rep = [copy.copy(_x) for _x in macro.value]
+    def macro_expand_args(self,macro,args,owned=False):
+        if macro.simple:
+            return [copy_token(x) for _, x in macro.template], macro.first_id
 
-        # Make string expansion patches.  These do not alter the length of the replacement sequence
-        
-        str_expansion = {}
-        for argnum, i in macro.str_patch:
-            if argnum not in str_expansion:
-                str_expansion[argnum] = ('"%s"' % "".join([x.value for x in args[argnum]])).replace("\\","\\\\")
-            rep[i] = copy.copy(rep[i])
-            rep[i].value = str_expansion[argnum]
-
-        # Make the variadic macro comma patch.  If the variadic macro argument is empty, we get rid
-        comma_patch = False
-        if macro.variadic and not args[-1]:
-            for i in macro.var_comma_patch:
-                rep[i] = None
-                comma_patch = True
-
-        # Make all other patches.   The order of these matters.  It is assumed that the patch list
-        # has been sorted in reverse order of patch location since replacements will cause the
-        # size of the replacement sequence to expand from the patch point.
-        
+        rep = []
+        rescan = None
         expanded = { }
-        for ptype, argnum, i in macro.patch:
-            # Concatenation.   Argument is left unexpanded
-            if ptype == 'c':
-                rep[i:i+1] = args[argnum]
-            # Normal expansion.  Argument is macro expanded first
-            elif ptype == 'e':
-                if argnum not in expanded:
-                    expanded[argnum] = self.expand_macros(args[argnum])
-                rep[i:i+1] = expanded[argnum]
+        drop_comma = macro.variadic and not args[-1]
+        joinable = False
+        for index, (kind, value) in enumerate(macro.template):
+            if kind == LITERAL:
+                if index == macro.var_comma and drop_comma:
+                    joinable = False
+                    continue
+                piece = [copy_token(value)]
+                if rescan is None and value.type == self.t_ID:
+                    rescan = len(rep)
+            elif kind == EXPAND:
+                if value not in expanded:
+                    expanded[value] = self.expand_macros(args[value],owned=owned)
+                piece = expanded[value]
+                if not owned:
+                    piece = [copy_token(x) for x in piece]
+                if rescan is None:
+                    for i, tok in enumerate(piece):
+                        if tok.type == self.t_ID and tok.value in self.macros:
+                            rescan = len(rep) + i
+                            break
+            elif kind == RAW:
+                piece = args[value]
+                if not owned:
+                    piece = [copy_token(x) for x in piece]
+                if rescan is None and piece:
+                    rescan = len(rep)
+            else:
+                piece = [self.macro_stringize(args[value])]
+
+            if joinable and piece:
+                pasted = self.macro_paste(rep[-1],piece[0])
+                if pasted is not None:
+                    rep[-1] = pasted
+                    piece = piece[1:]
+                    if rescan is None and pasted.type == self.t_ID:
+                        rescan = len(rep) - 1
+            rep.extend(piece)
+            joinable = index in macro.pastes and (bool(piece) or joinable)
 
-        # Get rid of removed comma if necessary
-        if comma_patch:
-            rep = [_i for _i in rep if _i]
+        return rep, rescan
+
+    # ----------------------------------------------------------------------
+    # macro_stringize()
+    #
+    # Returns a string token holding the text of an argument, as the #
+    # operator does
+    # ----------------------------------------------------------------------
+
+    def macro_stringize(self,tokens):
+        parts = []
+        for tok in tokens:
+            if tok.type in self.t_WS:
+                if parts and parts[-1] != ' ':
+                    parts.append(' ')
+                continue
+            text = str(tok.value)
+            if tok.type == self.t_STRING or text[-1:] == "'":
+                text = text.replace('\\','\\\\').replace('"','\\"')
+            parts.append(text)
+        tok = copy_token(tokens[0]) if tokens else self.tokenize('""')[0]
+        tok.type = self.t_STRING
+        tok.value = '"%s"' % "".join(parts)
+        return tok
+
+    # ----------------------------------------------------------------------
+    # macro_paste()
+    #
+    # Joins two tokens with the ## operator.  Returns the new token, or None
+    # if the result isn't a single token, in which case both are kept.
+    # ----------------------------------------------------------------------
+
+    def macro_paste(self,left,right):
+        value = str(left.value) + str(right.value)
+        try:
+            type = self.paste_types[value]
+        except KeyError:
+            tokens = self.tokenize(value)
+            type = tokens[0].type if len(tokens) == 1 else None
+            self.paste_types[value] = type
+        if type is None:
+            return None
+        tok = copy_token(left)
+        tok.type = type
+        tok.value = value
+        return tok
 
-        return rep
+    # ----------------------------------------------------------------------
+    # macro_call_follows()
+    #
+    # Returns True if tok, the last token of the expansion of the macro
+    # named by name, is the name of another macro with arguments, and
+    # tokens continues with a '(' from index i.
+    # ----------------------------------------------------------------------
 
+    def macro_call_follows(self,tok,name,tokens,i):
+        if tok.type != self.t_ID or tok.value == name.value:
+            return False
+        m = self.macros.get(tok.value)
+        if m is None or m.arglist is None:
+            return False
+        while i < len(tokens) and tokens[i].type in self.t_WS:
+            i += 1
+        return i < len(tokens) and tokens[i].value == '('
 
     # ----------------------------------------------------------------------
     # expand_macros()
     #
-    # Given a list of tokens, this function performs macro expansion.
+    # Given a list of tokens, this function performs macro expansion and
+    # returns the expanded list, leaving the given list and tokens unchanged
+    # unless owned is true, meaning the tokens are copies made by an earlier
+    # expansion.  Tokens before index start are known to be expanded already.
     # The expanded argument is a dictionary that contains macros already
     # expanded.  This is used to prevent infinite recursion.
     # ----------------------------------------------------------------------
 
-    def expand_macros(self,tokens,expanded=None):
+    def expand_macros(self,tokens,expanded=None,start=0,owned=False):
         if expanded is None:
             expanded = {}
-        i = 0
-        while i < len(tokens):
+        macros = self.macros
+        t_ID = self.t_ID
+        out = tokens[:start]
+        i = start
+        tokenlen = len(tokens)
+        while i < tokenlen:
             t = tokens[i]
-            if t.type == self.t_ID:
-                if t.value in self.macros and t.value not in expanded:
+            if t.type == t_ID:
+                m = macros.get(t.value)
+                if m is not None and t.value not in expanded:
                     # Yes, we found a macro match
-                    expanded[t.value] = True
-                    
-                    m = self.macros[t.value]
-                    if not m.arglist:
+                    if m.arglist is None:
                         # A simple macro
-                        ex = self.expand_macros([copy.copy(_x) for _x in m.value],expanded)
-                        for e in ex:
-                            e.lineno = t.lineno
-                        tokens[i:i+1] = ex
-                        i += len(ex)
+                        args = []
+                        end = i + 1
                     else:
                         # A macro with arguments
                         j = i + 1
-                        while j < len(tokens) and tokens[j].type in self.t_WS:
+                        while j < tokenlen and tokens[j].type in self.t_WS:
                             j += 1
-                        if tokens[j].value == '(':
-                            tokcount,args,positions = self.collect_args(tokens[j:])
-                            if not m.variadic and len(args) !=  len(m.arglist):
-                                self.error(self.source,t.lineno,"Macro %s requires %d arguments" % (t.value,len(m.arglist)))
-                                i = j + tokcount
-                            elif m.variadic and len(args) < len(m.arglist)-1:
-                                if len(m.arglist) > 2:
-                                    self.error(self.source,t.lineno,"Macro %s must have at least %d arguments" % (t.value, len(m.arglist)-1))
-                                else:
-                                    self.error(self.source,t.lineno,"Macro %s must have at least %d argument" % (t.value, len(m.arglist)-1))
-                                i = j + tokcount
+                        if j == tokenlen or tokens[j].value != '(':
+                            # Just the name of the macro
+                            out.append(t)
+                            i += 1
+                            continue
+                        tokcount,args,positions = self.collect_args(tokens,j)
+                        end = j + tokcount
+                        if len(args) == 0 and len(m.arglist) == 1:
+                            # An empty argument
+                            args = [[]]
+                        if not m.variadic and len(args) !=  len(m.arglist):
+                            self.error(self.source,t.lineno,"Macro %s requires %d arguments" % (t.value,len(m.arglist)))
+                            out.extend(tokens[i:end])
+                            i = end
+                            continue
+                        elif m.variadic and len(args) < len(m.arglist)-1:
+                            if len(m.arglist) > 2:
+                                self.error(self.source,t.lineno,"Macro %s must have at least %d arguments" % (t.value, len(m.arglist)-1))
                             else:
-                                if m.variadic:
-                                    if len(args) == len(m.arglist)-1:
-                                        args.append([])
-                                    else:
-                                        args[len(m.arglist)-1] = tokens[j+positions[len(m.arglist)-1]:j+tokcount-1]
-                                        del args[len(m.arglist):]
-                                        
-                                # Get macro replacement text
-                                rep = self.macro_expand_args(m,args)
-                                rep = self.expand_macros(rep,expanded)
-                                for r in rep:
-                                    r.lineno = t.lineno
-                                tokens[i:j+tokcount] = rep
-                                i += len(rep)
+                                self.error(self.source,t.lineno,"Macro %s must have at least %d argument" % (t.value, len(m.arglist)-1))
+                            out.extend(tokens[i:end])
+                            i = end
+                            continue
+                        if m.variadic:
+                            if len(args) == len(m.arglist)-1:
+                                args.append([])
+                            else:
+                                args[len(m.arglist)-1] = tokens[j+positions[len(m.arglist)-1]:j+tokcount-1]
+                                del args[len(m.arglist):]
+
+                    # Get macro replacement text
+                    expanded[t.value] = True
+                    rep, rescan = self.macro_expand_args(m,args,owned)
+                    if rescan is not None:
+                        rep = self.expand_macros(rep,expanded,rescan,True)
                     del expanded[t.value]
+                    for r in rep:
+                        r.lineno = t.lineno
+                    if rep and self.macro_call_follows(rep[-1],t,tokens,end):
+                        # The expansion ends with the name of a macro with
+                        # arguments, and they follow it.  Scan them together.
+                        out.extend(rep[:-1])
+                        tokens = rep[-1:] + tokens[end:]
+                        tokenlen = len(tokens)
+                        i = 0
+                        continue
+                    out.extend(rep)
+                    i = end
                     continue
                 elif t.value == '__LINE__':
+                    t = copy_token(t)
                     t.type = self.t_INTEGER
                     t.value = self.t_INTEGER_TYPE(t.lineno)
                 
+            out.append(t)
             i += 1
-        return tokens
+        return out
 
     # ----------------------------------------------------------------------    
     # evalexpr()
@@ -533,23 +926,30 @@ class Preprocessor(object):
     # ----------------------------------------------------------------------
 
     def evalexpr(self,tokens):
-        # tokens = tokenize(line)
+        key = self.expr_key(tokens)
+        if key is not None:
+            try:
+                return self.expr_cache[key]
+            except KeyError:
+                pass
+
         # Search for defined macros
+        tokens = list(tokens)
         i = 0
         while i < len(tokens):
             if tokens[i].type == self.t_ID and tokens[i].value == 'defined':
                 j = i + 1
                 needparen = False
-                result = "0L"
+                result = "0"
                 while j < len(tokens):
                     if tokens[j].type in self.t_WS:
                         j += 1
                         continue
                     elif tokens[j].type == self.t_ID:
                         if tokens[j].value in self.macros:
-                            result = "1L"
+                            result = "1"
                         else:
-                            result = "0L"
+                            result = "0"
                         if not needparen: break
                     elif tokens[j].value == '(':
                         needparen = True
@@ -558,34 +958,54 @@ class Preprocessor(object):
                     else:
                         self.error(self.source,tokens[i].lineno,"Malformed defined()")
                     j += 1
+                tokens[i] = copy_token(tokens[i])
                 tokens[i].type = self.t_INTEGER
                 tokens[i].value = self.t_INTEGER_TYPE(result)
                 del tokens[i+1:j+1]
             i += 1
         tokens = self.expand_macros(tokens)
-        for i,t in enumerate(tokens):
-            if t.type == self.t_ID:
-                tokens[i] = copy.copy(t)
-                tokens[i].type = self.t_INTEGER
-                tokens[i].value = self.t_INTEGER_TYPE("0L")
-            elif t.type == self.t_INTEGER:
-                tokens[i] = copy.copy(t)
-                # Strip off any trailing suffixes
-                tokens[i].value = str(tokens[i].value)
-                while tokens[i].value[-1] not in "0123456789abcdefABCDEF":
-                    tokens[i].value = tokens[i].value[:-1]
-        
-        expr = "".join([str(x.value) for x in tokens])
-        expr = expr.replace("&&"," and ")
-        expr = expr.replace("||"," or ")
-        expr = expr.replace("!"," not ")
+
+        expr = "".join([" " if x.type in self.t_WS else str(x.value) for x in tokens])
         try:
-            result = eval(expr)
-        except StandardError:
-            self.error(self.source,tokens[0].lineno,"Couldn't evaluate expression")
+            result = evaluate(expr)
+        except ExpressionError as e:
+            self.error(self.source,tokens[0].lineno if tokens else 0,
+                       "Couldn't evaluate expression: %s" % e)
             result = 0
+
+        if key is not None:
+            self.expr_cache[key] = result
         return result
 
+    # ----------------------------------------------------------------------
+    # expr_key()
+    #
+    # Returns the key of the value of an expression token sequence in
+    # expr_cache: the expression, with the definitions of every macro it may
+    # expand, or None if the value may depend on more than those.
+    # ----------------------------------------------------------------------
+
+    def expr_key(self,tokens):
+        names = [t.value for t in tokens if t.type == self.t_ID]
+        deps = {}
+        while names:
+            name = names.pop()
+            if name in deps:
+                continue
+            if name == '__LINE__':
+                return None
+            m = self.macros.get(name)
+            if m is None:
+                deps[name] = None
+                continue
+            if m.pastes:
+                # Pasting makes names that aren't in the definition
+                return None
+            deps[name] = m.key
+            names.extend(m.ids)
+        expr = tuple([" " if t.type in self.t_WS else t.value for t in tokens])
+        return expr, tuple(sorted(deps.items(),key=lambda dep: dep[0]))
+
     # ----------------------------------------------------------------------
     # parsegen()
     #
@@ -597,6 +1017,16 @@ class Preprocessor(object):
         t = trigraph(input)
         lines = self.group_lines(t)
 
+        for tok in self.parselines(lines,source):
+            yield tok
+
+    # ----------------------------------------------------------------------
+    # parselines()
+    #
+    # Parse input already grouped into lines of tokens by group_lines()
+    # ----------------------------------------------------------------------
+    def parselines(self,lines,source=None):
+
         if not source:
             source = ""
             
@@ -723,46 +1153,61 @@ class Preprocessor(object):
 
     def include(self,tokens):
         # Try to extract the filename and then process an include file
-        if not tokens:
+        found = self.include_name(tokens)
+        if not found:
             return
-        if tokens:
-            if tokens[0].value != '<' and tokens[0].type != self.t_STRING:
-                tokens = self.expand_macros(tokens)
-
-            if tokens[0].value == '<':
-                # Include <...>
-                i = 1
-                while i < len(tokens):
-                    if tokens[i].value == '>':
-                        break
-                    i += 1
-                else:
-                    print("Malformed #include <...>")
-                    return
-                filename = "".join([x.value for x in tokens[1:i]])
-                path = self.path + [""] + self.temp_path
-            elif tokens[0].type == self.t_STRING:
-                filename = tokens[0].value[1:-1]
-                path = self.temp_path + [""] + self.path
-            else:
-                print("Malformed #include statement")
-                return
+        filename, path = found
         for p in path:
             iname = os.path.join(p,filename)
             try:
                 data = open(iname,"r").read()
-                dname = os.path.dirname(iname)
-                if dname:
-                    self.temp_path.insert(0,dname)
-                for tok in self.parsegen(data,filename):
-                    yield tok
-                if dname:
-                    del self.temp_path[0]
-                break
             except IOError:
-                pass
+                continue
+            dname = os.path.dirname(iname)
+            if dname:
+                self.temp_path.insert(0,dname)
+            for tok in self.parsegen(data,filename):
+                yield tok
+            if dname:
+                del self.temp_path[0]
+            break
+        else:
+            raise RuntimeError("%s:%d: Couldn't find '%s'"
+                               % (self.source,tokens[0].lineno,filename))
+
+    # ----------------------------------------------------------------------
+    # include_name()
+    #
+    # Given the tokens of an #include directive, returns a tuple (filename,path)
+    # of the file to include and the directories to search for it, in order,
+    # or None if the directive is malformed.
+    # ----------------------------------------------------------------------
+
+    def include_name(self,tokens):
+        if not tokens:
+            return None
+        if tokens[0].value != '<' and tokens[0].type != self.t_STRING:
+            tokens = self.expand_macros(tokens)
+
+        if tokens[0].value == '<':
+            # Include <...>
+            i = 1
+            while i < len(tokens):
+                if tokens[i].value == '>':
+                    break
+                i += 1
+            else:
+                print("Malformed #include <...>")
+                return None
+            filename = "".join([x.value for x in tokens[1:i]])
+            path = self.path + [""] + self.temp_path
+        elif tokens[0].type == self.t_STRING:
+            filename = tokens[0].value[1:-1]
+            path = self.temp_path + [""] + self.path
         else:
-            print("Couldn't find '%s'" % filename)
+            print("Malformed #include statement")
+            return None
+        return filename, path
 
     # ----------------------------------------------------------------------
     # define()
@@ -771,7 +1216,7 @@ class Preprocessor(object):
     # ----------------------------------------------------------------------
 
     def define(self,tokens):
-        if isinstance(tokens,(str,unicode)):
+        if isinstance(tokens,STRING_TYPES):
             tokens = self.tokenize(tokens)
 
         linetok = tokens
@@ -783,10 +1228,12 @@ class Preprocessor(object):
                 mtype = None
             if not mtype:
                 m = Macro(name.value,[])
+                self.macro_prescan(m)
                 self.macros[name.value] = m
             elif mtype.type in self.t_WS:
                 # A normal macro
                 m = Macro(name.value,self.tokenstrip(linetok[2:]))
+                self.macro_prescan(m)
                 self.macros[name.value] = m
             elif mtype.value == '(':
                 # A macro with arguments
@@ -799,6 +1246,7 @@ class Preprocessor(object):
                     astr = "".join([str(_i.value) for _i in a])
                     if astr == "...":
                         variadic = True
+                        a[0] = copy_token(a[0])
                         a[0].type = self.t_ID
                         a[0].value = '__VA_ARGS__'
                         variadic = True
@@ -810,6 +1258,7 @@ class Preprocessor(object):
                         # If, for some reason, "." is part of the identifier, strip off the name for the purposes
                         # of macro expansion
                         if a[0].value[-3:] == '...':
+                            a[0] = copy_token(a[0])
                             a[0].value = a[0].value[:-3]
                         continue
                     if len(a) > 1 or a[0].type != self.t_ID:
@@ -27,6 +27,35 @@ class Coord(object):
         return str
 
 
+# Positions
+#
+# The parser doesn't give the nodes it builds a Coord, but a position: a
+# (file name, line) tuple, shared by the nodes of the same line. Coord(
+# position) is only built when the coord of a node is read (see
+# c_ast.Node.coord), so the many that never are cost no more than their
+# share of the tuple. Nothing is kept outside the nodes, so a name goes
+# away with the last node of its file.
+def position(filename, line):
+    """ Returns the compact position of line in filename, which
+        position_coord() turns back into a Coord.
+    """
+    return (filename, line)
+
+
+def position_coord(position):
+    """ Returns the Coord of a position made by position().
+    """
+    return Coord(position[0], position[1])
+
+
+def to_coord(coord):
+    """ Returns coord, a Coord, position or None, as a Coord or None.
+    """
+    if coord is None or isinstance(coord, Coord):
+        return coord
+    return position_coord(coord)
+
+
 class ParseError(Exception): pass
 
 
@@ -46,10 +75,29 @@ class PLYParser(object):
         setattr(self.__class__, optrule.__name__, optrule)
 
     def _coord(self, lineno, column=None):
-        return Coord(
-                file=self.clex.filename,
-                line=lineno,
-                column=column)
+        """ The position of lineno in the file being parsed, or a Coord
+            if there is a column.
+        """
+        if column is not None:
+            return Coord(
+                    file=self.clex.filename,
+                    line=lineno,
+                    column=column)
+        filename = self.clex.filename
+        if filename is not self._position_file:
+            self._position_file = filename
+            self._positions = {}
+        try:
+            return self._positions[lineno]
+        except KeyError:
+            p = self._positions[lineno] = (filename, lineno)
+            return p
+
+    # The file of the last position made by _coord, and the positions made
+    # in it by line, so the nodes of a line share one. parse() resets
+    # them, so they don't keep a file that was parsed before.
+    _position_file = None
+    _positions = None
 
     def _parse_error(self, msg, coord):
-        raise ParseError("%s: %s" % (coord, msg))
+        raise ParseError("%s: %s" % (to_coord(coord), msg))
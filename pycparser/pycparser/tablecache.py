@@ -0,0 +1,165 @@
+#-----------------------------------------------------------------
+# pycparser: tablecache.py
+#
+# Per-user cache of the PLY lexer and parser tables, so they are
+# generated once per version of the rules instead of on every start
+# when the tables can't be written next to the package.
+#
+# Copyright (C) 2008-2015, Eli Bendersky
+# License: BSD
+#-----------------------------------------------------------------
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import types
+
+from .ply import lex, yacc
+
+
+def cache_dir():
+    """ Returns the directory the tables are cached in, creating it if
+        needed, or None if it can't be created.
+
+        This is $PYCPARSER_CACHE_DIR if it is set, and otherwise a
+        pycparser directory in the platform's user cache directory.
+    """
+    path = os.environ.get('PYCPARSER_CACHE_DIR')
+    if not path:
+        if sys.platform.startswith('win'):
+            base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+        elif sys.platform == 'darwin':
+            base = os.path.expanduser('~/Library/Caches')
+        else:
+            base = (os.environ.get('XDG_CACHE_HOME') or
+                    os.path.expanduser('~/.cache'))
+        path = os.path.join(base, 'pycparser')
+
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            return None
+    return path
+
+
+def rules_hash(obj, prefix, extra=()):
+    """ Returns a hash of the PLY rules of obj: every attribute whose name
+        starts with prefix, with the docstring of the functions among them
+        and their place in the order PLY takes them in, and the values in
+        extra. PLY orders the functions by the line they start on, but
+        only the order matters, so moving them all down a few lines
+        doesn't change the hash.
+    """
+    rules = []
+    functions = []
+    for name in sorted(dir(obj)):
+        if not name.startswith(prefix):
+            continue
+        value = getattr(obj, name)
+        func = getattr(value, '__func__', value)
+        code = getattr(func, '__code__', None)
+        if code is not None:
+            functions.append((code.co_firstlineno, code.co_filename, name,
+                              func.__doc__))
+        else:
+            rules.append((name, value))
+    for rank, (line, filename, name, doc) in enumerate(sorted(functions)):
+        rules.append((name, doc, rank))
+
+    h = hashlib.sha1()
+    for rule in sorted(rules, key=lambda rule: rule[0]):
+        h.update(repr(rule).encode('utf-8'))
+    for value in extra:
+        h.update(repr(value).encode('utf-8'))
+    return h.hexdigest()[:20]
+
+
+def build_lexer(clex, directory):
+    """ Builds clex, a CLexer, from a lex table cached in directory,
+        generating and caching the table first if there is none.
+    """
+    name = 'lextab_' + rules_hash(
+        clex, 't_',
+        (clex.tokens, getattr(clex, 'states', ()), lex.__version__,
+         sys.version_info[0]))
+    path = os.path.join(directory, name + '.py')
+
+    module = _load_module(name, path)
+    if module is not None:
+        clex.build(optimize=True, lextab=module)
+        return
+
+    # lex writes the table straight to its final name, so it writes into a
+    # private directory and the table is moved into place when complete.
+    # Concurrent processes may each generate it; one of them wins.
+    tmpdir = _mkdtemp(directory)
+    if tmpdir is None:
+        clex.build(optimize=False)
+        return
+
+    try:
+        clex.build(optimize=True, lextab=name, outputdir=tmpdir)
+        _replace(os.path.join(tmpdir, name + '.py'), path)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def build_parser(module, start, directory, debug=False):
+    """ Returns yacc.yacc() for the grammar in module, with the tables
+        pickled in directory, generating and caching them first if there
+        are none.
+    """
+    name = 'yacctab_' + rules_hash(
+        module, 'p_',
+        (module.tokens, getattr(module, 'precedence', ()), start,
+         yacc.__tabversion__, sys.version_info[0]))
+    path = os.path.join(directory, name + '.pickle')
+
+    if os.path.exists(path):
+        return yacc.yacc(module=module, start=start, debug=debug,
+                         optimize=True, picklefile=path)
+
+    tmpdir = _mkdtemp(directory)
+    if tmpdir is None:
+        return yacc.yacc(module=module, start=start, debug=debug,
+                         write_tables=False)
+
+    try:
+        tmp = os.path.join(tmpdir, name + '.pickle')
+        parser = yacc.yacc(module=module, start=start, debug=debug,
+                           optimize=True, picklefile=tmp)
+        _replace(tmp, path)
+        return parser
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def _load_module(name, path):
+    # The module in the file at path, or None if it doesn't exist or is
+    # broken; it is generated again in that case.
+    try:
+        with open(path) as f:
+            source = f.read()
+        module = types.ModuleType(name)
+        exec(compile(source, path, 'exec'), module.__dict__)
+        return module
+    except Exception:
+        return None
+
+
+def _mkdtemp(directory):
+    try:
+        return tempfile.mkdtemp(prefix='.tmp', dir=directory)
+    except (IOError, OSError):
+        return None
+
+
+def _replace(src, dst):
+    # Atomically moves src over dst, so readers see either no table or a
+    # complete one. A table that can't be cached is simply not cached.
+    try:
+        getattr(os, 'replace', os.rename)(src, dst)
+    except (IOError, OSError):
+        pass
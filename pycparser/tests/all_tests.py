@@ -13,6 +13,10 @@ suite = unittest.TestLoader().loadTestsFromNames(
         'test_general',
         'test_c_parser',
         'test_c_generator',
+        'test_tablecache',
+        'test_cppcache',
+        'test_c_preprocessor',
+        'test_astcache',
     ]
 )
 
@@ -0,0 +1,194 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+sys.path.insert(0, '.')
+from pycparser import c_ast, c_generator, c_parser, parse_file, parse_files
+from pycparser.astcache import (ParseCache, SchemaError, dumps, loads,
+                                _HEADER)
+from pycparser.cppcache import STALE_TMP_AGE
+from pycparser.plyparser import Coord
+
+_c_parser = c_parser.CParser(
+                lex_optimize=False,
+                yacc_debug=True,
+                yacc_optimize=False,
+                yacctab='yacctab')
+
+CODE = r'''
+typedef struct point { int x, y : 3; } point;
+struct opaque;
+enum color { RED, GREEN = 2 };
+static const char *names[] = { "a", [2] = "c" };
+
+int f(int n, ...) {
+    point p = { .x = 1 };
+    for (;;) { if (n-- > 0) continue; else break; }
+    switch (n) { case 1: n++; default: ; }
+    return sizeof(point) + p.x + (n ? -n : names[0][0]);
+}
+'''
+
+
+def show(node):
+    buf = StringIO()
+    node.show(buf=buf, attrnames=True, nodenames=True, showcoord=True)
+    return buf.getvalue()
+
+
+class TestSerialization(unittest.TestCase):
+    def test_round_trip(self):
+        ast = _c_parser.parse(CODE, 'code.c')
+        copy = loads(dumps(ast))
+        self.assertEqual(show(copy), show(ast))
+
+    def test_c_files(self):
+        c_files = os.path.join(os.path.dirname(__file__), 'c_files')
+        for name in ('example_c_file.c', 'memmgr_with_h.c',
+                     'cppd_with_stdio_h.c'):
+            with open(os.path.join(c_files, name)) as f:
+                ast = _c_parser.parse(f.read(), name)
+            self.assertEqual(show(loads(dumps(ast))), show(ast))
+
+    def test_none_and_empty(self):
+        ast = _c_parser.parse('struct s; void f(void) {}')
+        ast.ext.append(c_ast.Compound([]))
+        copy = loads(dumps(ast))
+        self.assertEqual(copy.ext[0].type.decls, None)
+        self.assertEqual(copy.ext[1].body.block_items, None)
+        self.assertEqual(copy.ext[1].param_decls, None)
+        self.assertEqual(copy.ext[2].block_items, [])
+
+    def test_lists_are_not_shared(self):
+        ast = _c_parser.parse('const int a; const int b;')
+        copy = loads(dumps(ast))
+        a, b = copy.ext
+        self.assertEqual(a.quals, ['const'])
+        self.assertFalse(a.quals is b.quals)
+        self.assertFalse(a.type.type.names is b.type.type.names)
+
+    def test_coords(self):
+        node = c_ast.ID('x', coord=Coord('built.c', 4, 2))
+        copy = loads(dumps(c_ast.Return(node)))
+        self.assertEqual(copy.coord, None)
+        self.assertEqual(copy.expr.coord.file, 'built.c')
+        self.assertEqual(copy.expr.coord.line, 4)
+
+    def test_deep_tree(self):
+        code = 'void f(int x) { %s; }' % '; else '.join(
+            'if (x == %d) x++' % i for i in range(3000))
+        ast = _c_parser.parse(code)
+        generator = c_generator.CGenerator()
+        self.assertEqual(generator.visit(loads(dumps(ast))),
+                         generator.visit(ast))
+
+    def test_other_schema(self):
+        data = dumps(_c_parser.parse('int x;'))
+        magic, version, marshal_version, schema = _HEADER.unpack_from(data)
+        other = _HEADER.pack(magic, version, marshal_version, b'0' * 40)
+        with self.assertRaises(SchemaError):
+            loads(other + data[_HEADER.size:])
+        other = _HEADER.pack(magic, version + 1, marshal_version, schema)
+        with self.assertRaises(SchemaError):
+            loads(other + data[_HEADER.size:])
+
+    def test_corrupt(self):
+        data = dumps(_c_parser.parse('int x;'))
+        for bad in (b'', b'int x;', data[:_HEADER.size] + b'xyz',
+                    data[:-4]):
+            with self.assertRaises(ValueError):
+                loads(bad)
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = ParseCache(os.path.join(self.tmpdir, 'cache'))
+        self.source = os.path.join(self.tmpdir, 'main.c')
+        with open(self.source, 'w') as f:
+            f.write(CODE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_hit(self):
+        ast = parse_file(self.source, ast_cache=self.cache)
+        key = self.cache.key(CODE, self.source)
+        self.assertTrue(os.path.exists(self.cache._path(key)))
+        self.assertEqual(show(self.cache.get(key)), show(ast))
+
+        # A cached AST is loaded, not parsed.
+        with open(self.cache._path(key), 'wb') as f:
+            f.write(dumps(c_ast.FileAST([])))
+        self.assertEqual(parse_file(self.source,
+                                    ast_cache=self.cache).ext, [])
+
+    def test_key(self):
+        self.assertNotEqual(self.cache.key(CODE, 'a.c'),
+                            self.cache.key(CODE, 'b.c'))
+        self.assertNotEqual(self.cache.key(CODE, 'a.c'),
+                            self.cache.key(CODE + ';', 'a.c'))
+
+    def test_other_schema(self):
+        key = self.cache.key(CODE, self.source)
+        self.cache.put(key, _c_parser.parse(CODE, self.source))
+        path = self.cache._path(key)
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, marshal_version, schema = _HEADER.unpack_from(data)
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(magic, version, marshal_version, b'0' * 40))
+            f.write(data[_HEADER.size:])
+        self.assertEqual(self.cache.get(key), None)
+
+        # Parsing the text again replaces the entry.
+        parse_file(self.source, ast_cache=self.cache)
+        self.assertTrue(self.cache.get(key) is not None)
+
+    def test_parse_files(self):
+        results = list(parse_files([self.source, self.source],
+                                   ast_cache=self.cache))
+        self.assertEqual(len(os.listdir(self.cache.directory)), 1)
+        self.assertEqual(show(results[0][1]), show(results[1][1]))
+
+    def test_eviction(self):
+        texts = ['int x%d;' % i for i in range(6)]
+        key = self.cache.key(texts[0], self.source)
+        self.cache.put(key, _c_parser.parse(texts[0], self.source))
+        self.cache.max_size = os.path.getsize(self.cache._path(key)) * 5
+
+        stale = os.path.join(self.cache.directory, '.tmpstale')
+        open(stale, 'wb').close()
+        old = time.time() - STALE_TMP_AGE - 10
+        os.utime(stale, (old, old))
+        for text in texts[1:5]:
+            self.cache.put(self.cache.key(text, self.source),
+                           _c_parser.parse(text, self.source))
+        self.assertEqual(len(os.listdir(self.cache.directory)), 6)
+
+        # Crossing max_size evicts down to three quarters of it, and
+        # removes the stale temporary file.
+        text = texts[5]
+        self.cache.put(self.cache.key(text, self.source),
+                       _c_parser.parse(text, self.source))
+        self.assertEqual(len(os.listdir(self.cache.directory)), 3)
+        self.assertFalse(os.path.exists(stale))
+
+    def test_errors_not_cached(self):
+        with open(self.source, 'w') as f:
+            f.write('int x = ;')
+        results = list(parse_files([self.source], ast_cache=self.cache))
+        self.assertTrue(isinstance(results[0][1], Exception))
+        self.assertEqual(os.listdir(self.cache.directory), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
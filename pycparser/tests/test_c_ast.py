@@ -1,3 +1,5 @@
+import gc
+import pickle
 import pprint
 import re
 import sys
@@ -6,6 +8,7 @@ import weakref
 
 sys.path.insert(0, '..')
 import pycparser.c_ast as c_ast
+import pycparser.c_generator as c_generator
 import pycparser.plyparser as plyparser
 
 
@@ -38,6 +41,73 @@ class Test_c_ast(unittest.TestCase):
         self.assertEqual(weakref.getweakrefcount(coord), 1)
 
 
+    def test_iter_children(self):
+        c1 = c_ast.Constant(type='int', value='1')
+        c2 = c_ast.Constant(type='int', value='2')
+        b1 = c_ast.BinaryOp(op='+', left=c1, right=c2)
+        comp = c_ast.Compound(block_items=[b1, c1])
+        empty = c_ast.Compound(block_items=None)
+        cond = c_ast.If(cond=c1, iftrue=comp, iffalse=None)
+
+        for node in [c1, b1, comp, empty, cond]:
+            self.assertEqual(list(node.iter_children()),
+                             [child for name, child in node.children()])
+
+        self.assertEqual(c_ast.BinaryOp.child_names, ('left', 'right'))
+        self.assertEqual(c_ast.Compound.child_names, ('block_items',))
+        self.assertEqual(c_ast.Constant.child_names, ())
+
+    def test_coord_from_position(self):
+        position = plyparser.position('pos.c', 12)
+        node = c_ast.ID(name='x', coord=position)
+        self.assertTrue(node._coord is position)
+        self.assertEqual(str(node.coord), 'pos.c:12')
+        # Built once, then kept.
+        self.assertTrue(node.coord is node.coord)
+        self.assertEqual(plyparser.position('pos.c', 12), position)
+
+        coord = plyparser.Coord('other.c', 3, 4)
+        node.coord = coord
+        self.assertTrue(node.coord is coord)
+        node.coord = None
+        self.assertEqual(node.coord, None)
+
+    def test_pickled_nodes_keep_their_coord(self):
+        node = c_ast.BinaryOp(
+            op='+',
+            left=c_ast.ID(name='a', coord=plyparser.position('p.c', 5)),
+            right=c_ast.ID(name='b'),
+            coord=plyparser.position('p.c', 5))
+        node.annotate('level', 1)
+        copy = pickle.loads(pickle.dumps(node, 2))
+        self.assertTrue(isinstance(copy._coord, plyparser.Coord))
+        self.assertEqual(str(copy.coord), 'p.c:5')
+        self.assertEqual(str(copy.left.coord), 'p.c:5')
+        self.assertEqual(copy.right.coord, None)
+        self.assertEqual(copy.annotation('level'), 1)
+
+    def test_nodes_have_slots(self):
+        node = c_ast.ID(name='x')
+        with self.assertRaises(AttributeError):
+            node.unknown = 1
+        self.assertTrue('Abstract base class' in c_ast.Node.__doc__)
+
+    def test_annotations(self):
+        node = c_ast.ID(name='x')
+        other = c_ast.ID(name='y')
+        self.assertEqual(node.annotation('level'), None)
+        self.assertEqual(node.annotation('level', 0), 0)
+
+        node.annotate('level', 3)
+        node.annotate('parent', other)
+        self.assertEqual(node.annotation('level'), 3)
+        self.assertTrue(node.annotation('parent') is other)
+        self.assertEqual(other.annotation('level'), None)
+
+        node.clear_annotations()
+        self.assertEqual(node.annotation('level'), None)
+        node.clear_annotations()
+
 
 class TestNodeVisitor(unittest.TestCase):
     class ConstantVisitor(c_ast.NodeVisitor):
@@ -96,6 +166,187 @@ class TestNodeVisitor(unittest.TestCase):
         self.assertEqual(cv.values,
             ['5.6', 't', '5.6', 't', 't', '5.6', 't'])
 
+    def test_deep_chain(self):
+        chain = c_ast.Constant(type='int', value='0')
+        for i in range(1, sys.getrecursionlimit() * 2):
+            chain = c_ast.BinaryOp(
+                op='&&',
+                left=chain,
+                right=c_ast.Constant(type='int', value=str(i)))
+
+        cv = self.ConstantVisitor()
+        cv.visit(chain)
+
+        self.assertEqual(cv.values,
+            [str(i) for i in range(sys.getrecursionlimit() * 2)])
+
+    def test_overridden_generic_visit(self):
+        class NameVisitor(c_ast.NodeVisitor):
+            def __init__(self):
+                self.names = []
+
+            def generic_visit(self, node):
+                self.names.append(node.__class__.__name__)
+                c_ast.NodeVisitor.generic_visit(self, node)
+
+            def visit_Constant(self, node):
+                self.names.append(node.value)
+
+        b1 = c_ast.BinaryOp(
+            op='+',
+            left=c_ast.Constant(type='int', value='6'),
+            right=c_ast.UnaryOp(op='-', expr=c_ast.ID(name='joe')))
+
+        nv = NameVisitor()
+        nv.visit(b1)
+
+        self.assertEqual(nv.names, ['BinaryOp', '6', 'UnaryOp', 'ID'])
+
+    def test_dispatch_per_visitor_class(self):
+        class IDVisitor(self.ConstantVisitor):
+            def visit_ID(self, node):
+                self.values.append(node.name)
+
+        b1 = c_ast.BinaryOp(
+            op='+',
+            left=c_ast.Constant(type='int', value='6'),
+            right=c_ast.ID(name='joe'))
+
+        for i in range(2):
+            cv = self.ConstantVisitor()
+            cv.visit(b1)
+            self.assertEqual(cv.values, ['6'])
+
+            iv = IDVisitor()
+            iv.visit(b1)
+            self.assertEqual(iv.values, ['6', 'joe'])
+
+    def test_dispatch_frees_visitor_classes(self):
+        b1 = c_ast.BinaryOp(
+            op='+',
+            left=c_ast.Constant(type='int', value='6'),
+            right=c_ast.ID(name='joe'))
+
+        def visit_with_new_class():
+            class IDVisitor(c_ast.NodeVisitor):
+                def visit_ID(self, node):
+                    pass
+            class Generator(c_generator.CGenerator):
+                pass
+            IDVisitor().visit(b1)
+            Generator().visit(b1)
+            return weakref.ref(IDVisitor), weakref.ref(Generator)
+
+        refs = visit_with_new_class()
+        gc.collect()
+        self.assertEqual([ref() for ref in refs], [None, None])
+
+    def test_visit_override_sees_children(self):
+        class CountingVisitor(c_ast.NodeVisitor):
+            def __init__(self):
+                self.visited = []
+
+            def visit(self, node):
+                self.visited.append(node.__class__.__name__)
+                return c_ast.NodeVisitor.visit(self, node)
+
+        b1 = c_ast.BinaryOp(
+            op='+',
+            left=c_ast.Constant(type='int', value='6'),
+            right=c_ast.UnaryOp(op='-', expr=c_ast.ID(name='joe')))
+
+        cv = CountingVisitor()
+        cv.visit(b1)
+        self.assertEqual(cv.visited,
+                         ['BinaryOp', 'Constant', 'UnaryOp', 'ID'])
+
+    def test_visit_method_on_instance(self):
+        b1 = c_ast.BinaryOp(
+            op='+',
+            left=c_ast.Constant(type='int', value='6'),
+            right=c_ast.UnaryOp(op='-', expr=c_ast.ID(name='joe')))
+
+        for i in range(2):
+            cv = self.ConstantVisitor()
+            names = []
+            cv.visit_ID = lambda node: names.append(node.name)
+            cv.visit(b1)
+            self.assertEqual(cv.values, ['6'])
+            self.assertEqual(names, ['joe'])
+
+            # The class's dispatch is unaffected.
+            other = self.ConstantVisitor()
+            other.visit(b1)
+            self.assertEqual(other.values, ['6'])
+
+
+    def test_attributes_take_fast_path(self):
+        # A visitor with attributes but no visit methods of its own never
+        # looks in its attributes for them.
+        b1 = c_ast.BinaryOp(
+            op='+',
+            left=c_ast.Constant(type='int', value='6'),
+            right=c_ast.UnaryOp(op='-', expr=c_ast.ID(name='joe')))
+
+        class Unexpected(self.ConstantVisitor):
+            def _own_method(self, name):
+                raise AssertionError(name)
+
+        for visit in (lambda cv: cv.visit(b1),
+                      lambda cv: cv.generic_visit(b1)):
+            cv = Unexpected()
+            visit(cv)
+            visit(cv)
+            self.assertEqual(cv.values, ['6', '6'])
+
+
+class TestWalk(unittest.TestCase):
+    def setUp(self):
+        self.c1 = c_ast.Constant(type='int', value='1')
+        self.c2 = c_ast.Constant(type='int', value='2')
+        self.id = c_ast.ID(name='x')
+        self.b1 = c_ast.BinaryOp(op='+', left=self.c1, right=self.c2)
+        self.comp = c_ast.Compound(block_items=[self.b1, self.id])
+
+    def test_preorder(self):
+        self.assertEqual(list(c_ast.preorder(self.comp)),
+            [self.comp, self.b1, self.c1, self.c2, self.id])
+
+    def test_postorder(self):
+        self.assertEqual(list(c_ast.postorder(self.comp)),
+            [self.c1, self.c2, self.b1, self.id, self.comp])
+
+    def test_enter_exit(self):
+        events = []
+        def enter(node, parent):
+            events.append(('enter', node, parent))
+        def exit(node, parent):
+            events.append(('exit', node, parent))
+
+        c_ast.walk(self.comp, enter, exit)
+
+        self.assertEqual(events, [
+            ('enter', self.comp, None),
+            ('enter', self.b1, self.comp),
+            ('enter', self.c1, self.b1),
+            ('exit', self.c1, self.b1),
+            ('enter', self.c2, self.b1),
+            ('exit', self.c2, self.b1),
+            ('exit', self.b1, self.comp),
+            ('enter', self.id, self.comp),
+            ('exit', self.id, self.comp),
+            ('exit', self.comp, None)])
+
+    def test_enter_skips_children(self):
+        seen = []
+        def enter(node, parent):
+            seen.append(node)
+            return not isinstance(node, c_ast.BinaryOp)
+
+        c_ast.walk(self.comp, enter)
+
+        self.assertEqual(seen, [self.comp, self.b1, self.id])
+
 
 if __name__ == '__main__':
     unittest.main()
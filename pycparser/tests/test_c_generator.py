@@ -1,5 +1,9 @@
 import sys
 import unittest
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 
 # Run from the root dir
 sys.path.insert(0, '.')
@@ -267,5 +271,69 @@ class TestCtoC(unittest.TestCase):
             }
         ''')
 
+class TestWrite(unittest.TestCase):
+    def _assert_write_matches_visit(self, src):
+        ast = parse_to_ast(src)
+        stream = StringIO()
+        c_generator.CGenerator().write(ast, stream)
+        self.assertEqual(stream.getvalue(), c_generator.CGenerator().visit(ast))
+
+    def test_statements(self):
+        self._assert_write_matches_visit(r'''
+            #pragma foo
+            struct s { int a; struct { char c; } inner; };
+            int k, *p;
+            int f(a, b) int a; char b; {
+                int x = 1;
+                if (a) x++; else { x--; }
+                for (;;) { while (x) do { x = x - 1; } while (x > 2); }
+                switch (x) { case 1: k = 2; break; default: ; }
+                end: return x;
+            }
+        ''')
+
+    def test_deep_nesting(self):
+        depth = 200
+        body = 'x++;'
+        for i in range(depth):
+            body = 'if (x > %d) { %s }' % (i, body)
+        self._assert_write_matches_visit('void f() { %s }' % body)
+
+    def test_deep_else_if(self):
+        depth = sys.getrecursionlimit() * 2
+        stmt = c_ast.Return(c_ast.Constant('int', '0'))
+        for i in range(depth):
+            stmt = c_ast.If(c_ast.ID('x%d' % i),
+                            c_ast.Return(c_ast.Constant('int', str(i))),
+                            stmt)
+
+        code = c_generator.CGenerator().visit(stmt)
+        self.assertEqual(code.count('else\n'), depth)
+
+    def test_deep_and_chain(self):
+        depth = sys.getrecursionlimit() * 2
+        expr = c_ast.ID('x0')
+        for i in range(1, depth):
+            expr = c_ast.BinaryOp('&&', expr, c_ast.ID('x%d' % i))
+
+        code = c_generator.CGenerator().visit(expr)
+        self.assertTrue(code.startswith('(' * (depth - 2) + 'x0 && x1)'))
+        self.assertTrue(code.endswith('&& x%d' % (depth - 1)))
+
+    def test_write_sub_node(self):
+        ast = parse_to_ast('void f() { while (1) { g(); } }')
+        stream = StringIO()
+        loop = ast.ext[0].body.block_items[0]
+        c_generator.CGenerator().write(loop, stream)
+        self.assertEqual(stream.getvalue(),
+                         c_generator.CGenerator().visit(loop))
+
+    def test_unicode_names(self):
+        # On Python 2, unicode chunks are text too, not more chunks.
+        stmt = c_ast.Compound([c_ast.Return(c_ast.ID(u'x'))])
+        self.assertEqual(c_generator.CGenerator().visit(stmt),
+                         '{\n  return x;\n}\n')
+
+
 if __name__ == "__main__":
     unittest.main()
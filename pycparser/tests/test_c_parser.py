@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 
+import gc
 import pprint
 import re
+import weakref
 import os, sys
 import unittest
 
@@ -213,6 +215,39 @@ class TestCParser_fundamentals(TestCParser_base):
         f6 = self.parse(t6, filename='z.c')
         self.assert_coord(self.parse(t6).ext[0].decl.type.args.params[1], 3)
 
+    def test_coords_are_built_when_read(self):
+        t = """
+        int a, b;
+        int c;
+        """
+        f = self.parse(t, filename='lazy.c')
+        a, b, c = f.ext
+        self.assertFalse(isinstance(a._coord, Coord))
+        # Nodes on the same line have the same position.
+        self.assertEqual(a._coord, b._coord)
+        self.assertNotEqual(a._coord, c._coord)
+
+        self.assert_coord(c, 3, 'lazy.c')
+        self.assertTrue(isinstance(c._coord, Coord))
+        self.assertFalse(isinstance(a._coord, Coord))
+
+    def test_file_names_not_kept(self):
+        # Parsing files of many names doesn't leave the names behind once
+        # their ASTs are gone.
+        class Name(str):
+            pass
+
+        names = []
+        for i in range(50):
+            name = Name('file%d.c' % i)
+            names.append(weakref.ref(name))
+            ast = self.parse('int a;\nint b;', filename=name)
+            self.assert_coord(ast.ext[1], 2, 'file%d.c' % i)
+            del name, ast
+        self.parse('int c;', filename='last.c')
+        gc.collect()
+        self.assertEqual([n for n in names if n() is not None], [])
+
     def test_forloop_coord(self):
         t = '''\
         void foo() {
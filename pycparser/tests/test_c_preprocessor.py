@@ -0,0 +1,339 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, '..')
+from pycparser import parse_file, parse_files, preprocess_file, c_ast
+from pycparser.c_parser import CParser
+from pycparser.c_generator import CGenerator
+from pycparser.c_preprocessor import CPreprocessor
+from pycparser.ply import cpp, lex
+from pycparser.ply.cpp import evaluate, ExpressionError
+
+CPPPATH = 'cpp'
+
+
+def regenerate(text):
+    return CGenerator().visit(CParser().parse(text))
+
+
+class TestCPreprocessor(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, text):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def _names(self, text):
+        # The names declared at file scope in text.
+        return [decl.name for decl in CParser().parse(text).ext]
+
+    def test_same_as_cpp(self):
+        testdir = os.path.dirname(__file__)
+        c_files = os.path.join(testdir, 'c_files')
+        fake_libc = os.path.join(testdir, '..', 'utils', 'fake_libc_include')
+        args = ['-I' + c_files, '-I' + fake_libc]
+        pp = CPreprocessor(args)
+        for name in ('memmgr.c', 'year.c'):
+            path = os.path.join(c_files, name)
+            self.assertEqual(regenerate(pp.preprocess(path)),
+                             regenerate(preprocess_file(path, CPPPATH, args)))
+
+    def test_macros_and_conditionals(self):
+        source = self._write('main.c', '\n'.join([
+            '#define SQUARE(x) ((x) * (x))',
+            '#define N 4 // a comment ending the line',
+            'int a = SQUARE(N);',
+            '#if N > 2 /* comment */',
+            'int b;',
+            '#else',
+            'int c;',
+            '#endif',
+            '#ifdef FROM_ARGS',
+            'int d = FROM_ARGS;',
+            '#endif',
+            '#ifdef UNDEFINED',
+            'int e;',
+            '#endif']))
+        pp = CPreprocessor(['-DFROM_ARGS=7', '-D', 'UNDEFINED', '-UUNDEFINED'])
+        text = pp.preprocess(source)
+        self.assertEqual(self._names(text), ['a', 'b', 'd'])
+        self.assertEqual(regenerate(text), regenerate(
+            'int a = ((4) * (4));\nint b;\nint d = 7;\n'))
+
+    def test_macro_expansion(self):
+        source = self._write('main.c', '\n'.join([
+            '#define CAT(a, b) a ## b',
+            '#define XCAT(a, b) CAT(a, b)',
+            '#define STR(x) #x',
+            '#define XSTR(x) STR(x)',
+            '#define N 42',
+            '#define ZERO() 7',
+            '#define ID(x) x',
+            '#define F(x) (x + 1)',
+            '#define APPLY(f, x) f(x)',
+            '#define foo foo + 1',
+            '#define LOG(fmt, ...) printf(fmt, ## __VA_ARGS__)',
+            '#define VA(...) g(__VA_ARGS__)',
+            '#define int_t CAT(in, t)',
+            '#define SUFFIX(x) x ## _t',
+            '#define PASTE3(a, b) a ## b ## c',
+            'int CAT(var, 1) = N;',
+            'int XCAT(var, N) = 1;',
+            'char *s1 = STR(a + "q\\n" \'c\');',
+            'char *s2 = XSTR(N);',
+            'char *s3 = STR(  spaced    out  );',
+            'int z = ZERO();',
+            'int (*fp)(int) = F;',
+            'int y = ID(F)(2) + APPLY(F, 3);',
+            'int w = foo;',
+            'int_t k;',
+            'typedef int SUFFIX(my);',
+            'my_t m;',
+            'int q = CAT(N, );',
+            'int PASTE3(, b);',
+            'int h(void) {',
+            '    LOG("a"); LOG("b", 1,',
+            '                  2);',
+            '    VA(); VA(1);',
+            '    return __LINE__;',
+            '}']))
+        self.assertEqual(regenerate(CPreprocessor().preprocess(source)),
+                         regenerate(preprocess_file(source, CPPPATH)))
+
+    def test_empty_arguments(self):
+        source = self._write('main.c', '\n'.join([
+            '#define G(a, b) f(a + 0, b + 0)',
+            '#define H(a, b, c) f(a 1, b 2, c 3)',
+            '#define ONE(a) f(a 1)',
+            'int g1 = G(,);',
+            'int g2 = G(1,);',
+            'int g3 = G(,2);',
+            'int h = H(,,);',
+            'int o = ONE();']))
+        self.assertEqual(regenerate(CPreprocessor().preprocess(source)),
+                         regenerate(preprocess_file(source, CPPPATH)))
+
+    def test_predefined_macros(self):
+        source = self._write('main.c', '\n'.join([
+            '#if __STDC__ && __STDC_HOSTED__ && __STDC_VERSION__ >= 199901L',
+            'long version = __STDC_VERSION__;',
+            '#endif']))
+        self.assertEqual(regenerate(CPreprocessor().preprocess(source)),
+                         'long version = 199901L;\n')
+        self.assertEqual(
+            self._names(CPreprocessor('-U__STDC__').preprocess(source)), [])
+
+    def test_headers_unchanged_by_expansion(self):
+        self._write('header.h', '\n'.join([
+            '#define TWICE(x) ((x) + (x))',
+            '#define VA(fmt, ...) f(fmt, __VA_ARGS__)',
+            'int a = TWICE(1 +',
+            '              2);',
+            'int b = __LINE__;',
+            '#if defined(TWICE) && !defined NOPE',
+            'int c;',
+            '#endif',
+            '']))
+        source = self._write('main.c', '#include "header.h"\n')
+        pp = CPreprocessor()
+        first = pp.preprocess(source)
+        self.assertEqual(pp.preprocess(source), first)
+        self.assertEqual(regenerate(first),
+                         regenerate(preprocess_file(source, CPPPATH)))
+
+    def test_coords(self):
+        self._write('header.h', '\n\nint in_header;\n')
+        source = self._write('main.c',
+                             '#include "header.h"\n\n\nint in_main;\n')
+        ast = CParser().parse(CPreprocessor().preprocess(source), source)
+        header, main = ast.ext
+        self.assertEqual(header.coord.file,
+                         os.path.join(self.tmpdir, 'header.h'))
+        self.assertEqual(header.coord.line, 3)
+        self.assertEqual(main.coord.file, source)
+        self.assertEqual(main.coord.line, 4)
+
+    def test_include_guard(self):
+        self._write('guarded.h', '\n'.join([
+            '/* a comment before the guard */',
+            '#ifndef GUARDED_H',
+            '#define GUARDED_H',
+            '#ifdef X',
+            '#endif',
+            'int guarded;',
+            '#endif /* GUARDED_H */',
+            '']))
+        self._write('once.h', '#pragma once\nint once;\n')
+        self._write('plain.h', 'int plain;\n')
+        source = self._write('main.c', '\n'.join(
+            ['#include "%s"' % name
+                for name in ('guarded.h', 'once.h', 'plain.h') * 2]))
+
+        pp = CPreprocessor()
+        text = pp.preprocess(source)
+        self.assertEqual(self._names(text),
+                         ['guarded', 'once', 'plain', 'plain'])
+
+        headers = dict((os.path.basename(path), header)
+                       for path, header in pp._headers.items())
+        self.assertEqual(headers['guarded.h'].guard, 'GUARDED_H')
+        self.assertFalse(headers['guarded.h'].once)
+        self.assertTrue(headers['once.h'].once)
+        self.assertEqual(headers['plain.h'].guard, None)
+
+    def test_not_include_guards(self):
+        for text in ['#ifndef A\n#define A\n#endif\nint after;\n',
+                     '#ifndef A\n#define A\n#else\nint b;\n#endif\n',
+                     'int before;\n#ifndef A\n#define A\n#endif\n',
+                     '#ifndef A\n#define A\n#if 1\n#endif\n']:
+            self._write('header.h', text)
+            source = self._write('main.c', '#include "header.h"\n')
+            pp = CPreprocessor()
+            pp.preprocess(source)
+            header = pp._headers[os.path.abspath(
+                os.path.join(self.tmpdir, 'header.h'))]
+            self.assertEqual(header.guard, None, text)
+
+    def test_header_cache(self):
+        header = self._write('header.h', 'int first;\n')
+        source = self._write('main.c', '#include "header.h"\n')
+        pp = CPreprocessor()
+        self.assertEqual(self._names(pp.preprocess(source)), ['first'])
+
+        cached = pp._headers[os.path.abspath(header)]
+        self.assertEqual(self._names(pp.preprocess(source)), ['first'])
+        self.assertTrue(pp._headers[os.path.abspath(header)] is cached)
+
+        self._write('header.h', 'int second_version;\n')
+        self.assertEqual(self._names(pp.preprocess(source)),
+                         ['second_version'])
+
+    def test_macros_dont_leak_between_files(self):
+        first = self._write('first.c', '#define LEAK 1\nint first;\n')
+        second = self._write('second.c',
+                             '#ifdef LEAK\nint leaked;\n#endif\nint x;\n')
+        pp = CPreprocessor()
+        pp.preprocess(first)
+        self.assertEqual(self._names(pp.preprocess(second)), ['x'])
+
+    def test_bad_args(self):
+        self.assertRaises(ValueError, CPreprocessor, '-nostdinc')
+        self.assertRaises(ValueError, CPreprocessor, ['-I'])
+
+    def test_missing_file(self):
+        self.assertRaises(IOError, CPreprocessor().preprocess,
+                          os.path.join(self.tmpdir, 'missing.c'))
+
+    def test_missing_include(self):
+        self._write('header.h', 'int a;\n#include "missing.h"\n')
+        source = self._write('main.c', '\n#include "header.h"\n')
+        with self.assertRaises(RuntimeError) as cm:
+            CPreprocessor().preprocess(source)
+        self.assertTrue("header.h:2: Couldn't find 'missing.h'"
+                        in str(cm.exception))
+
+        # Like a cpp failure, it's the result of that one file.
+        results = list(parse_files([source], use_cpp=True,
+                                   preprocessor=CPreprocessor()))
+        self.assertTrue(isinstance(results[0][1], RuntimeError))
+
+        pp = cpp.Preprocessor(lex.lex(module=cpp))
+        pp.parse('int a;\n#include <missing.h>\n', 'main.c')
+        with self.assertRaises(RuntimeError) as cm:
+            list(iter(pp.token, None))
+        self.assertTrue("main.c:2: Couldn't find 'missing.h'"
+                        in str(cm.exception))
+
+    def test_parse_file(self):
+        self._write('header.h', 'typedef int T;\n')
+        source = self._write('main.c', '#include "header.h"\nT x;\n')
+        pp = CPreprocessor()
+        ast = parse_file(source, use_cpp=True, preprocessor=pp)
+        self.assertTrue(isinstance(ast, c_ast.FileAST))
+
+        results = list(parse_files([source, source], use_cpp=True,
+                                   preprocessor=pp, jobs=2))
+        for name, result in results:
+            self.assertEqual(result.ext[1].name, 'x')
+
+    def test_conditionals_cached_per_macro_values(self):
+        self._write('header.h', '\n'.join([
+            '#define INDIRECT LEVEL',
+            '#if INDIRECT > 1 && defined(FEATURE)',
+            'int high;',
+            '#else',
+            'int low;',
+            '#endif',
+            '']))
+        source = self._write('main.c', '#include "header.h"\n')
+        runs = [(['-DLEVEL=2', '-DFEATURE'], ['high']),
+                (['-DLEVEL=2'], ['low']),
+                (['-DLEVEL=0', '-DFEATURE'], ['low']),
+                (['-DLEVEL=2', '-DFEATURE'], ['high'])]
+        pp = CPreprocessor()
+        for args, names in runs:
+            pp.defines = CPreprocessor(args).defines
+            self.assertEqual(self._names(pp.preprocess(source)), names)
+        self.assertEqual(len(pp._expressions), 3)
+
+    def test_line_not_cached(self):
+        self._write('header.h', '#if __LINE__ == 2\nint two;\n#endif\n')
+        source = self._write('main.c',
+                             '#include "header.h"\n#include "header.h"\n')
+        self.assertEqual(self._names(CPreprocessor().preprocess(source)), [])
+
+
+class TestEvaluate(unittest.TestCase):
+    def test_arithmetic(self):
+        for expr, value in [('1 + 2 * 3', 7),
+                            ('(1 + 2) * 3', 9),
+                            ('-7 / 2', -3),
+                            ('-7 % 2', -1),
+                            ('1 << 4 >> 2', 4),
+                            ('6 & 3 | 8 ^ 1', 11),
+                            ('~0', -1),
+                            ('!0 + !5', 1),
+                            ('1 < 2 == 2 > 1', 1),
+                            ('3 <= 2 || 4 >= 4', 1),
+                            ('0x10 + 010 + 10', 34),
+                            ('1 ? 2 : 3', 2),
+                            ('0 ? 2 : 1 ? 3 : 4', 3),
+                            ('(1, 2)', 2),
+                            ('UNKNOWN + 1', 1),
+                            ("'a'", 97),
+                            ("'\\n' + '\\x41' + '\\0'", 75),
+                            ("'\\377'", -1),
+                            ('1LL + 2ull + 3L', 6)]:
+            self.assertEqual(evaluate(expr), value, expr)
+
+    def test_unsigned(self):
+        self.assertEqual(evaluate('-1 < 0'), 1)
+        self.assertEqual(evaluate('-1 < 0u'), 0)
+        self.assertEqual(evaluate('0xFFFFFFFFFFFFFFFF == -1'), 1)
+        self.assertEqual(evaluate('0u - 1'), 2 ** 64 - 1)
+        self.assertEqual(evaluate('9223372036854775807 + 1'),
+                         -9223372036854775808)
+
+    def test_short_circuit(self):
+        self.assertEqual(evaluate('0 && 1 / 0'), 0)
+        self.assertEqual(evaluate('1 || 1 % 0'), 1)
+        self.assertEqual(evaluate('1 ? 2 : 1 / 0'), 2)
+        self.assertRaises(ExpressionError, evaluate, '1 && 1 / 0')
+
+    def test_errors(self):
+        for expr in ['', '1 +', '(1', '1 2', '1 ? 2', '09', '1.5',
+                     "__import__('os').getcwd()"]:
+            self.assertRaises(ExpressionError, evaluate, expr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, '.')
+from pycparser import preprocess_file, parse_file, c_ast
+from pycparser import cppcache
+from pycparser.cppcache import PreprocessCache, included_files
+
+CPPPATH = 'cpp'
+
+
+class TestIncludedFiles(unittest.TestCase):
+    def test_linemarkers(self):
+        text = '\n'.join([
+            '# 1 "main.c"',
+            '# 1 "<built-in>"',
+            '# 1 "dir/a.h" 1 3 4',
+            'int a;',
+            '#line 7 "weird \\"name\\".h"',
+            '# 2 "main.c" 2',
+            'int b;'])
+        self.assertEqual(included_files(text),
+                         ['main.c', 'dir/a.h', 'weird "name".h'])
+
+
+class TestPreprocessCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = PreprocessCache(os.path.join(self.tmpdir, 'cache'))
+        self.header = self._write('header.h', 'typedef int T;\n')
+        self.source = self._write('main.c', '#include "header.h"\nT x;\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, text):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def _key(self):
+        return self.cache.key(self.source, CPPPATH, [])
+
+    def test_hit(self):
+        text = preprocess_file(self.source, CPPPATH, cache=self.cache)
+        self.assertEqual(self.cache.get(self._key()), text)
+        self.assertEqual(preprocess_file(self.source, CPPPATH,
+                                         cache=self.cache), text)
+
+    def test_source_changed(self):
+        preprocess_file(self.source, CPPPATH, cache=self.cache)
+        self._write('main.c', '#include "header.h"\nT y;\n')
+        self.assertEqual(self.cache.get(self._key()), None)
+        text = preprocess_file(self.source, CPPPATH, cache=self.cache)
+        self.assertTrue('T y;' in text)
+
+    def test_header_changed(self):
+        preprocess_file(self.source, CPPPATH, cache=self.cache)
+        self._write('header.h', 'typedef long T;\n')
+        self.assertEqual(self.cache.get(self._key()), None)
+        text = preprocess_file(self.source, CPPPATH, cache=self.cache)
+        self.assertTrue('typedef long T;' in text)
+
+    def test_args_in_key(self):
+        self.assertNotEqual(self.cache.key(self.source, CPPPATH, []),
+                            self.cache.key(self.source, CPPPATH, ['-DX']))
+
+    def test_eviction(self):
+        sources = [self._write('f%d.c' % i, 'int x%d;\n' % i)
+                   for i in range(4)]
+        for source in sources:
+            preprocess_file(source, CPPPATH, cache=self.cache)
+        size = max(os.path.getsize(os.path.join(self.cache.directory, name))
+                   for name in os.listdir(self.cache.directory))
+
+        # Make the first entry the most recently used one.
+        first = self.cache.key(sources[0], CPPPATH, [])
+        os.utime(self.cache._path(first), None)
+        for i, source in enumerate(sources[1:]):
+            key = self.cache.key(source, CPPPATH, [])
+            os.utime(self.cache._path(key), (i, i))
+
+        self.cache.max_size = size * 2
+        self.cache.evict()
+        self.assertEqual(len(os.listdir(self.cache.directory)), 2)
+        self.assertTrue(self.cache.get(first) is not None)
+
+    def test_eviction_counted(self):
+        sources = [self._write('f%d.c' % i, 'int x%d;\n' % i)
+                   for i in range(8)]
+        listed = []
+        listdir = os.listdir
+
+        def counting_listdir(path):
+            listed.append(path)
+            return listdir(path)
+
+        preprocess_file(sources[0], CPPPATH, cache=self.cache)
+        size = os.path.getsize(
+            self.cache._path(self.cache.key(sources[0], CPPPATH, [])))
+        # Entries differ by a few bytes with the digits of their mtimes.
+        self.cache.max_size = size * 5 + size // 2
+        cppcache.os.listdir = counting_listdir
+        try:
+            # Puts that keep the entries under max_size don't count them.
+            for source in sources[1:5]:
+                preprocess_file(source, CPPPATH, cache=self.cache)
+            self.assertEqual(listed, [])
+            self.assertEqual(len(listdir(self.cache.directory)), 5)
+
+            # The one that crosses it evicts down to three quarters.
+            preprocess_file(sources[5], CPPPATH, cache=self.cache)
+            self.assertEqual(len(listed), 1)
+            self.assertEqual(len(listdir(self.cache.directory)), 4)
+            preprocess_file(sources[6], CPPPATH, cache=self.cache)
+            self.assertEqual(len(listed), 1)
+        finally:
+            cppcache.os.listdir = listdir
+
+    def test_stale_tmp(self):
+        stale = os.path.join(self.cache.directory, '.tmpstale')
+        fresh = os.path.join(self.cache.directory, '.tmpfresh')
+        for path in stale, fresh:
+            with open(path, 'w') as f:
+                f.write('{"files": [], "te')
+        old = time.time() - cppcache.STALE_TMP_AGE - 10
+        os.utime(stale, (old, old))
+
+        preprocess_file(self.source, CPPPATH, cache=self.cache)
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+        self.assertTrue(self.cache.get(self._key()) is not None)
+
+    def test_cpp_error(self):
+        missing = os.path.join(self.tmpdir, 'missing.c')
+        with self.assertRaises(RuntimeError):
+            preprocess_file(missing, CPPPATH, cache=self.cache)
+
+        bad = self._write('bad.c', '#include "nonexistent.h"\nint x;\n')
+        for i in range(2):
+            with self.assertRaises(RuntimeError):
+                preprocess_file(bad, CPPPATH, cache=self.cache)
+        self.assertEqual(os.listdir(self.cache.directory), [])
+
+    def test_parse_file(self):
+        ast = parse_file(self.source, use_cpp=True, cpp_path=CPPPATH,
+                         cpp_cache=self.cache)
+        self.assertTrue(isinstance(ast, c_ast.FileAST))
+        ast = parse_file(self.source, use_cpp=True, cpp_path=CPPPATH,
+                         cpp_cache=self.cache)
+        self.assertEqual(ast.ext[1].name, 'x')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,11 @@
 import sys, os
+import shutil
+import tempfile
 import unittest
 
 sys.path.insert(0, '..')
-from pycparser import parse_file, c_ast
+from pycparser import parse_file, parse_files, c_ast, c_parser
+from pycparser.plyparser import ParseError
 
 CPPPATH = 'cpp'
 
@@ -49,11 +52,161 @@ class TestParsing(unittest.TestCase):
             cpp_path=CPPPATH, cpp_args='-I%s' % c_files_path)
         self.assertTrue(isinstance(ast, c_ast.FileAST))
 
+    def test_cpp_error(self):
+        missing = os.path.join(os.path.dirname(__file__), 'c_files',
+                               'missing.c')
+        with self.assertRaises(RuntimeError):
+            parse_file(missing, use_cpp=True, cpp_path=CPPPATH)
+
     def test_no_real_content_after_cpp(self):
         ast = parse_file(self._find_file('empty.h'), use_cpp=True,
             cpp_path=CPPPATH)
         self.assertTrue(isinstance(ast, c_ast.FileAST))
 
 
+class TestParseFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.typedef = self._write('typedef.c', 'typedef int T; T x;')
+        self.broken = self._write('broken.c', 'int f( {')
+        # Only valid if T isn't a typedef left over from typedef.c.
+        self.plain = self._write('plain.c', 'int T; int f(void) { return T; }')
+        self.missing = os.path.join(self.tmpdir, 'missing.c')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, text):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def _check(self, results):
+        names = [name for name, result in results]
+        self.assertEqual(names, [self.typedef, self.broken, self.missing,
+                                 self.plain])
+
+        results = dict(results)
+        self.assertTrue(isinstance(results[self.typedef], c_ast.FileAST))
+        self.assertTrue(isinstance(results[self.broken], ParseError))
+        self.assertTrue(isinstance(results[self.missing], IOError))
+        self.assertTrue(isinstance(results[self.plain], c_ast.FileAST))
+        self.assertEqual(results[self.plain].ext[1].coord.file, self.plain)
+
+    def test_in_process(self):
+        files = [self.typedef, self.broken, self.missing, self.plain]
+        self._check(list(parse_files(files)))
+
+    def test_given_parser(self):
+        files = [self.typedef, self.broken, self.missing, self.plain]
+        parser = c_parser.CParser()
+        self._check(list(parse_files(files, parser=parser)))
+
+    def test_workers(self):
+        files = [self.typedef, self.broken, self.missing, self.plain]
+        self._check(list(parse_files(files, jobs=2)))
+
+    def test_workers_deep_file(self):
+        # The AST of deep.c is too deeply nested to pickle back from a
+        # worker; it's parsed in this process, and the files after it
+        # are still reported.
+        deep = self._write('deep.c',
+                           'int x = %s;' % ' + '.join(['1'] * 3000))
+        files = [self.plain, deep, self.plain]
+        for args in ({}, {'use_cpp': True, 'cpp_path': CPPPATH,
+                          'cpp_jobs': 2}):
+            results = list(parse_files(files, jobs=2, **args))
+            self.assertEqual([name for name, result in results], files)
+            for name, result in results:
+                self.assertTrue(isinstance(result, c_ast.FileAST))
+            self.assertEqual(results[1][1].ext[0].name, 'x')
+
+    def test_workers_backpressure(self):
+        taken = []
+        def filenames():
+            for i in range(20):
+                taken.append(i)
+                yield self.plain
+
+        results = parse_files(filenames(), jobs=2)
+        next(results)
+        self.assertEqual(len(taken), 4)
+        self.assertEqual(len(list(results)), 19)
+
+    def test_error_in_line_directive(self):
+        bad = self._write('line.c', '# 12 "x.c" garbage $\nint f( {')
+        parser = c_parser.CParser()
+        results = list(parse_files([bad, self.plain], parser=parser))
+        self.assertTrue(isinstance(results[0][1], ParseError))
+        self.assertEqual(results[1][1].ext[0].coord.line, 1)
+
+    def _check_cpp(self, results):
+        names = [name for name, result in results]
+        self.assertEqual(names, [self.typedef, self.broken, self.plain])
+
+        results = dict(results)
+        self.assertTrue(isinstance(results[self.typedef], c_ast.FileAST))
+        self.assertTrue(isinstance(results[self.broken], ParseError))
+        self.assertTrue(isinstance(results[self.plain], c_ast.FileAST))
+        self.assertEqual(results[self.plain].ext[1].coord.file, self.plain)
+
+    def test_cpp_error(self):
+        results = list(parse_files([self.missing, self.plain], use_cpp=True,
+                                   cpp_path=CPPPATH))
+        self.assertTrue(isinstance(results[0][1], RuntimeError))
+        self.assertTrue(isinstance(results[1][1], c_ast.FileAST))
+
+    def test_cpp_jobs(self):
+        files = [self.typedef, self.broken, self.plain]
+        self._check_cpp(list(parse_files(files, use_cpp=True,
+                                         cpp_path=CPPPATH, cpp_jobs=2)))
+
+    def test_cpp_jobs_workers(self):
+        files = [self.typedef, self.broken, self.plain]
+        self._check_cpp(list(parse_files(files, use_cpp=True,
+                                         cpp_path=CPPPATH, cpp_jobs=2,
+                                         jobs=2)))
+
+    def test_cpp_jobs_cpp_error(self):
+        files = [self.typedef, self.missing, self.plain]
+        for jobs in (1, 2):
+            results = list(parse_files(files, use_cpp=True, cpp_path=CPPPATH,
+                                       cpp_jobs=2, jobs=jobs))
+            self.assertEqual([name for name, result in results], files)
+            self.assertTrue(isinstance(results[0][1], c_ast.FileAST))
+            self.assertTrue(isinstance(results[1][1], RuntimeError))
+            self.assertTrue(isinstance(results[2][1], c_ast.FileAST))
+
+    def test_cpp_jobs_undecodable(self):
+        # Errors other than cpp's are raised, as they are without threads.
+        path = os.path.join(self.tmpdir, 'undecodable.c')
+        with open(path, 'wb') as f:
+            f.write(b'\xff\xfe')
+        for cpp_jobs in (1, 2):
+            with self.assertRaises(UnicodeDecodeError):
+                list(parse_files([self.plain, path], use_cpp=True,
+                                 cpp_path=CPPPATH, cpp_jobs=cpp_jobs))
+
+    def test_cpp_jobs_bad_cpp(self):
+        results = list(parse_files([self.plain], use_cpp=True,
+                                   cpp_path=os.path.join(self.tmpdir, 'nocpp'),
+                                   cpp_jobs=2))
+        self.assertTrue(isinstance(results[0][1], RuntimeError))
+
+    def test_cpp_jobs_backpressure(self):
+        taken = []
+        def filenames():
+            for i in range(20):
+                taken.append(i)
+                yield self.plain
+
+        results = parse_files(filenames(), use_cpp=True, cpp_path=CPPPATH,
+                              cpp_jobs=2)
+        next(results)
+        self.assertEqual(len(taken), 4)
+        self.assertEqual(len(list(results)), 19)
+
+
 if __name__ == '__main__':
     unittest.main()
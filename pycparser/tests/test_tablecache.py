@@ -0,0 +1,122 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, '.')
+from pycparser import c_parser, tablecache
+
+
+class TestTableCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _cached(self, prefix):
+        return [name for name in os.listdir(self.tmpdir)
+                    if name.startswith(prefix)]
+
+    def _assert_parses(self, parser):
+        ast = parser.parse('typedef int T; T f(void) { return 0; }')
+        self.assertEqual(ast.ext[1].decl.name, 'f')
+
+    def test_default_writes_nothing(self):
+        old = os.environ.get('PYCPARSER_CACHE_DIR')
+        os.environ['PYCPARSER_CACHE_DIR'] = self.tmpdir
+        try:
+            self._assert_parses(c_parser.CParser())
+        finally:
+            if old is None:
+                del os.environ['PYCPARSER_CACHE_DIR']
+            else:
+                os.environ['PYCPARSER_CACHE_DIR'] = old
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_tables_are_cached(self):
+        self._assert_parses(c_parser.CParser(tabcache=self.tmpdir))
+        lextabs = self._cached('lextab_')
+        yacctabs = self._cached('yacctab_')
+        self.assertEqual(len(lextabs), 1)
+        self.assertEqual(len(yacctabs), 1)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)),
+                         sorted(lextabs + yacctabs))
+
+        mtimes = [os.path.getmtime(os.path.join(self.tmpdir, name))
+                    for name in lextabs + yacctabs]
+        self._assert_parses(c_parser.CParser(tabcache=self.tmpdir))
+        self.assertEqual(mtimes,
+                         [os.path.getmtime(os.path.join(self.tmpdir, name))
+                            for name in lextabs + yacctabs])
+
+    def test_broken_tables_are_regenerated(self):
+        c_parser.CParser(tabcache=self.tmpdir)
+        for name in os.listdir(self.tmpdir):
+            with open(os.path.join(self.tmpdir, name), 'w') as f:
+                f.write('garbage')
+
+        self._assert_parses(c_parser.CParser(tabcache=self.tmpdir))
+        self._assert_parses(c_parser.CParser(tabcache=self.tmpdir))
+
+    def test_disabled(self):
+        parser = c_parser.CParser(
+            lex_optimize=False,
+            yacc_optimize=False,
+            yacctab='yacctab',
+            tabcache=self.tmpdir)
+        self._assert_parses(parser)
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_cache_dir_from_environment(self):
+        path = os.path.join(self.tmpdir, 'nested', 'cache')
+        old = os.environ.get('PYCPARSER_CACHE_DIR')
+        os.environ['PYCPARSER_CACHE_DIR'] = path
+        try:
+            self.assertEqual(tablecache.cache_dir(), path)
+            self.assertTrue(os.path.isdir(path))
+        finally:
+            if old is None:
+                del os.environ['PYCPARSER_CACHE_DIR']
+            else:
+                os.environ['PYCPARSER_CACHE_DIR'] = old
+
+    def test_rules_hash(self):
+        class Rules(object):
+            t_A = r'a'
+            t_B = r'b'
+
+        class OtherRules(Rules):
+            t_B = r'bb'
+
+        self.assertEqual(tablecache.rules_hash(Rules, 't_'),
+                         tablecache.rules_hash(Rules(), 't_'))
+        self.assertNotEqual(tablecache.rules_hash(Rules, 't_'),
+                            tablecache.rules_hash(OtherRules, 't_'))
+        self.assertNotEqual(tablecache.rules_hash(Rules, 't_', ['x']),
+                            tablecache.rules_hash(Rules, 't_', ['y']))
+
+    def test_rules_hash_ignores_line_numbers(self):
+        def rules(source, blank_lines=0):
+            namespace = {}
+            exec('\n' * blank_lines + source, namespace)
+            return tablecache.rules_hash(namespace['Rules'], 't_')
+
+        source = '\n'.join([
+            'class Rules(object):',
+            '    def t_A(self, t):',
+            '        r"a"',
+            '    def t_B(self, t):',
+            '        r"b"'])
+        self.assertEqual(rules(source), rules(source, 10))
+        # The order of the functions decides which rule lexes first.
+        swapped = source.replace('t_A', 't_X').replace('t_B', 't_A')
+        self.assertNotEqual(rules(source),
+                            rules(swapped.replace('t_X', 't_B')))
+        self.assertNotEqual(rules(source),
+                            rules(source.replace('r"b"', 'r"bb"')))
+
+
+if __name__ == '__main__':
+    unittest.main()
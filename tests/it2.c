@@ -26,7 +26,7 @@ int main(void)
 int main(void)
 {
     int goto_mid = 0;
-    int switch_var_1 = 0;
+    int switch_var_0 = 0;
     int var;
 
     goto_mid = jump();
@@ -35,7 +35,7 @@ int main(void)
         switch_var_0 = var;
     } else switch_var_0 = 1;
 
-    switch (switch_var_1) {
+    switch (switch_var_0) {
         case 1:
             if (!goto_mid) {
                 foo();
@@ -0,0 +1,45 @@
+void foo(int);
+int jump();
+
+int main(void)
+{
+    if (jump()) {
+        foo(1);
+        if (jump()) goto end;
+        foo(2);
+        if (jump()) goto end;
+        foo(3);
+    }
+    foo(4);
+
+end:
+    return 0;
+}
+
+/* solution:
+
+int main(void)
+{
+    int goto_end = 0;
+
+    if (jump()) {
+        foo(1);
+        goto_end = jump();
+        if (!goto_end) {
+            foo(2);
+            goto_end = jump();
+            if (!goto_end) {
+                foo(3);
+            }
+        }
+    }
+
+    if (!goto_end) {
+        foo(4);
+    }
+
+end:
+    goto_end = 0;
+    return 0;
+}
+*/
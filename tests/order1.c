@@ -0,0 +1,48 @@
+void foo();
+int jump();
+
+int main(void)
+{
+    if (jump()) goto end;
+    foo();
+    if (jump()) goto middle;
+    foo();
+    if (jump()) goto end;
+    foo();
+
+middle:
+    foo();
+
+end:
+    return 0;
+}
+
+/* solution:
+
+int main(void)
+{
+    int goto_middle = 0;
+    int goto_end = 0;
+
+    if (!jump()) {
+        foo();
+        if (!jump()) {
+            foo();
+            goto_end = jump();
+            if (!goto_end) {
+                foo();
+            }
+        }
+
+        if (!goto_end) {
+middle:
+            goto_middle = 0;
+            foo();
+        }
+    }
+
+end:
+    goto_end = 0;
+    return 0;
+}
+*/
@@ -24,6 +24,7 @@ start:
     1;
 
     do {
+        goto_start = 0;
         for (int i = 0; i < 10; ++i) {
             goto_start = jump();
             if (goto_start) break;
@@ -22,6 +22,7 @@ start:
     goto_start = 0;
 
     do {
+        goto_start = 0;
         foo();
 
         if (1) {
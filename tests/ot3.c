@@ -26,6 +26,7 @@ start:
     goto_start = 0;
 
     do {
+        goto_start = 0;
         foo();
         switch (1) {
             case 0:
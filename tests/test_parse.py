@@ -0,0 +1,669 @@
+"""Tests for the goto elimination in parse.py.
+
+ParentMap, IndexedBlock and Positions have to give the statement each
+statement really sits in, the order of the statements of a block, and the
+offset and level of each goto and label, after the transformations move them
+around, without walking the function again. The
+functions the elimination gives are compiled and run next to the originals
+when gcc is installed, and have to do the same thing.
+"""
+import io
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[0:0] = [ROOT, os.path.join(ROOT, "pycparser"),
+                 os.path.join(ROOT, "bench")]
+
+import parse
+import synth
+from pycparser import c_generator, c_parser
+from pycparser.c_preprocessor import CPreprocessor
+from pycparser.plyparser import Coord
+from pycparser.c_ast import Compound, Decl, FuncCall, If
+
+def parse_text(text, filename="<test>"):
+    return c_parser.CParser().parse(text, filename)
+
+def check_parents(test, parents, node):
+    """Assert that `parents` gives the statement each statement under `node`
+    really sits in. Only the fields in STATEMENT_FIELDS are kept up to date."""
+    for field in parse.STATEMENT_FIELDS.get(type(node), []):
+        children = getattr(node, field)
+        if children is None:
+            continue
+        if not isinstance(children, list):
+            children = [children]
+        for child in children:
+            test.assertIs(parents.parent(child), node)
+            check_parents(test, parents, child)
+
+class TestParentMap(unittest.TestCase):
+    CODE = """
+    void foo();
+    int jump();
+    int main(void)
+    {
+        int a;
+        foo();
+        if (a) {
+            foo();
+            if (jump()) goto end;
+            foo();
+        }
+        foo();
+    end:
+        return 0;
+    }
+    """
+
+    def setUp(self):
+        self.function = parse.get_function(parse_text(self.CODE), "main")
+        self.finder = parse.GotoLabelFinder()
+        self.finder.visit(self.function)
+        self.parents = self.finder.parent_map
+        self.blocks = parse.BlockIndex()
+        self.prologue = parse.Prologue()
+        parse.logic_init(self.parents, self.blocks, self.prologue,
+                         self.finder.labels)
+
+    def test_lookups(self):
+        conditional = self.finder.gotos[0]
+        outer = self.function.body.block_items[2]
+        self.assertIs(self.parents.parent(conditional), outer.iftrue)
+        self.assertEqual(self.parents.lineage(conditional, 2),
+                         [outer, outer.iftrue])
+        self.assertTrue(self.parents.is_ancestor(self.function, conditional))
+        self.assertFalse(self.parents.is_ancestor(conditional, outer))
+
+    def test_after_moves(self):
+        conditional = self.finder.gotos[0]
+        label = self.finder.labels[0]
+        positions = self.finder.positions
+        level = positions.level(conditional.iftrue)
+
+        parse.move_goto_out_if(self.parents, self.blocks, positions,
+                               conditional)
+        self.blocks.flush()
+        check_parents(self, self.parents, self.function)
+        self.assertIs(self.parents.parent(conditional), self.function.body)
+        self.assertEqual(positions.level(conditional.iftrue), level - 1)
+        self.assertTrue(parse.are_siblings(self.parents, label, conditional))
+
+        wrapper = parse.remove_siblings(self.parents, self.blocks, positions,
+                                        label, conditional)
+        self.blocks.flush()
+        check_parents(self, self.parents, self.function)
+        self.assertIs(type(wrapper), If)
+        self.assertIs(self.parents.parent(wrapper), self.function.body)
+
+class TestIndexedBlock(unittest.TestCase):
+    def check_order(self, block, nodes):
+        self.assertEqual(block.to_list(), nodes)
+        keys = [block.key(node) for node in nodes]
+        self.assertEqual(keys, sorted(set(keys)))
+
+    def test_renumbers_when_keys_run_out(self):
+        first, last = object(), object()
+        block = parse.IndexedBlock([first, last])
+        self.assertEqual(block.key(last) - block.key(first),
+                         parse.IndexedBlock.GAP)
+
+        # Each insert right after the first statement halves the room left,
+        # so the block has to be renumbered partway through.
+        added = []
+        for i in range(40):
+            node = object()
+            block.insert_after(first, node)
+            added.insert(0, node)
+            self.check_order(block, [first] + added + [last])
+        self.assertNotEqual(block.key(last) - block.key(first),
+                            parse.IndexedBlock.GAP)
+        self.assertTrue(block.precedes(added[0], added[-1]))
+
+    def test_splicing(self):
+        nodes = [object() for i in range(6)]
+        block = parse.IndexedBlock(nodes)
+
+        cut = block.cut_between(nodes[0], nodes[4])
+        self.assertEqual(cut, nodes[1:4])
+        self.check_order(block, [nodes[0], nodes[4], nodes[5]])
+
+        new = object()
+        block.replace(nodes[4], new)
+        self.assertFalse(nodes[4] in block)
+        self.check_order(block, [nodes[0], new, nodes[5]])
+
+        block.remove(nodes[0])
+        block.insert_before(None, nodes[0])
+        self.check_order(block, [new, nodes[5], nodes[0]])
+        self.assertEqual(list(block.between(new, nodes[0])), [nodes[5]])
+
+class TestPrologue(unittest.TestCase):
+    CODE = """
+    void foo(int);
+    int jump();
+    int main(void)
+    {
+        int x;
+        if (jump()) goto first;
+        foo(1);
+        if (jump()) goto second;
+        switch (x) {
+        case 1:
+            foo(2);
+        second:
+            foo(3);
+            break;
+        }
+    first:
+        foo(4);
+        return 0;
+    }
+    """
+
+    def test_declarations(self):
+        function = parse.get_function(parse_text(self.CODE), "main")
+        parse.do_it(function)
+        # The flags of the labels come first, in the order the labels appear,
+        # then the variables added by the moves.
+        names = [stmt.name for stmt in function.body.block_items
+                 if type(stmt) == Decl]
+        self.assertEqual(names, ["goto_second", "goto_first", "switch_var_0",
+                                 "x"])
+
+    def test_duplicates(self):
+        prologue = parse.Prologue()
+        parse.declare_logic_variable(prologue, "goto_a")
+        parse.declare_logic_variable(prologue, "goto_b")
+        parse.declare_logic_variable(prologue, "goto_a")
+        self.assertEqual(len(prologue), 2)
+
+        function = parse.get_function(parse_text("int main(void) { return 0; }"),
+                                      "main")
+        blocks = parse.BlockIndex()
+        prologue.emit(blocks, function)
+        blocks.flush()
+        self.assertEqual([stmt.name for stmt in function.body.block_items[:2]],
+                         ["goto_a", "goto_b"])
+        self.assertEqual(len(prologue), 0)
+
+class TestPositions(unittest.TestCase):
+    def test_wrap_and_move(self):
+        positions = parse.Positions()
+        guard = If(None, Compound([]), None)
+        goto, label, inner = object(), object(), FuncCall(None, None)
+        positions.add(goto, 0)
+        positions.add(label, 0)
+        positions.add(inner, 1)
+        self.assertEqual(positions.distance(goto, inner), 2)
+
+        positions.wrap(guard, guard.iftrue, goto, inner)
+        self.assertEqual(positions.level(goto), 0)
+        self.assertEqual(positions.level(label), 1)
+        self.assertEqual(positions.level(inner), 1)
+
+        positions.move_out(label, guard)
+        self.assertEqual(positions.level(label), 0)
+        self.assertTrue(positions.precedes(label, inner))
+
+        positions.move_in(label, guard)
+        self.assertEqual(positions.level(label), 1)
+        self.assertTrue(positions.precedes(goto, label))
+
+class RescanOrder(parse.NearestFirstOrder):
+    """NearestFirstOrder that checks every pair it hands out against the
+    cheapest of the pairs left, computed again from scratch."""
+
+    def __init__(self, positions, pairs):
+        parse.NearestFirstOrder.__init__(self, positions, pairs)
+        self.picks = 0
+
+    def pop(self):
+        cheapest = min(self.pending, key=self.cost)
+        pair = parse.NearestFirstOrder.pop(self)
+        assert pair is self.pairs[cheapest]
+        self.picks += 1
+        return pair
+
+class TestOrder(unittest.TestCase):
+    def eliminate_rescanning(self, function, log=None):
+        """Run do_it on `function` with a RescanOrder and return it."""
+        orders = []
+        def order(positions, pairs):
+            orders.append(RescanOrder(positions, pairs))
+            return orders[-1]
+
+        parse.ORDERS["rescan"] = order
+        try:
+            parse.do_it(function, log, "rescan")
+        finally:
+            del parse.ORDERS["rescan"]
+
+        return orders[0]
+
+    def test_heap_matches_rescan(self):
+        for seed in range(10):
+            code = synth.generate_file(gotos=30, depth=4, length=200,
+                                       seed=seed)
+            function = parse.get_function(parse_text(code), "f0")
+            self.assertEqual(self.eliminate_rescanning(function).picks, 30)
+
+    def test_deepened_pair(self):
+        # `c` and `b` are as far apart, and `c` comes first, but eliminating
+        # `first` nests the goto to `b` in a guard, so `b` has to go next.
+        code = """
+        void foo(); int jump();
+        int main(void)
+        {
+            int x;
+            if (jump()) goto c;
+            if (x) { foo(); }
+        m:  foo();
+        c:  foo();
+            if (jump()) goto first;
+            if (jump()) goto b;
+        first:
+            foo();
+            if (x) { foo(); }
+        b:  foo();
+            return 0;
+        }
+        """
+        log = parse.Plan("main")
+        self.eliminate_rescanning(parse.get_function(parse_text(code), "main"),
+                                  log)
+        self.assertEqual([step["label"] for step in log.steps
+                          if step["event"] == "siblings"],
+                         ["first", "b", "c"])
+
+    def test_nearest_first(self):
+        # Discovery order does `middle` first, which buries the second goto to
+        # `end` in its guard, so that has to be moved out again.
+        plans = {}
+        for order in parse.ORDERS:
+            ast = parse_text(CPreprocessor().preprocess(
+                os.path.join(HERE, "order1.c")))
+            plans[order] = parse.plan_summary(parse.get_function(ast, "main"),
+                                              order)
+
+        self.assertEqual(plans["discovery"]["outward_moves"], 2)
+        self.assertEqual(plans["nearest"]["outward_moves"], 1)
+        self.assertLess(plans["nearest"]["guards"],
+                        plans["discovery"]["guards"])
+
+class TestMergeGuards(unittest.TestCase):
+    FLAGS = set(["goto_a", "goto_b"])
+
+    def merge(self, body, labels_are_entries=False):
+        """Merge the guards in `body`, the statements of a function, and
+        return the number merged and the code of the function."""
+        code = "void foo(int); int jump(void);\nint main(void) {\n%s\n}" % body
+        function = parse.get_function(parse_text(code), "main")
+        merged = parse.merge_guards(function.body, self.FLAGS,
+                                    labels_are_entries)
+        return merged, c_generator.CGenerator().visit(function)
+
+    def assertMerged(self, body, expected, count=1, labels_are_entries=False):
+        merged, code = self.merge(body, labels_are_entries)
+        self.assertEqual(merged, count)
+        self.assertEqual(code, self.merge(expected)[1])
+
+    def test_shapes(self):
+        self.assertMerged("if (!goto_a) { foo(1); } if (!goto_a) { foo(2); }",
+                          "if (!goto_a) { foo(1); foo(2); }")
+        self.assertMerged("if (!goto_a) { foo(1); if (!goto_a) { foo(2); } "
+                          "foo(3); }",
+                          "if (!goto_a) { foo(1); foo(2); foo(3); }")
+        self.assertMerged("if (!goto_a) { if (!goto_b) { foo(1); } }",
+                          "if (!goto_a && !goto_b) { foo(1); }")
+
+    def test_kept_apart(self):
+        # The second guard would run after a statement that sets its flag.
+        body = ("if (!goto_a) { foo(1); goto_a = jump(); } "
+                "if (!goto_a) { foo(2); }")
+        self.assertEqual(self.merge(body)[0], 0)
+        # Different flags.
+        body = "if (!goto_a) { foo(1); } if (!goto_b) { foo(2); }"
+        self.assertEqual(self.merge(body)[0], 0)
+        # A declaration would go out of scope.
+        body = "if (!goto_a) { int y = 1; foo(y); } if (!goto_a) { foo(2); }"
+        self.assertEqual(self.merge(body)[0], 0)
+
+    def test_labels(self):
+        # A goto still in the function could jump to `in`, past the test of
+        # the second guard.
+        body = "if (!goto_a) { in: foo(1); } if (!goto_a) { foo(2); }"
+        self.assertEqual(self.merge(body, True)[0], 0)
+        self.assertMerged(body, "if (!goto_a) { in: foo(1); foo(2); }")
+
+    def test_solution(self):
+        # The solution in merge1.c is the code the elimination should give.
+        with open(os.path.join(HERE, "merge1.c")) as f:
+            source = f.read()
+        solution = re.search(r"/\* solution:(.*?)\*/", source, re.S).group(1)
+        declarations = source[:source.index("int main")]
+        expected = parse.get_function(parse_text(declarations + solution),
+                                      "main")
+
+        function = parse.get_function(parse_text(
+            CPreprocessor().preprocess(os.path.join(HERE, "merge1.c"))), "main")
+        log = parse.EventLog()
+        parse.do_it(function, log)
+        generator = c_generator.CGenerator()
+        self.assertEqual(generator.visit(function), generator.visit(expected))
+        self.assertGreater(log.summary()["merged_guards"], 0)
+
+class TestEventLog(unittest.TestCase):
+    CODE = """
+    void foo(int);
+    int jump();
+    int main(void)
+    {
+        if (jump()) {
+            foo(1);
+            if (jump()) goto end;
+            foo(2);
+        }
+        foo(3);
+    end:
+        foo(4);
+    unused:
+        return 0;
+    }
+    """
+
+    def test_events(self):
+        stream = io.StringIO()
+        log = parse.EventLog(stream)
+        parse.do_it(parse.get_function(parse_text(self.CODE), "main"), log)
+
+        events = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([(event["event"], event["label"]) for event in events],
+                         [("unused_label", "unused"), ("outward_if", "end"),
+                          ("siblings", "end"), ("function_done", None)])
+        self.assertTrue(all(event["function"] == "main" for event in events))
+        self.assertEqual(events[2]["wrapper"], "If")
+
+        summary = log.summary()
+        self.assertEqual(summary["functions"], 1)
+        self.assertEqual(summary["outward_moves"], 1)
+        self.assertEqual(summary["inward_moves"], 0)
+        self.assertEqual(summary["sibling_eliminations"], 1)
+        self.assertEqual(summary["unused_labels"], 1)
+        self.assertEqual(summary["flag_variables"], 2)
+        self.assertGreater(summary["statement_growth"], 1)
+
+    def test_silent(self):
+        log = parse.EventLog()
+        parse.do_it(parse.get_function(parse_text(self.CODE), "main"), log)
+        self.assertEqual(log.summary()["sibling_eliminations"], 1)
+
+class TestPlan(unittest.TestCase):
+    def test_matches_elimination(self):
+        function = parse.get_function(parse_text(TestEventLog.CODE), "main")
+        before = c_generator.CGenerator().visit(function)
+
+        plan = parse.plan_function(function)
+        self.assertEqual(c_generator.CGenerator().visit(function), before)
+        self.assertEqual([step["event"] for step in plan.steps],
+                         ["unused_label", "outward_if", "siblings"])
+
+        log = parse.EventLog()
+        parse.do_it(function, log)
+        summary = plan.summary()
+        for key, value in log.summary().items():
+            if key != "seconds":
+                self.assertEqual(summary[key], value, key)
+        self.assertEqual(summary["guards"], 2)
+        self.assertEqual(summary["do_while_loops"], 0)
+
+    def test_unsupported(self):
+        code = "int main(void) { a: goto a; }"
+        summary = parse.plan_summary(parse.get_function(parse_text(code),
+                                                        "main"))
+        self.assertEqual(summary["failures"], 1)
+        self.assertIn("unconditional", summary["error"])
+
+class TestDeepFunctions(unittest.TestCase):
+    """Functions nested deeper than the recursion limit, before or after the
+    elimination."""
+
+    def test_count_statements(self):
+        # Eliminating the gotos of this nests every statement after the first
+        # in one more guard than the one before.
+        gotos = 400
+        code = ["int jump(); void foo();", "int main(void) {", "int a;",
+                "if (a) {"]
+        code += ["if (jump()) goto end; foo();"] * gotos
+        code += ["}", "end: return 0;", "}"]
+        function = parse.get_function(parse_text("\n".join(code)), "main")
+        self.assertEqual(parse.count_statements(function), 2 + 2 * gotos + 1)
+
+        parse.do_it(function)
+        self.assertGreater(parse.count_statements(function), 2 * gotos)
+
+    ELSE_IF_CHAIN = "\n".join([
+        "int jump(); void foo(int);",
+        "int main(void) {", "int x;", "if (jump()) goto end;",
+        " else ".join("if (x == %d) foo(%d);" % (i, i) for i in range(3000)),
+        "end: return 0;", "}",
+        "int other(int y) { if (y) goto out; y++; out: return y; }"])
+
+    def test_plan_else_if_chain(self):
+        function = parse.get_function(parse_text(self.ELSE_IF_CHAIN), "main")
+        before = c_generator.CGenerator().visit(function)
+
+        summary = parse.plan_summary(function)
+        self.assertEqual(summary["failures"], 0)
+        self.assertEqual(summary["guards"], 1)
+        self.assertEqual(c_generator.CGenerator().visit(function), before)
+        # Copying a statement doesn't build the Coord of the original.
+        self.assertFalse(isinstance(function.body._coord, Coord))
+
+    def test_translation_unit_else_if_chain(self):
+        # main is too deep to be pickled for a worker, so it's eliminated in
+        # this process, and other still goes to a worker.
+        ast = parse_text(self.ELSE_IF_CHAIN)
+        self.assertEqual(parse.eliminate_translation_unit(ast, jobs=2), [])
+        expected = parse_text(self.ELSE_IF_CHAIN)
+        generator = c_generator.CGenerator()
+        for name in ["main", "other"]:
+            function = parse.get_function(expected, name)
+            parse.do_it(function)
+            self.assertEqual(generator.visit(parse.get_function(ast, name)),
+                             generator.visit(function))
+
+        plans = parse.plan_translation_unit(parse_text(self.ELSE_IF_CHAIN), 2)
+        self.assertEqual([plan["failures"] for plan in plans], [0, 0])
+
+class TestTranslationUnit(unittest.TestCase):
+    def test_functions(self):
+        path = os.path.join(HERE, "tu1.c")
+        ast = parse_text(CPreprocessor().preprocess(path), path)
+        log = parse.EventLog()
+        self.assertEqual(parse.eliminate_translation_unit(ast, 2, log), [])
+        self.assertEqual(log.functions, 2)
+        self.assertFalse(parse.has_goto(ast))
+
+        expected = parse_text(CPreprocessor().preprocess(path), path)
+        generator = c_generator.CGenerator()
+        for name in ["first", "second"]:
+            function = parse.get_function(expected, name)
+            parse.do_it(function)
+            self.assertEqual(generator.visit(parse.get_function(ast, name)),
+                             generator.visit(function))
+
+    def test_unexpected_error(self):
+        # Only unsupported code is supposed to fail, but if anything else goes
+        # wrong the function is reported and keeps its body.
+        code = "int jump(); int f(void) { if (jump()) goto a; a: return 0; }"
+        function = parse.get_function(parse_text(code), "f")
+        with mock.patch.object(parse, "do_it",
+                               side_effect=AssertionError("broken")):
+            result, error, log, events = parse.eliminate_function(function)
+            plan = parse.plan_summary(function)
+
+        self.assertIsNone(result)
+        self.assertEqual(error, "AssertionError: broken")
+        self.assertEqual(log.failures, 1)
+        self.assertEqual(plan["error"], "AssertionError: broken")
+
+# Runs every function in a file of synth.py functions, with jump() giving the
+# same answers and the same cut-off for each build, and prints every call and
+# what each function returned.
+HARNESS = r"""
+#include <setjmp.h>
+#include <stdio.h>
+
+static unsigned state;
+static long steps;
+static jmp_buf cut;
+
+static void step(void)
+{
+    if (++steps > 5000)
+        longjmp(cut, 1);
+}
+
+int jump(void)
+{
+    step();
+    state = state * 1103515245u + 12345u;
+    printf("jump %d\n", (state >> 16) % 3 == 0);
+    return (state >> 16) % 3 == 0;
+}
+
+void foo(int n)
+{
+    step();
+    printf("foo %d\n", n);
+}
+"""
+
+class TestBehaviour(unittest.TestCase):
+    """Compile functions before and after the elimination, and
+    check that they make the same calls and return the same values."""
+
+    SEEDS = range(40)
+
+    def setUp(self):
+        if shutil.which("gcc") is None:
+            self.skipTest("gcc is not installed")
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def trace(self, name, functions):
+        """Build the functions in `functions`, a list of (name, code) pairs,
+        with the harness and return what running them prints."""
+        calls = []
+        for i, (function, code) in enumerate(functions):
+            calls.append("state = %d; steps = 0;" % i)
+            calls.append('if (!setjmp(cut)) printf("%s %%d\\n", %s(%d)); '
+                         'else printf("cut\\n");' % (function, function, i))
+        source = os.path.join(self.directory, name + ".c")
+        with open(source, "w") as f:
+            f.write(HARNESS)
+            f.write("\n".join(code for function, code in functions))
+            f.write("\nint main(void)\n{\n%s\nreturn 0;\n}\n" %
+                    "\n".join(calls))
+
+        program = os.path.join(self.directory, name)
+        subprocess.check_call(["gcc", "-std=gnu99", "-w", "-fwrapv", "-o",
+                               program, source])
+        return subprocess.run([program], stdout=subprocess.PIPE, check=True,
+                              timeout=60).stdout.decode()
+
+    def eliminated(self, functions, order):
+        generator = c_generator.CGenerator()
+        result = []
+        for name, code in functions:
+            ast = c_parser.CParser().parse(code)
+            function = parse.get_function(ast, name)
+            parse.do_it(function, order=order)
+            result.append((name, generator.visit(function)))
+
+        return result
+
+    def synthetic(self, seed):
+        """Return the name and code of a synth.py function.
+
+        A goto into a for loop skips the declaration of its counter, which
+        then has no value in the original either, so the counters are
+        declared at the top of the function instead."""
+        name = "f{}".format(seed)
+        generator = synth.FunctionGenerator(
+            10, 3, {synth.LOOP: 1, synth.IF: 1, synth.SWITCH: 1}, 100,
+            random.Random(seed))
+        code = generator.generate(name)
+        counters = re.findall(r"for \(int (k\d+)", code)
+        if counters:
+            code = code.replace("for (int ", "for (")
+            code = code.replace("{\n", "{\n    int %s;\n" %
+                                ", ".join(k + " = 0" for k in counters), 1)
+
+        return name, "int jump(void); void foo(int);\n" + code
+
+    def test_synthetic(self):
+        functions = [self.synthetic(seed) for seed in self.SEEDS]
+        expected = self.trace("original", functions)
+        for order in sorted(parse.ORDERS):
+            self.assertEqual(self.trace(order,
+                                        self.eliminated(functions, order)),
+                             expected, order)
+
+    def check(self, code):
+        expected = self.trace("original", [("f", code)])
+        self.assertEqual(self.trace("nearest",
+                                    self.eliminated([("f", code)], "nearest")),
+                         expected)
+
+    def test_backward_goto_out_of_loop(self):
+        # The goto is moved out of the while loop. When the do-while around
+        # the label goes round again with x at 3, the while loop doesn't run,
+        # so its flag has to have been cleared by then.
+        code = """
+        int jump(void); void foo(int);
+        int f(int x)
+        {
+        again:
+            foo(x);
+            while (x < 3) {
+                x = x + 1;
+                if (jump()) goto again;
+            }
+            return x;
+        }
+        """
+        self.check(code)
+
+    def test_goto_into_for_loop(self):
+        # Jumping into the loop skips `k = 0`, so k is still 5.
+        code = """
+        int jump(void); void foo(int);
+        int f(int x)
+        {
+            int k = 5;
+            if (jump()) goto in;
+            foo(x);
+            for (k = 0; k < 3; ++k) {
+                foo(k);
+            in:
+                foo(-k);
+            }
+            return k;
+        }
+        """
+        self.check(code)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+void foo();
+int jump();
+
+int plain(int x)
+{
+    return x + 1;
+}
+
+int first(void)
+{
+    if (jump()) goto end;
+    foo();
+
+end:
+    return 0;
+}
+
+int second(void)
+{
+start:
+    foo();
+
+    while (1) {
+        if (jump()) goto start;
+    }
+    return 0;
+}
+
+/* solution (./parse.py --all tests/tu1.c):
+
+int plain(int x)
+{
+    return x + 1;
+}
+
+int first(void)
+{
+    int goto_end = 0;
+
+    if (!jump()) {
+        foo();
+    }
+
+end:
+    goto_end = 0;
+    return 0;
+}
+
+int second(void)
+{
+    int goto_start = 0;
+
+start:
+    goto_start = 0;
+
+    do {
+        goto_start = 0;
+        foo();
+
+        while (1) {
+            goto_start = jump();
+            if (goto_start) break;
+        }
+    } while (goto_start);
+    return 0;
+}
+*/